@@ -1,279 +1,279 @@
 # Script Created by Sayaka Miura #
 
 from Bio import Phylo
-from Bio.Phylo.Consensus import _BitString
+import numpy as np
 import pandas as pd
 import sys
 import os
 
-SNV = sys.argv[1]  # CloneFinder input Tree[:-19]+'.tsv'
-Tree = SNV[:-4] + "snv_CloneFinder.nwk"
-CloFre = Tree[:-4] + ".txt"
-SV = (
-    "NA"  # sys.argv[2]#Tree[:-28]+'.csv' #SV file should have the format as the example
-)
+from analysis.read_counts import load_read_counts
 
-OutTree = Tree[:-4] + "Tree.txt"
-OutSNV = Tree[:-4] + "SNV.txt"
-OutSV = Tree[:-4] + "SV.txt"
-OutClone = Tree[:-4] + "CloneID.txt"
-
-tree = Phylo.read(Tree, "newick")
 CloFreCut = 0
 MinVAF = 0.05
+MaxSVVAF = 0.6
+
+
+def make_snv_input(Counts):
+    Len = len(Counts)
+    out = {
+        "#chrom": pd.Series(Counts.chrom).str.replace("chr", "", regex=False),
+        "pos": Counts.position,
+        "desc": ["NA"] * Len,
+        "normal": [0] * Len,
+    }
+    alt = Counts.alt.astype(float)
+    Tot = alt + Counts.ref
+    with np.errstate(invalid="ignore", divide="ignore"):
+        VAF = np.where(Tot == 0, 0.0, alt / Tot)
+    for i, Samp in enumerate(Counts.samples):
+        out[Samp] = VAF[i]
+    return pd.DataFrame(out)
+
+
+def make_sv_input(SVta, SampLs):
+    Chrom = SVta["#CHROM"].astype(str)
+    SVta = SVta[
+        ~Chrom.str.contains("random|Y|X|Un", regex=True)
+    ].reset_index(drop=True)
+    Chrom = SVta["#CHROM"].astype(str)
+
+    ID = SVta["ID"].astype(str).str.split(":").str[0]
+    ALT = SVta["ALT"].astype(str)
+    REF = SVta["REF"].astype(str)
+    Partner = pd.Series(
+        [a.replace("[", "").replace("]", "").replace(r, "") for a, r in zip(ALT, REF)],
+        index=SVta.index,
+    )
+    Site = Chrom + ":" + SVta["POS"].astype(str)
+    RefLast = ALT.str[-1] == REF
+    RefFirst = ALT.str[0] == REF
+    bad = ~(RefLast | RefFirst)
+    if bad.any():
+        raise ValueError(
+            f"Unsupported SV ALT/REF pairs: {SVta.loc[bad, ['ALT', 'REF', 'ID']].values.tolist()}"
+        )
+    SV = pd.Series(
+        np.where(RefLast, Partner + "-" + Site, Site + "-" + Partner), index=SVta.index
+    )
+
+    SV2ID = pd.DataFrame({"ID": ID, "SV": SV})
+    shared = SV2ID.groupby("SV")["ID"].nunique()
+    if (shared > 1).any():
+        raise ValueError(f"SVs reported under more than one ID: {list(shared[shared > 1].index)}")
+
+    VAF = {}
+    Covered = {}
+    for Samp in SampLs:
+        Read = SVta[Samp].astype(str).str.split(":", expand=True)
+        Depth = Read[2].astype(float)
+        Covered[Samp] = Depth >= 1
+        VAF[Samp] = np.where(Covered[Samp], Read[5].astype(float) / Depth, 0.0)
+    VAF = pd.DataFrame(VAF, index=SVta.index)
 
-# make SNV input
-SNVta = pd.read_csv(SNV, sep="\t")
-print(SNVta)
-Chrom = []
-for i in SNVta["CHR"]:
-    Chrom.append(i.replace("chr", ""))
-Len = len(SNVta["CHR"])
-
-out = {
-    "#chrom": Chrom,
-    "pos": SNVta["Position"],
-    "desc": ["NA"] * Len,
-    "normal": [0] * Len,
-}
-ColLs = SNVta.columns
-SampLs = []
-for Col in ColLs:
-    if Col.find(":ref") != -1:
-        SampLs.append(Col.split(":")[0])
-for Samp in SampLs:
-    VAF = []
-    c = 0
-    while c < Len:
-        Tot = SNVta[Samp + ":alt"][c] + SNVta[Samp + ":ref"][c]
-        if Tot == 0:
-            VAF.append(0)
-        else:
-            VAF.append(
-                1.0
-                * SNVta[Samp + ":alt"][c]
-                / (SNVta[Samp + ":alt"][c] + SNVta[Samp + ":ref"][c])
-            )
-        c += 1
-    out[Samp] = VAF
-out = pd.DataFrame(out)
-out.to_csv(OutSNV, sep="\t", index=False)
-
-if os.path.exists(SV) == True:
-    SVta = pd.read_csv(SV, sep=",")
-    print(SVta)
-
-    ID2SV = {}
-    SV2ID = {}
-    ID2Samp = {}
-    Rmls = []
-    Len = len(SVta["Position"])
-    c = 0
-    while c < Len:
-        if (
-            SVta["#CHROM"][c].find("random") == -1
-            and SVta["#CHROM"][c].find("Y") == -1
-            and SVta["#CHROM"][c].find("X") == -1
-            and SVta["#CHROM"][c].find("Un") == -1
-        ):
-            ID = SVta["ID"][c].split(":")[0]
-            ALT = SVta["ALT"][c]
-            REF = SVta["REF"][c]
-            if ALT[-1] == REF:
-                SV = (
-                    ALT.replace("[", "").replace("]", "").replace(REF, "")
-                    + "-"
-                    + SVta["#CHROM"][c]
-                    + ":"
-                    + str(SVta["POS"][c])
-                )
-            elif ALT[0] == REF:
-                SV = (
-                    SVta["#CHROM"][c]
-                    + ":"
-                    + str(SVta["POS"][c])
-                    + "-"
-                    + ALT.replace("[", "").replace("]", "").replace(REF, "")
-                )
-            else:
-                print(ALT, REF, SVta["ID"][c])
-                open("a", "r").readlines()
-
-            if SV not in SV2ID:
-
-                SV2ID[SV] = ID
-                ID2SV[ID] = SV
-                ID2Samp[ID] = {}
-            if ID != SV2ID[SV]:
-
-                print(ID, SV, SV2ID[SV], ID2SV[ID])
-                open("a", "r").readlines()
-            for Samp in SampLs:
-                Read = SVta[Samp][c].split(":")
-                if float(Read[2]) < 1:
-                    VAF = 0  # Rmls.append(ID)
-                else:
-                    VAF = 1.0 * float(Read[5]) / float(Read[2])
-
-                    if ID2Samp[ID].get(Samp, VAF) != VAF:
-                        print(
-                            ID,
-                            SV,
-                            ID2SV[ID],
-                            Samp,
-                            VAF,
-                            ID2Samp[ID][Samp],
-                            SVta["ID"][c],
-                        )
-                        open("a", "r").readlines()
-                ID2Samp[ID][Samp] = VAF
-        c += 1
-    SVnum = len(ID2Samp.keys()) + 1
-    out = {"id": [], "SV": [], "Normal_GenomeCounts": []}
     for Samp in SampLs:
-        out[Samp + "_GenomeCounts"] = []
-
-    SVnum = 0
-    IDin = 1
-    for ID in ID2SV:
-        TotVAV = 0
-        Max = 0
-        for Samp in SampLs:
-            TotVAV += ID2Samp[ID][Samp]
-            if Max < ID2Samp[ID][Samp]:
-                Max = ID2Samp[ID][Samp]
-        if TotVAV > 0 and MinVAF < Max and Max < 0.6:
-            SVnum += 1
-            out["SV"].append(ID2SV[ID])
-            out["id"].append(IDin)
-            IDin += 1
-            for Samp in SampLs:
-                out[Samp + "_GenomeCounts"].append(ID2Samp[ID][Samp])
-            out["Normal_GenomeCounts"].append(0)
-        else:
-            print("bad SV", ID)
+        Observed = VAF.loc[Covered[Samp], Samp].groupby(ID[Covered[Samp]]).nunique()
+        if (Observed > 1).any():
+            raise ValueError(
+                f"Conflicting VAFs for {Samp} in SV IDs: {list(Observed[Observed > 1].index)}"
+            )
 
-    print("SV count", IDin)
-    out = pd.DataFrame(out)
-    out.to_csv(OutSV, sep="\t", index=False)
+    VAF["ID"] = ID
+    VAF["SV"] = SV
+    ByID = VAF.groupby("ID", sort=False).last()
+
+    Values = ByID[SampLs]
+    Max = Values.max(axis=1)
+    Keep = (Values.sum(axis=1) > 0) & (MinVAF < Max) & (Max < MaxSVVAF)
+    for BadID in ByID.index[~Keep]:
+        print("bad SV", BadID)
+    ByID = ByID[Keep]
+
+    out = {
+        "id": np.arange(1, len(ByID) + 1),
+        "SV": ByID["SV"].to_numpy(),
+        "Normal_GenomeCounts": [0] * len(ByID),
+    }
+    for Samp in SampLs:
+        out[Samp + "_GenomeCounts"] = ByID[Samp].to_numpy()
+    print("SV count", len(ByID) + 1)
+    return pd.DataFrame(out)
 
 
 def _bitstrs(tree):
-    bitstrs = set()
-    term_names = [term.name for term in tree.get_terminals()]
-    term_names.sort()
-    All = tree.get_terminals() + tree.get_nonterminals()
+    # Bit i (from the left) of a clade's bitstring marks the i-th tip in sorted
+    # order. Masks are built bottom-up in one pass, so no clade is rescanned.
+    term_names = sorted(term.name for term in tree.get_terminals())
+    Width = len(term_names)
+    Name2Mask = {name: 1 << (Width - 1 - i) for i, name in enumerate(term_names)}
+
+    Mask = {}
+    Terms = {}
+    Parent = {}
+    for clade in tree.find_clades(order="postorder"):
+        if clade.is_terminal():
+            Mask[id(clade)] = Name2Mask[clade.name]
+            Terms[id(clade)] = [clade]
+        else:
+            Mask[id(clade)] = 0
+            Terms[id(clade)] = []
+            for child in clade.clades:
+                Parent[id(child)] = clade
+                Mask[id(clade)] |= Mask[id(child)]
+                Terms[id(clade)].extend(Terms[id(child)])
+
+    def bits(clade):
+        return format(Mask[id(clade)], "0%db" % Width)
+
+    def ancestors(clade):
+        Chain = []
+        while id(clade) in Parent:
+            clade = Parent[id(clade)]
+            Chain.append(clade)
+        return Chain
+
     TipID2Bit = {}
     Bit2TipID = {}
     Clone2IntBit = {}
     Dec2AncBit = {}
-    for clade in All:  # tree.get_terminals():#.get_nonterminals():
-        clade_term_names = [term.name for term in clade.get_terminals()]
-        boolvals = [name in clade_term_names for name in term_names]
-        bitstr = "".join(map(str, map(int, boolvals)))
-        bitstrs.add(bitstr)
-        # print (clade.get_terminals(), bitstr)
-        if len(clade.get_terminals()) == 1:
-            TipID2Bit[clade.get_terminals()[0].name] = bitstr
-            IntLs = tree.trace(clade.get_terminals()[0].name, "Normal")
+
+    Tips = tree.get_terminals()
+    NormalTip = next(tip for tip in Tips if tip.name == "Normal")
+    NormalChain = [NormalTip] + ancestors(NormalTip)
+    NormalDepth = {id(clade): i for i, clade in enumerate(NormalChain)}
+
+    for clade in Tips + tree.get_nonterminals():
+        bitstr = bits(clade)
+        if len(Terms[id(clade)]) == 1:
+            TipID2Bit[clade.name] = bitstr
+            # Same clades as tree.trace(tip, "Normal")[:-2]: the tip's ancestors
+            # below its MRCA with Normal, then the MRCA and the path down to Normal.
+            Up = []
+            for Anc in [clade] + ancestors(clade):
+                if id(Anc) in NormalDepth:
+                    Mrca = Anc
+                    break
+                Up.append(Anc)
+            Down = NormalChain[: NormalDepth[id(Mrca)]][::-1]
+            IntLs = (Up[1:] + [Mrca] + Down)[:-2]
             IntBitLs = [bitstr]
-            for Int in IntLs[:-2]:
-                clade_term_names = [term.name for term in Int.get_terminals()]
-                boolvals = [name in clade_term_names for name in term_names]
-                Intbitstr = "".join(map(str, map(int, boolvals)))
+            for Int in IntLs:
+                Intbitstr = bits(Int)
                 Dec2AncBit[IntBitLs[-1]] = Intbitstr
                 IntBitLs.append(Intbitstr)
 
-            Clone2IntBit[clade.get_terminals()[0].name] = IntBitLs
+            Clone2IntBit[clade.name] = IntBitLs
 
-        Bit2TipID[bitstr] = clade.get_terminals()
+        Bit2TipID[bitstr] = Terms[id(clade)]
     return TipID2Bit, Bit2TipID, Clone2IntBit, Dec2AncBit
 
 
-TipID2Bit, Bit2TipID, Clone2IntBit, Dec2AncBit = _bitstrs(tree)
-CF = pd.read_csv(CloFre, sep="\t")
-
-CF = CF.set_index("Tumor").T
-CloLs = list(CF.index)
-CloC = len(CloLs)
-Samp2bitVAF = {}
-
-for Samp in SampLs:
+def make_tree_input(tree, CF, SampLs):
+    TipID2Bit, Bit2TipID, Clone2IntBit, Dec2AncBit = _bitstrs(tree)
 
-    Sub = pd.DataFrame({"Freq": CF[Samp]})
-    Sub = Sub.loc[(Sub > CloFreCut).any(axis=1)]
+    CF = CF.set_index("Tumor").T
+    Samp2bitVAF = {}
 
-    CloLs = list(Sub.index)
-    Len = len(CloLs)
-    Bit2VAF = {}
-    c = 0
-    while c < Len:
-        Clo = CloLs[c]
-        Fre = Sub["Freq"][c] / 2
-
-        BitLs = Clone2IntBit[Clo]
-        for B in BitLs:
-            Bit2VAF[B] = Bit2VAF.get(B, 0) + Fre
-        c += 1
-    Samp2bitVAF[Samp] = Bit2VAF
-
-BitLs = list(Bit2TipID)
-
-NorBit = TipID2Bit["Normal"]
+    for Samp in SampLs:
+        Freq = CF[Samp]
+        Freq = Freq[Freq > CloFreCut] / 2
+        Bit2VAF = {}
+        for Clo, Fre in Freq.items():
+            for B in Clone2IntBit[Clo]:
+                Bit2VAF[B] = Bit2VAF.get(B, 0) + Fre
+        Samp2bitVAF[Samp] = Bit2VAF
+
+    BitLs = list(Bit2TipID)
+
+    NorBit = TipID2Bit["Normal"]
+
+    Width = len(NorBit)
+    RootBit = "1" * Width
+    MRCAbit = format(int(RootBit, 2) & ~int(NorBit, 2), "0%db" % Width)
+
+    BitLs.remove(NorBit)
+    BitLs.remove(RootBit)
+
+    out = ["Nodes:\n"]
+    Bit2ID = {}
+    Nout = ["NodeID\tBit\tClade\n"]
+    for c, Bit in enumerate(BitLs, start=1):
+        VAFls = []
+        Bit2ID[Bit] = c
+        TipLs = [i.name for i in Bit2TipID[Bit]]
+        Nout.append("\t".join([str(c), str(Bit), ";".join(TipLs)]) + "\n")
+        Sbit = "0"
+        for S in SampLs:
+            VAF = Samp2bitVAF[S].get(Bit, 0)
+            if VAF > 0:
+                VAFls.append(VAF)
+                Sbit += "1"
+            else:
+                Sbit += "0"
 
-MRCAbit = str(int("1" * (CloC + 1)) - int(NorBit))
+        out.append(str(c) + "\t" + Sbit + "\t" + "[ " + " ".join(map(str, VAFls)) + "]\n")
 
-BitLs.remove(NorBit)
-BitLs.remove("1" * (CloC + 1))
+    out.append("\n****Tree 0****\n")
+    out.append("0 -> " + str(Bit2ID[MRCAbit]) + "\n")
 
-Len = len(BitLs)
+    for DecB in Dec2AncBit:
+        Anc = Dec2AncBit[DecB]
 
-out = ["Nodes:\n"]
+        out.append(str(Bit2ID[Anc]) + " -> " + str(Bit2ID[DecB]) + "\n")
+    out.append("Error score: 0.05\n\n")
+    out.append("Sample decomposition:\n")
+    out.append("\tSample lineage decomposition: normal\n")
 
-c = 1
-Bit2ID = {}
-Bit2Sbit = {}
-Nout = ["NodeID\tBit\tClade\n"]
-while c <= Len:
-    VAFls = []
-    Bit = BitLs[c - 1]
-    Bit2ID[Bit] = c
-    TipLs = []
-    for i in Bit2TipID[Bit]:
-        TipLs.append(i.name)
-    Nout.append("\t".join([str(c), str(Bit), ";".join(TipLs)]) + "\n")
-    Sbit = "0"
+    out.append("\n")
     for S in SampLs:
-        VAF = Samp2bitVAF[S].get(Bit, 0)
-        if VAF > 0:
-            VAFls.append(VAF)
-            Sbit += "1"
-        else:
-            Sbit += "0"
-    Bit2Sbit[Bit] = Sbit
-
-    out.append(str(c) + "\t" + Sbit + "\t" + "[ " + " ".join(map(str, VAFls)) + "]\n")
-    c += 1
-
-OutF = open(OutClone, "w")
-OutF.write("".join(Nout))
-OutF.close()
-
-out.append("\n****Tree 0****\n")
-out.append("0 -> " + str(Bit2ID[MRCAbit]) + "\n")
-
-for DecB in Dec2AncBit:
-    Anc = Dec2AncBit[DecB]
-
-    out.append(str(Bit2ID[Anc]) + " -> " + str(Bit2ID[DecB]) + "\n")
-out.append("Error score: 0.05\n\n")
-out.append("Sample decomposition:\n")
-out.append("\tSample lineage decomposition: normal\n")
-
-out.append("\n")
-for S in SampLs:
-    out.append("\tSample lineage decomposition: " + S + "\n\n")
-
-OutF = open(OutTree, "w")
-OutF.write("".join(out))
-OutF.close()
+        out.append("\tSample lineage decomposition: " + S + "\n\n")
+
+    return "".join(out), "".join(Nout)
+
+
+def clonefinder_to_meltos(
+    SNV,
+    Tree=None,
+    CloFre=None,
+    OutSNV=None,
+    OutTree=None,
+    OutClone=None,
+    SV=None,
+    OutSV=None,
+    target_dir=None,
+):
+    """Write the Meltos SNV, tree and (optionally) SV inputs for a CloneFinder run.
+
+    Paths that are not given default to the names the script has always used
+    next to the CloneFinder input file. With ``target_dir`` the read counts
+    come from its columnar cache instead of re-parsing ``SNV``.
+    """
+    Tree = Tree or SNV[:-4] + "snv_CloneFinder.nwk"
+    CloFre = CloFre or Tree[:-4] + ".txt"
+    OutTree = OutTree or Tree[:-4] + "Tree.txt"
+    OutSNV = OutSNV or Tree[:-4] + "SNV.txt"
+    OutSV = OutSV or Tree[:-4] + "SV.txt"
+    OutClone = OutClone or Tree[:-4] + "CloneID.txt"
+
+    # make SNV input
+    Counts = load_read_counts(SNV, target_dir)
+    SampLs = Counts.samples
+    make_snv_input(Counts).to_csv(OutSNV, sep="\t", index=False)
+
+    if SV is not None and os.path.exists(SV):
+        SVta = pd.read_csv(SV, sep=",")
+        make_sv_input(SVta, SampLs).to_csv(OutSV, sep="\t", index=False)
+
+    tree = Phylo.read(Tree, "newick")
+    CF = pd.read_csv(CloFre, sep="\t")
+    tree_text, clone_text = make_tree_input(tree, CF, SampLs)
+
+    with open(OutClone, "w") as OutF:
+        OutF.write(clone_text)
+    with open(OutTree, "w") as OutF:
+        OutF.write(tree_text)
+
+    return {"snv": OutSNV, "tree": OutTree, "clone": OutClone, "sv": OutSV}
+
+
+if __name__ == "__main__":
+    clonefinder_to_meltos(sys.argv[1])  # CloneFinder input Tree[:-19]+'.tsv'
@@ -0,0 +1,118 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+
+
+NORMAL = "Normal"
+
+_matrix_memo = {}
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+class CloneFrequencyMatrix:
+    """CloneFinder clone frequency table: one row per tumour, one column per clone.
+
+    Derived views (presence, thresholded presence, ``Normal``-augmented) are
+    computed with NumPy and cached on the object, so each is built once.
+    """
+
+    def __init__(self, tumors, clones, values, index_name="Tumor"):
+        self.tumors = list(tumors)
+        self.clones = list(clones)
+        self.values = np.asarray(values)
+        self.index_name = index_name
+        self._views = {}
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls(
+            frame.index.astype(str),
+            frame.columns.astype(str),
+            frame.to_numpy(),
+            frame.index.name or "Tumor",
+        )
+
+    def to_frame(self):
+        frame = pd.DataFrame(self.values, index=self.tumors, columns=self.clones)
+        frame.index.name = self.index_name
+        return frame
+
+    def _view(self, key, build):
+        if key not in self._views:
+            self._views[key] = build()
+        return self._views[key]
+
+    def presence(self, threshold=0):
+        """1 where a clone's frequency in a tumour is above ``threshold``, else 0."""
+        return self._view(
+            ("presence", threshold),
+            lambda: CloneFrequencyMatrix(
+                self.tumors,
+                self.clones,
+                (self.values > threshold).astype(np.int64),
+                self.index_name,
+            ),
+        )
+
+    def with_normal(self):
+        """The matrix with an all-zero ``Normal`` clone column appended if missing."""
+        if NORMAL in self.clones:
+            return self
+        return self._view(
+            "normal",
+            lambda: CloneFrequencyMatrix(
+                self.tumors,
+                self.clones + [NORMAL],
+                np.hstack([self.values, np.zeros((len(self.tumors), 1), dtype=self.values.dtype)]),
+                self.index_name,
+            ),
+        )
+
+    def transpose(self):
+        return self.to_frame().T
+
+    def write(self, path):
+        """Write the matrix as TSV unless ``path`` already holds exactly this content.
+
+        The written file is registered with ``load_clone_frequencies``, so
+        reading it back in this process returns this object.
+        """
+        buffer = io.StringIO()
+        self.to_frame().to_csv(buffer, sep="\t")
+        content = buffer.getvalue().encode()
+        unchanged = False
+        if os.path.exists(path) and os.path.getsize(path) == len(content):
+            with open(path, "rb") as file:
+                unchanged = file.read() == content
+        if unchanged:
+            print(f"{path} is up to date.")
+        else:
+            with open(path, "wb") as file:
+                file.write(content)
+        _matrix_memo[file_signature(path)] = self
+        return path
+
+
+def read_clone_frequencies(path):
+    frame = pd.read_csv(path, sep="\t", index_col=0)
+    return CloneFrequencyMatrix.from_frame(
+        frame.apply(pd.to_numeric, errors="coerce").fillna(0)
+    )
+
+
+def load_clone_frequencies(source):
+    """Return the matrix for ``source``, a path or an already loaded matrix.
+
+    Files are parsed once per process for a given size and modification time.
+    """
+    if isinstance(source, CloneFrequencyMatrix):
+        return source
+    signature = file_signature(source)
+    if signature not in _matrix_memo:
+        _matrix_memo[signature] = read_clone_frequencies(source)
+    return _matrix_memo[signature]
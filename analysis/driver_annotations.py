@@ -0,0 +1,165 @@
+import os
+import glob
+import pandas as pd
+
+from analysis.driver_index import DriverIndex, parse_positions
+
+
+_memo = {}
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def csv_dir_signature(directory):
+    return tuple(
+        file_signature(path)
+        for path in sorted(glob.glob(os.path.join(directory, "*.csv")))
+    )
+
+
+def memoized(kind, key, build):
+    """Return the cached value for ``(kind, key)``, building it on first use.
+
+    Keys carry file sizes and mtimes, so an edited input is parsed again. The
+    returned objects are shared between callers and must not be modified.
+    """
+    memo_key = (kind, key)
+    if memo_key not in _memo:
+        _memo[memo_key] = build()
+    return _memo[memo_key]
+
+
+def read_branch_csv(file_path):
+    return memoized(
+        "branch_csv",
+        file_signature(file_path),
+        lambda: pd.read_csv(
+            file_path, header=None, sep=",", na_values="NA", keep_default_na=False
+        ),
+    )
+
+
+def load_branch_counts(file_path):
+    """Substitution and variant count columns of one per-branch CSV."""
+
+    def build():
+        df = read_branch_csv(file_path)
+        counts = pd.DataFrame(
+            {
+                "Substitution": df[0].astype(str),
+                "Variant Count": pd.to_numeric(df[1], errors="coerce")
+                .fillna(0)
+                .astype(int),
+            }
+        )
+        counts["Substitution Type"] = counts["Substitution"].str.extract(r"\[(.*?)\]")[0]
+        return counts
+
+    return memoized("branch_counts", file_signature(file_path), build)
+
+
+def load_mutation_table(directory):
+    return memoized(
+        "mutations", csv_dir_signature(directory), lambda: parse_csv_files(directory)
+    )
+
+
+def load_driver_table(file_path):
+    return memoized(
+        "drivers", file_signature(file_path), lambda: process_driver_file(file_path)
+    )
+
+
+def load_driver_matches(directory, driver_file):
+    def build():
+        driver_mutations, driver_index = load_driver_table(driver_file)
+        return match_positions(load_mutation_table(directory), driver_index)
+
+    key = (csv_dir_signature(directory), file_signature(driver_file))
+    return memoized("matches", key, build)
+
+
+MUTATION_TABLE_COLUMNS = ["branch", "substitution", "count", "position", "chrom", "start", "end"]
+
+
+def parse_csv_files(directory):
+    """Read the per-branch PhyloSignare CSVs into one table with one row per
+    (branch, substitution, position), positions split into chrom/start/end."""
+    frames = []
+    for file_path in sorted(glob.glob(os.path.join(directory, "*.csv"))):
+        try:
+            df = read_branch_csv(file_path)
+            if df.shape[1] < 3:
+                print(
+                    f"File {os.path.basename(file_path)} has less than 3 columns. Skipping."
+                )
+                continue
+            df = df.dropna()
+            positions = df[2].astype(str).str.split(";").explode()
+            positions = positions[positions != ""]
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "branch": os.path.basename(file_path).split("_")[0],
+                        "substitution": df.loc[positions.index, 0].to_numpy(),
+                        "count": df.loc[positions.index, 1].to_numpy(),
+                        "position": positions.to_numpy(),
+                    }
+                )
+            )
+        except Exception as e:
+            print(f"Error processing file {os.path.basename(file_path)}: {e}")
+
+    if not frames:
+        return pd.DataFrame(columns=MUTATION_TABLE_COLUMNS)
+    mutation_data = pd.concat(frames, ignore_index=True)
+    mutation_data = mutation_data.join(parse_positions(mutation_data["position"]))
+    mutation_data = mutation_data.dropna(subset=["chrom", "start"]).reset_index(drop=True)
+    for column in ["branch", "substitution", "chrom"]:
+        mutation_data[column] = mutation_data[column].astype("category")
+    for column in ["start", "end"]:
+        mutation_data[column] = mutation_data[column].astype("int64")
+    return mutation_data
+
+
+def process_driver_file(file_path):
+    driver_mutations = pd.read_csv(file_path, sep="\t")
+    summaries = driver_mutations["Mutation Summary"].astype(str).str.split().str[0]
+    driver_mutations = driver_mutations.join(parse_positions(summaries))
+
+    unparsed = driver_mutations["start"].isna()
+    if unparsed.any():
+        print(
+            f"Skipping {int(unparsed.sum())} driver mutations with an unrecognised Mutation Summary."
+        )
+    return driver_mutations, DriverIndex.from_driver_table(driver_mutations)
+
+
+def match_positions(mutation_data, driver_index):
+    """Join the mutation table against the driver index. Each returned row is a
+    mutation whose position (or range) overlaps a driver, with its gene."""
+    query, driver = driver_index.match(
+        mutation_data["chrom"], mutation_data["start"], mutation_data["end"]
+    )
+    matched_positions = mutation_data.iloc[query].reset_index(drop=True)
+    matched_positions["gene"] = driver_index.genes[driver]
+    matched_positions = matched_positions.drop_duplicates(
+        subset=["branch", "substitution", "position", "gene"]
+    ).reset_index(drop=True)
+
+    for branch, substitution, count, position, gene in matched_positions[
+        ["branch", "substitution", "count", "position", "gene"]
+    ].itertuples(index=False):
+        print(
+            f"Gene {gene} Position {position} has mutation count {count} in file {branch} with mutation {substitution} and is a driver mutation."
+        )
+    matched_genes = set(matched_positions["gene"])
+    unmatched = [gene for gene in pd.unique(driver_index.genes) if gene not in matched_genes]
+    if unmatched:
+        shown = ", ".join(map(str, unmatched[:20]))
+        more = " ..." if len(unmatched) > 20 else ""
+        print(f"No match found for {len(unmatched)} driver genes: {shown}{more}")
+    return matched_positions
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+
+POSITION_PATTERN = r"^\s*([^:\s]+):(\d+)(?:-(?:[^:\s]+:)?(\d+))?"
+
+
+def normalize_chrom(chroms):
+    return chroms.astype(str).str.replace(r"^chr", "", regex=True)
+
+
+def parse_positions(positions):
+    """Split ``chr:pos`` / ``chr:start-end`` strings into chrom, start and end."""
+    parts = positions.astype(str).str.extract(POSITION_PATTERN)
+    parsed = pd.DataFrame(index=positions.index)
+    parsed["chrom"] = normalize_chrom(parts[0]).where(parts[0].notna())
+    parsed["start"] = pd.to_numeric(parts[1], errors="coerce")
+    parsed["end"] = pd.to_numeric(parts[2], errors="coerce").fillna(parsed["start"])
+    swapped = parsed["end"] < parsed["start"]
+    parsed.loc[swapped, ["start", "end"]] = parsed.loc[swapped, ["end", "start"]].values
+    return parsed
+
+
+class DriverIndex:
+    """Per-chromosome interval index over driver mutation positions.
+
+    Intervals are kept sorted by start together with the running maximum of
+    their ends, so every lookup is two binary searches plus a filter over the
+    candidate slice.
+    """
+
+    def __init__(self, chroms, starts, ends, genes):
+        chroms = np.asarray(chroms, dtype=object)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        self.genes = np.asarray(genes, dtype=object)
+        self._by_chrom = {}
+        for chrom in pd.unique(chroms):
+            rows = np.flatnonzero(chroms == chrom)
+            rows = rows[np.argsort(starts[rows], kind="stable")]
+            self._by_chrom[chrom] = (
+                starts[rows],
+                ends[rows],
+                np.maximum.accumulate(ends[rows]),
+                rows,
+            )
+
+    def __len__(self):
+        return len(self.genes)
+
+    @classmethod
+    def from_driver_table(cls, driver_mutations):
+        indexed = driver_mutations.dropna(subset=["chrom", "start", "end"])
+        return cls(
+            indexed["chrom"].to_numpy(),
+            indexed["start"].to_numpy(),
+            indexed["end"].to_numpy(),
+            indexed["Driver Gene"].to_numpy(),
+        )
+
+    def lookup(self, chrom, start, end=None):
+        """Return the indices of the driver intervals overlapping [start, end]."""
+        end = start if end is None else end
+        chrom = str(chrom)
+        chrom = chrom[3:] if chrom.startswith("chr") else chrom
+        if chrom not in self._by_chrom:
+            return np.empty(0, dtype=np.int64)
+        starts, ends, max_ends, rows = self._by_chrom[chrom]
+        hi = np.searchsorted(starts, end, side="right")
+        lo = np.searchsorted(max_ends[:hi], start, side="left")
+        return rows[lo:hi][ends[lo:hi] >= start]
+
+    def genes_at(self, chrom, start, end=None):
+        return list(pd.unique(self.genes[self.lookup(chrom, start, end)]))
+
+    def match(self, chroms, starts, ends):
+        """Vectorised overlap join.
+
+        Returns parallel arrays of query positions and driver indices, one pair
+        per overlapping (query, driver) combination.
+        """
+        chroms = np.asarray(chroms, dtype=object)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        query_hits = []
+        driver_hits = []
+        for chrom, (d_starts, d_ends, d_max_ends, rows) in self._by_chrom.items():
+            queries = np.flatnonzero(chroms == chrom)
+            if not len(queries):
+                continue
+            hi = np.searchsorted(d_starts, ends[queries], side="right")
+            lo = np.searchsorted(d_max_ends, starts[queries], side="left")
+            counts = np.clip(hi - lo, 0, None)
+            if not counts.sum():
+                continue
+            query = np.repeat(queries, counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            candidate = np.repeat(lo, counts) + offsets
+            overlaps = d_ends[candidate] >= starts[query]
+            query_hits.append(query[overlaps])
+            driver_hits.append(rows[candidate[overlaps]])
+        if not query_hits:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(query_hits), np.concatenate(driver_hits)
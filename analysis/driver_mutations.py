@@ -1,16 +1,26 @@
 import subprocess
 import requests
-import requests
 import time
 import os
 import zipfile
 import csv
+import hashlib
 import pandas as pd
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from analysis.cancer_dict import cancer_types_dict
 import glob
 
 
+CGI_API_URL = os.environ.get(
+    "GENOPATH_CGI_URL", "https://www.cancergenomeinterpreter.org/api/v1")
+CGI_REFERENCE = "hg38"
+CGI_CACHE_DIR = os.environ.get(
+    "GENOPATH_CGI_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "genopath", "cgi"))
+
+
 def convert_to_cgi_format(input_file_path, output_file_path):
     with open(input_file_path, "r") as input_file, open(
         output_file_path, "w"
@@ -39,77 +49,164 @@ def convert_to_cgi_format(input_file_path, output_file_path):
             output_file.write(formatted_line)
 
 
-def submit_job(mutation_file, token, cancer_type_input, email):
-    headers = {"Authorization": f"{email} {token}"}
+def resolve_cancer_type(cancer_type_input):
     if cancer_type_input in cancer_types_dict.keys():
-        cancer_type = cancer_type_input
-    elif cancer_type_input in cancer_types_dict.values():
-        cancer_type = {value: key for key, value in cancer_types_dict.items()}[
-            cancer_type_input
-        ]
-    print(f"Cancer Type Selected (Abbreviation): {cancer_type}")
-    payload = {
-        "cancer_type": cancer_type,
-        "title": f"{cancer_type} Run 1",
-        "reference": "hg38",
-    }
-    with open(mutation_file, "rb") as file:
-        files = {"mutations": file}
-        r = requests.post(
-            "https://www.cancergenomeinterpreter.org/api/v1",
-            headers=headers,
-            files=files,
-            data=payload,
+        return cancer_type_input
+    if cancer_type_input in cancer_types_dict.values():
+        return {value: key for key, value in cancer_types_dict.items()}[cancer_type_input]
+    raise ValueError(f"Unknown CGI cancer type: {cancer_type_input}")
+
+
+class CGIClient:
+    """Cancer Genome Interpreter API client on one keep-alive session.
+
+    Connection errors and 429/5xx responses to status polls and downloads
+    are retried with exponential backoff; submissions are not (urllib3 does
+    not retry POST), so a job is never submitted twice. The session is shared
+    by the threads of ``fetch_cgi_batch``.
+    """
+
+    def __init__(self, email, token, base_url=None, workers=1, retries=5,
+                 backoff=2, poll_interval=10, max_poll_interval=60):
+        self.base_url = (base_url or CGI_API_URL).rstrip("/")
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"{email} {token}"
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
         )
-        if r.status_code == 200:
-            job_id = r.text.strip('"')
-            print("Job submitted successfully. Job ID:", job_id)
-            return job_id
-        else:
-            print(f"Error submitting job: {r.status_code}")
-            print(r.text)
-            return None
-
-
-def check_job_completed(job_id, token, email):
-    headers = {"Authorization": f"{email} {token}"}
-    while True:
-        try:
-            r = requests.get(
-                f"https://www.cancergenomeinterpreter.org/api/v1/{job_id}?action=logs",
-                headers=headers,
-                timeout=30,
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=max(workers, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def submit(self, mutation_file, cancer_type, reference=CGI_REFERENCE):
+        payload = {
+            "cancer_type": cancer_type,
+            "title": f"{cancer_type} Run 1",
+            "reference": reference,
+        }
+        with open(mutation_file, "rb") as file:
+            r = self.session.post(
+                self.base_url, files={"mutations": file}, data=payload, timeout=300
             )
-        except requests.exceptions.ConnectTimeout:
-            print("The request timed out. Please check your connection and try again.")
-
-        if r.status_code == 200:
-            response = r.json()
-            status = response.get("status")
-            print(f"Current job status: {status}")
+        r.raise_for_status()
+        job_id = r.text.strip().strip('"')
+        print("Job submitted successfully. Job ID:", job_id)
+        return job_id
+
+    def wait(self, job_id):
+        interval = self.poll_interval
+        while True:
+            r = self.session.get(
+                f"{self.base_url}/{job_id}", params={"action": "logs"}, timeout=30
+            )
+            r.raise_for_status()
+            status = r.json().get("status")
+            print(f"Current job status ({job_id}): {status}")
             if status == "Done":
                 return True
-            elif status == "Failed":
+            if status == "Failed":
                 print("Job failed to complete successfully.")
                 return False
-        else:
-            print(f"Failed to check job status: {r.status_code}")
-            return False
-        time.sleep(10)
-
-
-def download_results(job_id, token, email, output_file_name):
-    headers = {"Authorization": f"{email} {token}"}
-    r = requests.get(
-        f"https://www.cancergenomeinterpreter.org/api/v1/{job_id}?action=download",
-        headers=headers,
-    )
-    if r.status_code == 200:
-        with open(output_file_name, "wb") as fd:
-            fd.write(r.content)
-        print("Download successful")
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def download(self, job_id, output_file_name, chunk_size=1 << 20):
+        # Stream into a .part file; an interrupted download resumes with a
+        # Range request when the server supports it.
+        part_path = output_file_name + ".part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self.session.get(
+            f"{self.base_url}/{job_id}",
+            params={"action": "download"},
+            headers=headers,
+            stream=True,
+            timeout=60,
+        ) as r:
+            r.raise_for_status()
+            mode = "ab" if offset and r.status_code == 206 else "wb"
+            with open(part_path, mode) as fd:
+                for chunk in r.iter_content(chunk_size):
+                    fd.write(chunk)
+        os.replace(part_path, output_file_name)
+        print(f"Downloaded CGI results to {output_file_name}")
+
+    def close(self):
+        self.session.close()
+
+
+def cgi_cache_key(mutation_file, cancer_type, reference=CGI_REFERENCE):
+    digest = hashlib.sha256()
+    with open(mutation_file, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    digest.update(f"\0{cancer_type}\0{reference}".encode())
+    return digest.hexdigest()
+
+
+def fetch_cgi_results(client, mutation_file, cancer_type, reference=CGI_REFERENCE,
+                      cache_dir=None):
+    """Return the path of the cached CGI results zip for ``mutation_file``.
+
+    Results are keyed by the file content, cancer type and reference, so a
+    re-run never resubmits. The job ID is kept next to the cache entry until
+    the download finishes, so an interrupted run resumes the same job.
+    """
+    cache_dir = cache_dir or CGI_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    key = cgi_cache_key(mutation_file, cancer_type, reference)
+    zip_path = os.path.join(cache_dir, f"{key}.zip")
+    job_path = os.path.join(cache_dir, f"{key}.job")
+    if os.path.exists(zip_path):
+        print(f"Using cached CGI results for {mutation_file}")
+        return zip_path
+
+    if os.path.exists(job_path):
+        with open(job_path, "r") as file:
+            job_id = file.read().strip()
+        print(f"Resuming CGI job {job_id} for {mutation_file}")
     else:
-        print(f"Error downloading results: {r.status_code}")
+        job_id = client.submit(mutation_file, cancer_type, reference)
+        with open(job_path, "w") as file:
+            file.write(job_id)
+
+    if not client.wait(job_id):
+        os.remove(job_path)
+        return None
+    client.download(job_id, zip_path)
+    os.remove(job_path)
+    return zip_path
+
+
+def fetch_cgi_batch(jobs, token, email, workers=4, base_url=None, cache_dir=None):
+    """Fetch CGI results for many ``(mutation_file, cancer_type_input)`` pairs at once."""
+    client = CGIClient(email, token, base_url=base_url, workers=workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = {
+                mutation_file: executor.submit(
+                    fetch_cgi_results,
+                    client,
+                    mutation_file,
+                    resolve_cancer_type(cancer_type_input),
+                    cache_dir=cache_dir,
+                )
+                for mutation_file, cancer_type_input in jobs
+            }
+        results = {}
+        for mutation_file, future in futures.items():
+            try:
+                results[mutation_file] = future.result()
+            except requests.RequestException as e:
+                print(f"CGI request failed for {mutation_file}: {e}")
+                results[mutation_file] = None
+        return results
+    finally:
+        client.close()
 
 
 def process_alterations_file(file_path, mutation_file, cancer_type, target_dir):
@@ -175,100 +272,27 @@ def extract_and_process_zip(zip_file_path, output_directory, mutation_file, canc
         print(f"alterations.tsv file not found in {output_directory}")
 
 
-def run_cgi(mutation_file, token, cancer_type_input, email, target_dir):
+def run_cgi(mutation_file, token, cancer_type_input, email, target_dir, base_url=None):
     print(
         "Running Cancer Genome Interpreter (CGI) Analysis to Find Driver Mutations..."
     )
-    time.sleep(2)
-
-    if cancer_type_input in cancer_types_dict.keys():
-        cancer_type = cancer_type_input
-    elif cancer_type_input in cancer_types_dict.values():
-        cancer_type = {value: key for key, value in cancer_types_dict.items()}[
-            cancer_type_input
-        ]
-
-    job_id = submit_job(mutation_file, token, cancer_type, email)
-    if job_id:
-        if check_job_completed(job_id, token, email):
-            output_directory = os.getcwd()
-            zip_file_name = f"{job_id}_CGI_results.zip"
-            zip_file_path = os.path.join(output_directory, zip_file_name)
-            download_results(job_id, token, email, zip_file_path)
-            extract_and_process_zip(
-                zip_file_path, output_directory, mutation_file, cancer_type, target_dir)
-        else:
-            print("Job not completed successfully.")
-    else:
-        print("Failed to submit job.")
-
-
-def parse_csv_files(directory):
-    mutation_data = {}
-    for file_path in glob.glob(os.path.join(directory, "*.csv")):
-        try:
-            df = pd.read_csv(
-                file_path, header=None, sep=",", na_values="NA", keep_default_na=False
-            )
-            if df.shape[1] < 3:
-                print(
-                    f"File {os.path.basename(file_path)} has less than 3 columns. Skipping."
-                )
-                continue
-            for index, row in df.dropna().iterrows():
-                positions = []
-                raw_positions = str(row[2]).split(";")
-                for raw_position in raw_positions:
-                    if "-" in raw_position:
-                        base, range_part = raw_position.split(":")
-                        start_pos, end_pos = range_part.split("-")
-                        positions.append(f"{base}:{start_pos}")
-                        positions.append(f"{base}:{end_pos}")
-                    else:
-                        positions.append(raw_position)
-
-                for position in positions:
-                    if position:
-                        file_identifier = os.path.basename(
-                            file_path).split("_")[0]
-                        mutation_data.setdefault(position, []).append(
-                            (file_identifier, row[0], row[1])
-                        )
-        except Exception as e:
-            print(f"Error processing file {os.path.basename(file_path)}: {e}")
-    return mutation_data
-
-
-def process_driver_file(file_path):
-    driver_mutations = pd.read_csv(file_path, sep="\t")
-    position_to_gene = {}
-    for index, row in driver_mutations.iterrows():
-        raw_positions = row["Mutation Summary"].split(" ")[0]
-        gene_name = row["Driver Gene"]
-
-        if "-" in raw_positions:
-            start, end = raw_positions.split("-")
-            base, start_pos = start.rsplit(":", 1)
-            end_pos = end
-            position_to_gene[f"{base}:{start_pos}"] = gene_name
-            position_to_gene[f"{base}:{end_pos}"] = gene_name
-        else:
-            position_to_gene[raw_positions] = gene_name
-
-    return driver_mutations, position_to_gene
 
+    cancer_type = resolve_cancer_type(cancer_type_input)
+    print(f"Cancer Type Selected (Abbreviation): {cancer_type}")
 
-def match_positions(mutation_data, driver_mutations, position_to_gene):
-    matched_positions = {}
-    for position, gene_name in position_to_gene.items():
-        if position in mutation_data:
-            matched_positions[position] = mutation_data[position]
-            for file_identifier, mutation_type, count in mutation_data[position]:
-                print(
-                    f"Gene {gene_name} Position {position} has mutation count {count} in file {file_identifier} with mutation {mutation_type} and is a driver mutation."
-                )
-        else:
-            print(
-                f"No match found for position: {position} belonging to gene {gene_name}"
-            )
-    return matched_positions
+    client = CGIClient(email, token, base_url=base_url)
+    try:
+        zip_file_path = fetch_cgi_results(client, mutation_file, cancer_type)
+    except requests.RequestException as e:
+        print(f"CGI request failed: {e}")
+        zip_file_path = None
+    finally:
+        client.close()
+
+    if zip_file_path is None:
+        print("Job not completed successfully.")
+        return
+    base_name = os.path.basename(mutation_file).replace(".txt", "")
+    output_directory = os.path.join(target_dir, f"{base_name}_CGI_results")
+    extract_and_process_zip(
+        zip_file_path, output_directory, mutation_file, cancer_type, target_dir)
@@ -2,17 +2,13 @@ import os
 import sys
 import subprocess
 import argparse
-import time
-import pandas as pd
 import pkg_resources
 
+from analysis.clone_frequency import load_clone_frequencies
 
-def process_clone_presence(input_file, output_file):
-    df = pd.read_csv(input_file, sep="\t")
-
-    df.iloc[:, 1:] = df.iloc[:, 1:].map(lambda x: 1 if x > 0 else 0).astype(int)
 
-    df.to_csv(output_file, sep="\t", index=False)
+def process_clone_presence(input_file, output_file):
+    load_clone_frequencies(input_file).presence().write(output_file)
 
 
 def rename_hg19_to_normal(input_file, output_file):
@@ -53,40 +49,3 @@ def delete_files(files):
             print(f"Deleted {file}")
         except OSError as e:
             print(f"Error deleting {file}: {e.strerror}")
-
-
-def t_():
-    time.sleep(2)
-
-
-def t(n):
-    time.sleep(n)
-
-
-def check_input_file_columns(input_file_path):
-    required_columns = ["CHR", "Position", "Wild", "Mutant", "Trinucletide"]
-    column_check_passed = True
-    try:
-        df = pd.read_csv(input_file_path, sep='\t')
-        columns = df.columns
-        for col in required_columns:
-            if col not in columns:
-                print(f"Column '{col}' not found in the input file.")
-                column_check_passed = False
-
-        for col in columns:
-            if col not in required_columns:
-                if "REF" in col:
-                    new_col = col.replace("REF", "ref")
-                    print(f"Column '{col}' should be renamed to '{new_col}'.")
-                    column_check_passed = False
-                elif "ALT" in col:
-                    new_col = col.replace("ALT", "alt")
-                    print(f"Column '{col}' should be renamed to '{new_col}'.")
-                    column_check_passed = False
-
-    except Exception as e:
-        print(f"An error occurred while checking input file columns: {e}")
-        column_check_passed = False
-
-    return column_check_passed
@@ -1,40 +1,91 @@
 import argparse
 import os
+import json
 import shutil
 import glob
-import subprocess
 import pandas as pd
 from graphviz import Digraph
 import time
 
-
-def clone_git_repo(repo_url, target_dir):
-    clone_dir = os.path.join(target_dir, "Meltos")
-    if not os.path.isdir(clone_dir):
-        subprocess.run(["git", "clone", repo_url, clone_dir], check=True)
-
-
-def load_SampC(SNV):
-    SNVta = pd.read_csv(SNV, sep="\t")
-
-    print(SNVta)
-
-    Chrom = []
-    for i in SNVta["CHR"]:
-        Chrom.append(i.replace("chr", ""))
-
-    Len = len(SNVta["CHR"])
-
-    ColLs = SNVta.columns
-    SampLs = []
-    for Col in ColLs:
-        if Col.find(":ref") != -1:
-            SampLs.append(Col.split(":")[0])
-
-    SampC = len(SampLs) + 1
-
+from analysis.read_counts import summarize_input
+from analysis.stage_graph import CACHE_DIR_NAME
+from analysis.meltos_worker import run_meltos_job
+from analysis.tool_runner import run_tool
+from analysis.tool_cache import tool_checkout
+
+MELTOS_REPO_URL = "https://github.com/ih-lab/Meltos"
+MELTOS_OUTPUT_PATTERN = "*meltos*.txt"
+MELTOS_RESULT_FILE = "meltos_result.json"
+
+_meltos_results = {}
+
+
+class MeltosResult:
+    """One Meltos run: its output file, the tree edges and the Valid node -> clone lines."""
+
+    def __init__(self, output_path, edges, node_clone_mapping):
+        self.output_path = output_path
+        self.edges = edges
+        self.node_clone_mapping = node_clone_mapping
+
+
+def parse_valid_line(parts):
+    clone_ids = []
+    array_end_found = False
+    for part in parts[4:]:
+        if array_end_found:
+            clone_ids.extend([int(x) for x in part.split(",") if x.isdigit()])
+        elif part.endswith("]"):
+            array_end_found = True
+    return clone_ids
+
+
+def read_meltos_output(output_path):
+    edges = []
+    node_clone_mapping = {}
+    with open(output_path, "r") as file:
+        for line in file:
+            if "->" in line:
+                parent, child = line.strip().split("->")[:2]
+                edges.append((parent.strip().split()[0], child.strip().split()[0]))
+            if line.startswith("Valid"):
+                parts = line.strip().split("\t")
+                if len(parts) < 4:
+                    continue
+                node_clone_mapping[parts[2]] = parse_valid_line(parts)
+    return MeltosResult(output_path, edges, node_clone_mapping)
+
+
+def meltos_result_path(target_dir):
+    return os.path.join(target_dir, CACHE_DIR_NAME, MELTOS_RESULT_FILE)
+
+
+def load_meltos_result(target_dir):
+    """Return the result of the last Meltos run in ``target_dir``.
+
+    The run records its output path in ``.genopath/meltos_result.json``;
+    within the same process the parsed result is reused as is.
+    """
+    key = os.path.abspath(target_dir)
+    if key in _meltos_results:
+        return _meltos_results[key]
+
+    record_path = meltos_result_path(target_dir)
+    if not os.path.exists(record_path):
+        print(f"No Meltos run recorded in {record_path}.")
+        return None
+    with open(record_path, "r") as file:
+        output_path = json.load(file)["output_path"]
+    if not os.path.exists(output_path):
+        print(f"Recorded Meltos output {output_path} no longer exists.")
+        return None
+    _meltos_results[key] = read_meltos_output(output_path)
+    return _meltos_results[key]
+
+
+def load_SampC(SNV, target_dir=None):
+    SampC = len(summarize_input(SNV, target_dir)["samples"]) + 1
     print(SampC)
-
     return SampC
 
 
@@ -74,28 +125,50 @@ def order_verification(SV, OutSNV):
         f"DataFrames written back to their original files: {SV} and {OutSNV}")
 
 
-def run_meltos(OutSNV, SV, OutTree, SampC, target_dir):
-    meltos_repo_url = "https://github.com/ih-lab/Meltos"
-    clone_git_repo(meltos_repo_url, target_dir)
-    print("Meltos Repository Cloned.")
+def run_meltos(OutSNV, SV, OutTree, SampC, target_dir, tools_dir=None, mode="subprocess"):
+    """Run Meltos and return a MeltosResult, or None if it wrote no output.
 
-    original_dir = os.getcwd()
-    meltos_dir = os.path.join(target_dir, "Meltos")
-    os.chdir(meltos_dir)
+    Meltos runs in a private scratch directory holding its inputs, so the
+    output it writes next to them belongs to this run alone; it is then moved
+    to ``target_dir``. ``mode="worker"``
+    runs it in a JVM kept alive across patients (see analysis/meltos_worker.py).
+    """
+    meltos_dir = tool_checkout("Meltos", MELTOS_REPO_URL, tools_dir)
+    print(f"Using Meltos from {meltos_dir}")
+    meltos_jar = os.path.join(meltos_dir, "Meltos.jar")
 
     # print ('java -jar Meltos.jar -treeFile '+OutTree+' -svFile '+SV+' -numSamples '+str(SampC)+' -ssnvFile '+ OutSNV)
-    subprocess.run(
+    run = run_tool(
+        "Meltos",
         [
-            "java",
-            "-jar",
-            "Meltos.jar",
             "-treeFile",
-            OutTree,
+            "{tree}",
             "-svFile",
-            SV,
+            "{sv}",
             "-numSamples",
             str(SampC),
             "--ssnvFile",
-            OutSNV
-        ]
-    )
+            "{snv}"
+        ],
+        target_dir,
+        tool_dir=meltos_dir,
+        inputs={"tree": OutTree, "sv": SV, "snv": OutSNV},
+        outputs={MELTOS_OUTPUT_PATTERN: None},
+        runner=lambda args, cwd: run_meltos_job(meltos_jar, args, mode, cwd),
+    ).check()
+
+    written = run.outputs[MELTOS_OUTPUT_PATTERN]
+    if not written:
+        print("Meltos did not write an output file.")
+        return None
+    if len(written) > 1:
+        print(f"Meltos wrote several output files, using the first: {written}")
+
+    result = read_meltos_output(written[0])
+    record_path = meltos_result_path(target_dir)
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+    with open(record_path, "w") as file:
+        json.dump({"output_path": result.output_path}, file, indent=2)
+    _meltos_results[os.path.abspath(target_dir)] = result
+    print(f"Meltos output: {result.output_path}")
+    return result
@@ -1,11 +1,9 @@
-import subprocess
 import os
 
+from analysis.tool_runner import run_tool
+from analysis.tool_cache import tool_checkout
 
-def clone_git_repo(repo_url, target_dir):
-    path_dir = os.path.join(target_dir, "PathFinder")
-    if not os.path.isdir(path_dir):
-        subprocess.run(["git", "clone", repo_url, path_dir], check=True)
+PATHFINDER_REPO_URL = "https://github.com/SayakaMiura/PathFinder"
 
 
 def create_output_directory(target_dir):
@@ -19,35 +17,37 @@ def run_pathfinder(
     primary,
     max_graphs_per_tree,
     target_dir,
+    tools_dir=None,
 ):
     create_output_directory(target_dir)
 
-    pathfinder_repo_url = "https://github.com/SayakaMiura/PathFinder"
-    clone_git_repo(pathfinder_repo_url, target_dir)
-
-    original_dir = os.getcwd()
-    pathfinder_dir = os.path.join(target_dir, "PathFinder")
-    os.chdir(pathfinder_dir)
-
-    try:
-        command = [
-            "python",
-            "pathfinder.py",
-            aln_phylosig,
-            processed_clone_presence_output,
-            "-o",
-            target_dir,
-        ]
-
-        if primary is not None:
-            command.extend(["--primary", primary])
-
-        if max_graphs_per_tree is not None:
-            command.extend(["--max_graphs_per_tree", str(max_graphs_per_tree)])
-
-        subprocess.run(command, check=True)
-
-    except subprocess.CalledProcessError as e:
-        print(f"Error in running PathFinder: {e}")
-    finally:
-        os.chdir(original_dir)
+    pathfinder_dir = tool_checkout("PathFinder", PATHFINDER_REPO_URL, tools_dir)
+
+    command = [
+        "python",
+        "pathfinder.py",
+        "{aln}",
+        "{clone_presence}",
+        "-o",
+        "{scratch_dir}",
+    ]
+
+    if primary is not None:
+        command.extend(["--primary", primary])
+
+    if max_graphs_per_tree is not None:
+        command.extend(["--max_graphs_per_tree", str(max_graphs_per_tree)])
+
+    # PathFinder writes its results into a scratch* folder under -o, which
+    # becomes PathFinder_Results in target_dir.
+    run = run_tool(
+        "PathFinder",
+        command,
+        target_dir,
+        tool_dir=pathfinder_dir,
+        inputs={"aln": aln_phylosig, "clone_presence": processed_clone_presence_output},
+        outputs={"scratch*": "PathFinder_Results"},
+    )
+    if run.returncode != 0:
+        print(f"Error in running PathFinder: exit code {run.returncode}")
+    return run
@@ -1,11 +1,9 @@
-import subprocess
 import os
 
+from analysis.tool_runner import run_tool
+from analysis.tool_cache import tool_checkout
 
-def clone_git_repo(repo_url, target_dir):
-    clone_dir = os.path.join(target_dir, "PhyloSignare")
-    if not os.path.exists(clone_dir):
-        subprocess.run(["git", "clone", repo_url, clone_dir], check=True)
+PHYLOSIGNARE_REPO_URL = "https://github.com/SayakaMiura/PhyloSignare"
 
 
 def create_output_directory(target_dir):
@@ -13,22 +11,20 @@ def create_output_directory(target_dir):
         os.makedirs(target_dir)
 
 
-def run_phylosignare(target_file_path, control_file, target_dir):
+def run_phylosignare(target_file_path, control_file, target_dir, tools_dir=None):
     create_output_directory(target_dir)
 
-    phylosignare_repo_url = "https://github.com/SayakaMiura/PhyloSignare"
-    clone_git_repo(phylosignare_repo_url, target_dir)
-    print("Repository Clone.")
-
-    phylosignare_dir = os.path.join(target_dir, "PhyloSignare")
-    original_dir = os.getcwd()
-    os.chdir(phylosignare_dir)
-
-    try:
-        subprocess.run(
-            ["python", "phylosignare.py", target_file_path, control_file], check=True
-        )
-    except subprocess.CalledProcessError as e:
-        print(f"Error in running PhyloSignare: {e}")
-    finally:
-        os.chdir(original_dir)
+    phylosignare_dir = tool_checkout("PhyloSignare", PHYLOSIGNARE_REPO_URL, tools_dir)
+    print(f"Using PhyloSignare from {phylosignare_dir}")
+
+    run = run_tool(
+        "PhyloSignare",
+        ["python", "phylosignare.py", "{target_file_path}", os.path.abspath(control_file)],
+        target_dir,
+        tool_dir=phylosignare_dir,
+        inputs={"target_file_path": target_file_path},
+        outputs={"*-PhyloSignare": None},
+    )
+    if run.returncode != 0:
+        print(f"Error in running PhyloSignare: exit code {run.returncode}")
+    return run
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+REQUIRED_COLUMNS = ["CHR", "Position", "Wild", "Mutant", "Trinucletide"]
+
+
+def check_header(columns, input_file):
+    """Return the sample names of a CloneFinder input header, or raise ValueError."""
+    problems = []
+    for col in REQUIRED_COLUMNS:
+        if col not in columns:
+            problems.append(f"Column '{col}' not found.")
+
+    ref_samples = []
+    alt_samples = []
+    for col in columns:
+        if col.endswith(":REF") or col.endswith(":ALT"):
+            problems.append(
+                f"Column '{col}' should be renamed to '{col[:-4] + col[-4:].lower()}'."
+            )
+        elif col.endswith(":ref"):
+            ref_samples.append(col[:-4])
+        elif col.endswith(":alt"):
+            alt_samples.append(col[:-4])
+
+    for sample in ref_samples:
+        if sample not in alt_samples:
+            problems.append(f"Sample '{sample}' has a ':ref' column but no ':alt' column.")
+    for sample in alt_samples:
+        if sample not in ref_samples:
+            problems.append(f"Sample '{sample}' has an ':alt' column but no ':ref' column.")
+    if not ref_samples and not alt_samples:
+        problems.append("No '<sample>:ref' / '<sample>:alt' columns found.")
+
+    if problems:
+        raise ValueError(f"Invalid input file {input_file}:\n  " + "\n  ".join(problems))
+    return ref_samples
+
+
+def check_counts(values, columns, first_row, input_file):
+    bad = np.isnan(values) | (values < 0) | (values != np.floor(values))
+    if bad.any():
+        row, col = np.argwhere(bad)[0]
+        # +2: one for the header line, one for 1-based line numbers.
+        raise ValueError(
+            f"Invalid format on line {first_row + row + 2} in {input_file}: "
+            f"'{columns[col]}' must be a non-negative integer."
+        )
+
+
+def depth_summary(samples, ref, alt):
+    """Row count and per-sample read depth statistics of a (samples x rows) count matrix."""
+    depth = ref + alt
+    rows = depth.shape[1]
+    return {
+        "samples": list(samples),
+        "rows": rows,
+        "depth": {
+            sample: {
+                "min": int(depth[i].min()),
+                "max": int(depth[i].max()),
+                "mean": round(float(depth[i].mean()), 3),
+                "zero_depth_rows": int((depth[i] == 0).sum()),
+            }
+            for i, sample in enumerate(samples)
+        },
+    }
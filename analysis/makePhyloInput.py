@@ -1,24 +1,29 @@
-import subprocess
 import os
 
+from analysis.helper_clonefinder import CLONEFINDER_REPO_URL
+from analysis.tool_runner import run_tool
+from analysis.tool_cache import tool_checkout
 
-def run_make_phylosignare_input(aln_phylosig, target_dir):
+
+def run_make_phylosignare_input(aln_phylosig, target_dir, tools_dir=None):
     if not os.path.exists(target_dir):
         os.makedirs(target_dir)
 
-    original_dir = os.getcwd()
-    phylosignare_dir = os.path.join(target_dir, "CloneFinder")
-    os.chdir(phylosignare_dir)
+    clonefinder_dir = tool_checkout("CloneFinder", CLONEFINDER_REPO_URL, tools_dir)
 
-    try:
-        subprocess.run(
-            ["python", "make_PhyloSigFinder_Input.py", aln_phylosig], check=True
-        )
-    except subprocess.CalledProcessError as e:
-        print(f"Error creating PhyloSignare Input file: {e}")
-    finally:
-        os.chdir(original_dir)
+    input_file_base_name = os.path.splitext(os.path.basename(aln_phylosig))[0]
+    run = run_tool(
+        "PhyloSignare_Input",
+        ["python", "make_PhyloSigFinder_Input.py", "{aln_phylosig}"],
+        target_dir,
+        tool_dir=clonefinder_dir,
+        inputs={"aln_phylosig": aln_phylosig},
+        outputs={f"{input_file_base_name}_PSF.input": None, input_file_base_name: None},
+    )
+    if run.returncode != 0:
+        print(f"Error creating PhyloSignare Input file: exit code {run.returncode}")
+    return run
 
 
-def makePhyloInput(aln_phylosig, target_dir):
-    run_make_phylosignare_input(aln_phylosig, target_dir)
+def makePhyloInput(aln_phylosig, target_dir, tools_dir=None):
+    return run_make_phylosignare_input(aln_phylosig, target_dir, tools_dir)
@@ -0,0 +1,191 @@
+import os
+import time
+import shutil
+import tempfile
+import atexit
+import threading
+import subprocess
+import multiprocessing.util
+
+
+current_script_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_script_dir)
+WORKER_SOURCE = os.path.join(parent_dir, "java_scripts", "MeltosWorker.java")
+SENTINEL = "__GENOPATH_MELTOS_DONE__"
+READY = "__GENOPATH_MELTOS_READY__"
+MELTOS_MODES = ["subprocess", "worker"]
+
+_workers = {}
+_call_timings = []
+
+
+class MeltosWorkerError(RuntimeError):
+    pass
+
+
+def record_call(mode, exit_code, elapsed, jvm_elapsed=None, cwd=None):
+    _call_timings.append(
+        {
+            "mode": mode,
+            "exit_code": exit_code,
+            "elapsed_seconds": round(elapsed, 3),
+            "jvm_elapsed_seconds": jvm_elapsed,
+            "cwd": cwd,
+        }
+    )
+    print(f"[Meltos] {mode}: exit code {exit_code} in {elapsed:.1f}s")
+
+
+class MeltosWorker:
+    """A single JVM that runs Meltos jobs one after another.
+
+    The JVM is started once with java_scripts/MeltosWorker.java, which loads
+    the main class named in the jar's manifest and calls it for every job, so
+    JVM start-up and warm-up are paid once per process instead of per patient.
+    """
+
+    def __init__(self, jar_path, java="java"):
+        self.jar_path = os.path.abspath(jar_path)
+        self.java = java
+        self.process = None
+        self.start_error = None
+        self.work_dir = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.process is not None and self.process.poll() is None:
+            return
+        if self.start_error is not None:
+            raise self.start_error
+        # The jar may live in the shared tool cache, so the JVM works in a
+        # directory of its own; job arguments are absolute paths.
+        if self.work_dir is None:
+            self.work_dir = tempfile.mkdtemp(prefix="genopath-meltos-")
+        # Source-file mode (Java 11+) compiles the launcher in memory.
+        self.process = subprocess.Popen(
+            [self.java, WORKER_SOURCE, self.jar_path],
+            cwd=self.work_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        output = []
+        for line in self.process.stdout:
+            if line.startswith(READY):
+                print(f"Started Meltos worker (pid {self.process.pid}): {line.rstrip()}")
+                return
+            output.append(line)
+        self.process.wait()
+        self.process = None
+        self.start_error = MeltosWorkerError(
+            "Meltos worker failed to start:\n" + "".join(output))
+        raise self.start_error
+
+    def run(self, args):
+        """Run one Meltos job and return its exit code and output."""
+        with self.lock:
+            return self._run(args)
+
+    def _run(self, args):
+        self.start()
+        started = time.time()
+        self.process.stdin.write("\t".join(map(str, args)) + "\n")
+        self.process.stdin.flush()
+
+        output = []
+        for line in self.process.stdout:
+            if SENTINEL in line:
+                done = line[line.index(SENTINEL):].rstrip("\n").split("\t")
+                exit_code, jvm_elapsed = int(done[1]), float(done[2])
+                message = "\t".join(done[3:])
+                break
+            output.append(line)
+        else:
+            # Meltos called System.exit and the JVM could not trap it.
+            exit_code = self.process.wait()
+            self.process = None
+            jvm_elapsed, message = None, "Meltos worker exited"
+
+        record_call("worker", exit_code, time.time() - started, jvm_elapsed, self.work_dir)
+        if message:
+            print(f"[Meltos] {message}")
+        return exit_code, "".join(output)
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            try:
+                # An empty line ends the worker even if a forked process
+                # still holds a copy of its stdin.
+                self.process.stdin.write("\n")
+                self.process.stdin.close()
+                self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+        self.process = None
+        if self.work_dir is not None:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+
+def get_worker(jar_path):
+    jar_path = os.path.abspath(jar_path)
+    if jar_path not in _workers:
+        _workers[jar_path] = MeltosWorker(jar_path, os.environ.get("GENOPATH_JAVA", "java"))
+        atexit.register(_workers[jar_path].close)
+    return _workers[jar_path]
+
+
+def start_worker(jar_path):
+    """Start the worker for ``jar_path`` now rather than on the first job."""
+    try:
+        get_worker(jar_path).start()
+    except MeltosWorkerError as e:
+        print(f"{e}\nMeltos will start one JVM per run.")
+
+
+def close_workers():
+    for worker in _workers.values():
+        worker.close()
+    _workers.clear()
+
+
+def close_workers_on_exit():
+    # atexit does not run in multiprocessing children such as the workers of
+    # a ProcessPoolExecutor; their finalizers do. Use as the pool initializer.
+    multiprocessing.util.Finalize(None, close_workers, exitpriority=10)
+
+
+def run_meltos_job(jar_path, args, mode="subprocess", cwd=None):
+    """Run Meltos with ``args`` and return its exit code.
+
+    ``worker`` reuses one JVM per jar for the life of the process and falls
+    back to ``subprocess`` (``java -jar`` per job) if the worker cannot start.
+    The worker runs in a temporary directory of its own, not in ``cwd``: Meltos
+    files written relative to the working directory are not in the run's
+    scratch directory in ``worker`` mode. Each call's working directory is
+    recorded with its timing.
+    """
+    if mode == "worker":
+        try:
+            exit_code, output = get_worker(jar_path).run(args)
+            print(output, end="")
+            return exit_code
+        except MeltosWorkerError as e:
+            print(f"{e}\nFalling back to one JVM per Meltos run.")
+
+    started = time.time()
+    completed = subprocess.run(
+        [os.environ.get("GENOPATH_JAVA", "java"), "-jar", os.path.abspath(jar_path)]
+        + list(map(str, args)),
+        cwd=cwd,
+    )
+    record_call("subprocess", completed.returncode, time.time() - started, cwd=cwd)
+    return completed.returncode
+
+
+def pop_meltos_call_timings():
+    global _call_timings
+    timings, _call_timings = _call_timings, []
+    return timings
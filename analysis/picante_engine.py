@@ -0,0 +1,228 @@
+import os
+from io import StringIO
+
+import numpy as np
+from Bio import Phylo
+from matplotlib.figure import Figure
+
+from analysis.clone_frequency import load_clone_frequencies
+
+
+_tree_memo = {}
+
+
+def parse_abundance_weighted(value):
+    return str(value).strip().upper() in ("TRUE", "T")
+
+
+def read_community(comm_file):
+    return load_clone_frequencies(comm_file).to_frame()
+
+
+def load_tree_matrices(tree_file):
+    """Return tip labels, branch lengths, the branch-by-tip descendant matrix
+    and the cophenetic distance matrix of a Newick tree.
+
+    Row ``e`` of the descendant matrix marks the tips below branch ``e``.  The
+    result is memoised per file so the Picante methods share one parse.
+    """
+    stat = os.stat(tree_file)
+    memo_key = (os.path.abspath(tree_file), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _tree_memo:
+        return _tree_memo[memo_key]
+
+    tree = Phylo.read(tree_file, "newick")
+    tips = tree.get_terminals()
+    tip_labels = [tip.name for tip in tips]
+    tip_index = {id(tip): i for i, tip in enumerate(tips)}
+
+    branch_lengths = []
+    branch_tips = []
+
+    def visit(clade):
+        if clade.is_terminal():
+            members = [tip_index[id(clade)]]
+        else:
+            members = []
+            for child in clade.clades:
+                members.extend(visit(child))
+        if clade is not tree.root:
+            branch_lengths.append(clade.branch_length or 0.0)
+            branch_tips.append(members)
+        return members
+
+    visit(tree.root)
+
+    descendants = np.zeros((len(branch_tips), len(tip_labels)), dtype=bool)
+    for e, members in enumerate(branch_tips):
+        descendants[e, members] = True
+
+    branch_lengths = np.asarray(branch_lengths, dtype=float)
+    result = (
+        tip_labels,
+        branch_lengths,
+        descendants,
+        cophenetic(branch_lengths, descendants),
+    )
+    _tree_memo[memo_key] = result
+    return result
+
+
+def cophenetic(branch_lengths, descendants):
+    # d(a, b) is the total length of branches that lie above exactly one of a, b.
+    weighted = descendants.T * branch_lengths
+    depth = weighted.sum(axis=1)
+    shared = weighted @ descendants.astype(float)
+    distances = depth[:, None] + depth[None, :] - 2 * shared
+    np.fill_diagonal(distances, 0.0)
+    return distances
+
+
+def match_comm_tree(comm, tip_labels):
+    shared = [label for label in tip_labels if label in comm.columns]
+    dropped_comm = [col for col in comm.columns if col not in shared]
+    dropped_tree = [label for label in tip_labels if label not in shared]
+    if dropped_comm:
+        print(f"Dropping taxa from the community not present in the tree: {dropped_comm}")
+    if dropped_tree:
+        print(f"Dropping tips from the tree not present in the community: {dropped_tree}")
+    tip_columns = [tip_labels.index(label) for label in shared]
+    return comm[shared], tip_columns
+
+
+def comdist(comm, distances, abundance_weighted):
+    x = comm.to_numpy(dtype=float)
+    if not abundance_weighted:
+        x = (x > 0).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = x / x.sum(axis=1, keepdims=True)
+    return x @ distances @ x.T
+
+
+def comdistnt(comm, distances, abundance_weighted):
+    x = comm.to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = x / x.sum(axis=1, keepdims=True)
+    present = x > 0
+
+    # nearest[j, a]: distance from taxon a to its closest relative in community j.
+    masked = np.where(present[:, None, :], distances[None, :, :], np.inf)
+    nearest = masked.min(axis=2)
+    nearest[np.isinf(nearest)] = np.nan
+
+    weights = x if abundance_weighted else present.astype(float)
+    weights = np.where(present, weights, 0.0)
+    nt = np.nan_to_num(nearest)
+    has_nt = ~np.isnan(nearest)
+
+    # Sum of weighted nearest-taxon distances of community i's taxa to community j.
+    totals = weights @ nt.T
+    counts = weights @ has_nt.T.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = (totals + totals.T) / (counts + counts.T)
+    empty = ~present.any(axis=1)
+    result[empty, :] = np.nan
+    result[:, empty] = np.nan
+    return result
+
+
+def unifrac(comm, branch_lengths, descendants):
+    present = comm.to_numpy(dtype=float) > 0
+    # picante::unifrac scores the full tree with pd(include.root = TRUE): a
+    # community's PD is the union of its taxa's paths to the root, so branches
+    # shared by every taxon count towards both the union and the overlap.
+    covered = (present.astype(float) @ descendants.T.astype(float)) > 0
+    weighted = covered * branch_lengths
+    pd_values = weighted.sum(axis=1)
+    shared = weighted @ covered.T.astype(float)
+    union = pd_values[:, None] + pd_values[None, :] - shared
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (2 * union - pd_values[:, None] - pd_values[None, :]) / union
+
+
+def format_length(value):
+    return f"{value:.10g}"
+
+
+def neighbor_joining(distances, labels):
+    distances = np.array(distances, dtype=float)
+    # ape's nj(as.dist(...)) only sees the lower triangle; comdist's diagonal
+    # holds each community's own MPD and must not enter the row totals.
+    np.fill_diagonal(distances, 0.0)
+    if np.isnan(distances).any():
+        raise ValueError("Distance matrix contains missing values; cannot build NJ tree.")
+    nodes = list(labels)
+    n = len(nodes)
+    if n < 2:
+        raise ValueError("At least two communities are required to build an NJ tree.")
+    if n == 2:
+        half = format_length(distances[0, 1] / 2)
+        return f"({nodes[0]}:{half},{nodes[1]}:{half});"
+
+    while n > 3:
+        totals = distances.sum(axis=1)
+        q = (n - 2) * distances - totals[:, None] - totals[None, :]
+        np.fill_diagonal(q, np.inf)
+        i, j = np.unravel_index(np.argmin(q), q.shape)
+        i, j = min(i, j), max(i, j)
+
+        d_ij = distances[i, j]
+        length_i = d_ij / 2 + (totals[i] - totals[j]) / (2 * (n - 2))
+        length_j = d_ij - length_i
+        new_node = (
+            f"({nodes[i]}:{format_length(length_i)},{nodes[j]}:{format_length(length_j)})"
+        )
+        new_distances = (distances[i] + distances[j] - d_ij) / 2
+
+        keep = [k for k in range(n) if k != i and k != j]
+        distances = np.vstack(
+            [
+                np.hstack([distances[np.ix_(keep, keep)], new_distances[keep, None]]),
+                np.append(new_distances[keep], 0.0),
+            ]
+        )
+        nodes = [nodes[k] for k in keep] + [new_node]
+        n -= 1
+
+    d01, d02, d12 = distances[0, 1], distances[0, 2], distances[1, 2]
+    lengths = [(d01 + d02 - d12) / 2, (d01 + d12 - d02) / 2, (d02 + d12 - d01) / 2]
+    return "(" + ",".join(
+        f"{node}:{format_length(length)}" for node, length in zip(nodes, lengths)
+    ) + ");"
+
+
+def write_nj_outputs(distances, labels, title, output, newick_output):
+    newick = neighbor_joining(distances, labels)
+    with open(newick_output, "w") as file:
+        file.write(newick + "\n")
+
+    nj_tree = Phylo.read(StringIO(newick), "newick")
+    fig = Figure(figsize=(7, 7))
+    ax = fig.add_subplot(1, 1, 1)
+    Phylo.draw(nj_tree, axes=ax, do_show=False)
+    ax.set_title(title)
+    fig.savefig(output)
+    return newick
+
+
+def run_native_picante(method, comm_file, tree_file, abundance_weighted, output, newick_output):
+    comm = read_community(comm_file)
+    tip_labels, branch_lengths, descendants, phydist = load_tree_matrices(tree_file)
+    comm, tip_columns = match_comm_tree(comm, tip_labels)
+    descendants = descendants[:, tip_columns]
+    phydist = phydist[np.ix_(tip_columns, tip_columns)]
+    weighted = parse_abundance_weighted(abundance_weighted)
+
+    if method == "comdist":
+        distances = comdist(comm, phydist, weighted)
+        title = "NJ Tree from MPD (comdist) Values"
+    elif method == "comdistnt":
+        distances = comdistnt(comm, phydist, weighted)
+        title = "NJ Tree from MNTD (comdistnt) Values"
+    elif method == "unifrac":
+        distances = unifrac(comm, branch_lengths, descendants)
+        title = "NJ Tree from Unifrac Values"
+    else:
+        raise ValueError(f"Unsupported Picante method: {method}")
+
+    return write_nj_outputs(distances, list(comm.index.astype(str)), title, output, newick_output)
@@ -0,0 +1,246 @@
+import os
+import glob
+
+from analysis import helper_clonefinder, helper_pathfinder, helper_phylosignare
+from analysis.tool_cache import tool_checkout, pin_tool
+from analysis.helper_clonefinder import run_clonefinder
+from analysis.helper_pathfinder import run_pathfinder
+from analysis.helper_phylosignare import run_phylosignare
+from analysis.helper_picante import run_comdist, run_comdistnt, run_unifrac
+from analysis.makePhyloInput import makePhyloInput
+from analysis.general_helper import process_clone_presence, rename_hg19_to_normal
+from analysis.clone_frequency import load_clone_frequencies
+from analysis.driver_mutations import run_cgi, convert_to_cgi_format
+from analysis.driver_annotations import load_driver_matches
+from analysis import helper_meltos
+from analysis.helper_meltos import load_SampC, run_meltos, order_verification
+from plot_scripts.ps import run
+from CloneFinder2MeltosIn import clonefinder_to_meltos
+from driver_mutations_with_cravat import run_cravat
+from plot_scripts.meltos_plot import plot_meltos
+from plot_scripts.hm_c_t import plot_heatmap
+from plot_scripts.CF_T_tree import clone_tree, tumor_tree
+
+
+def prepare_tool_checkouts(tools_dir, processes):
+    """Fetch the tools ``processes`` need once, before any patient runs.
+
+    Checkouts from the shared cache are pinned to the commit fetched here, so
+    every patient (and every worker process started afterwards) runs the same
+    commit without asking the remote again.
+    """
+    tools = []
+    if "All" in processes or "CloneFinder" in processes or "PhyloSignare" in processes:
+        tools.append(("CloneFinder", helper_clonefinder.CLONEFINDER_REPO_URL))
+    if "All" in processes or "PathFinder" in processes:
+        tools.append(("PathFinder", helper_pathfinder.PATHFINDER_REPO_URL))
+    if "All" in processes or "PhyloSignare" in processes:
+        tools.append(("PhyloSignare", helper_phylosignare.PHYLOSIGNARE_REPO_URL))
+    if "Meltos" in processes:
+        tools.append(("Meltos", helper_meltos.MELTOS_REPO_URL))
+
+    if tools_dir is not None:
+        os.makedirs(tools_dir, exist_ok=True)
+    checkouts = {}
+    for name, repo_url in tools:
+        checkouts[name] = tool_checkout(name, repo_url, tools_dir)
+        if tools_dir is None:
+            pin_tool(name, os.path.basename(checkouts[name]).split("@", 1)[1])
+        print(f"{name}: {checkouts[name]}")
+    return checkouts
+
+
+def clonefinder_stage(mode, input_file, target_dir, tools_dir=None):
+    input_file_base_name = os.path.splitext(os.path.basename(input_file))[0]
+    print(f"The input file name is: {input_file_base_name}\n")
+    run_clonefinder(mode, input_file, target_dir, tools_dir).check()
+
+
+def process_clonefinder_stage(
+    clonefinder_output_file,
+    processed_clonefinder_output_file,
+    clonefinder_clone_presence_file,
+    processed_clone_presence_output,
+):
+    print("Processing Output Files for Use in PathFinder...")
+    print("Renaming hg19 to Normal...")
+    rename_hg19_to_normal(clonefinder_output_file,
+                          processed_clonefinder_output_file)
+    print("Clone .meg File Processed...")
+
+    process_clone_presence(
+        clonefinder_clone_presence_file, processed_clone_presence_output
+    )
+    print("Clone Presence File Processed")
+
+
+def pathfinder_stage(
+    aln,
+    processed_clone_presence_output,
+    primary,
+    max_graphs_per_tree,
+    target_dir,
+    tools_dir=None,
+):
+    run = run_pathfinder(
+        aln,
+        processed_clone_presence_output,
+        primary,
+        max_graphs_per_tree,
+        target_dir,
+        tools_dir,
+    ).check()
+
+    pathfinder_results_dir = run.output("scratch*")
+    if pathfinder_results_dir:
+        print(f"PathFinder results written to {pathfinder_results_dir}")
+    else:
+        print("PathFinder did not write a scratch directory.")
+
+
+def phylosignare_input_stage(aln_phylosig, target_dir, tools_dir=None):
+    print("Creating PhyloSignare Input...")
+    run = makePhyloInput(aln_phylosig, target_dir, tools_dir).check()
+    input_file_base_name = os.path.splitext(os.path.basename(aln_phylosig))[0]
+
+    target_file_path = run.output(f"{input_file_base_name}_PSF.input")
+    if target_file_path:
+        print(f"PhyloSignare Input File written to: {target_file_path}")
+    else:
+        print("Error: make_PhyloSigFinder_Input.py did not write a PhyloSignare input file.")
+
+    target_folder_path = run.output(input_file_base_name)
+    if target_folder_path:
+        print(f"Mutation count folder written to: {target_folder_path}")
+        print("PhyloSignare Input File Created. Moving onto analysis...")
+    else:
+        print(f"No mutation count folder {input_file_base_name} was written.")
+
+
+def phylosignare_stage(target_file_path, control_file, target_dir, tools_dir=None):
+    run_phylosignare(target_file_path, control_file, target_dir, tools_dir).check()
+
+
+def cgi_driver_stage(
+    ref_alt_file, mutation_file, token, cancer_type_input, email, target_dir
+):
+    convert_to_cgi_format(ref_alt_file, mutation_file)
+    run_cgi(mutation_file, token, cancer_type_input, email, target_dir)
+
+
+def cravat_driver_stage(ref_alt_file, cancer_type_input, driver_file, target_dir):
+    run_cravat(ref_alt_file, cancer_type_input, target_dir, output_txt_file=driver_file)
+
+
+def prepare_driver_annotations(csv_files_dir, driver_file):
+    matched_positions = load_driver_matches(csv_files_dir, driver_file)
+    print(f"Matched {len(matched_positions)} mutations to driver genes.")
+    return matched_positions
+
+
+def find_phylosignare_outputs(target_dir):
+    signature_files_dir = None
+    summary_file_path = None
+
+    phylosignare_dirs = sorted(glob.glob(os.path.join(target_dir, "*-PhyloSignare")))
+    for dir_path in phylosignare_dirs:
+        potential_file = os.path.join(dir_path, "PhyloSignare.txt")
+        if os.path.isfile(potential_file):
+            signature_files_dir = potential_file
+            break
+
+    if signature_files_dir is None:
+        print("PhyloSignare.txt not found in any -PhyloSignare directory.")
+
+    if phylosignare_dirs:
+        summary_file_path = os.path.join(phylosignare_dirs[0], "Summary.txt")
+    else:
+        print("No PhyloSignare directories found.")
+
+    return signature_files_dir, summary_file_path
+
+
+def phylosignare_plot_stage(
+    target_dir, csv_files_dir, control_file, driver_file, input_file_base_name
+):
+    signature_files_dir, summary_file_path = find_phylosignare_outputs(target_dir)
+
+    matched_positions = prepare_driver_annotations(csv_files_dir, driver_file)
+
+    run(
+        target_dir,
+        csv_files_dir,
+        signature_files_dir,
+        control_file,
+        summary_file_path,
+        input_file_base_name,
+        os.path.join(target_dir, "Phylogenetic_Tree_complete.png"),
+        os.path.join(target_dir, "Phylogenetic_Tree_driver.png"),
+        os.path.join(target_dir, "combined_bar_plots.png"),
+        matched_positions,
+    )
+    print("PhyloSignare Analysis Complete. Graphing is done...")
+
+
+def picante_stage(
+    method, comm, tree, abundance_weighted, output_pdf, newick_output, engine="native"
+):
+    if method == "comdist":
+        run_comdist(comm, tree, abundance_weighted, output_pdf, newick_output, engine)
+    elif method == "comdistnt":
+        run_comdistnt(comm, tree, abundance_weighted, output_pdf, newick_output, engine)
+    elif method == "unifrac":
+        run_unifrac(comm, tree, output_pdf, newick_output, engine)
+    else:
+        raise ValueError(f"Unsupported Picante method: {method}")
+
+
+def meltos_stage(
+    SNV, SV, OutSNV, OutTree, tree_file, clone_freq_file, target_dir, tools_dir=None,
+    meltos_mode="subprocess",
+):
+    print("Creating Meltos In File...")
+    clonefinder_to_meltos(
+        SNV,
+        Tree=tree_file,
+        CloFre=clone_freq_file,
+        OutSNV=OutSNV,
+        OutTree=OutTree,
+        target_dir=target_dir,
+    )
+    print("Meltos input file created.")
+    print(f"SNV file to be used for Meltos is: {OutSNV}")
+
+    SampC = load_SampC(SNV, target_dir)
+    order_verification(SV, OutSNV)
+
+    return run_meltos(OutSNV, SV, OutTree, SampC, target_dir, tools_dir, meltos_mode)
+
+
+def meltos_plot_stage(target_dir, SV, driver_file, input_file_base_name):
+    plot_meltos(
+        target_dir,
+        SV,
+        driver_file,
+        input_file_base_name,
+        debug_tsv=bool(os.environ.get("GENOPATH_DEBUG_TSV")),
+    )
+
+
+def add_normal_column(presence_file, output_file):
+    return load_clone_frequencies(presence_file).with_normal().write(output_file)
+
+
+def heatmap_stage(clone_tree_file, tumor_tree_file, presence_file, presence_normal_file, output):
+    add_normal_column(presence_file, presence_normal_file)
+    plot_heatmap(clone_tree_file, tumor_tree_file, presence_normal_file, output)
+    print("Heatmap plotted successfully...")
+
+
+def clone_tumor_tree_stage(
+    presence_normal_file, clone_tree_file, tumor_tree_file, clone_path, tumor_path
+):
+    presence_normal = load_clone_frequencies(presence_normal_file)
+    clone_tree(presence_normal, clone_tree_file, clone_path)
+    tumor_tree(presence_normal, tumor_tree_file, tumor_path)
+    print("Clone, Tumor Phylo Tree vs Presence Matrix Plotted Successfully...")
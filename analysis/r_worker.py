@@ -0,0 +1,121 @@
+import os
+import time
+import atexit
+import threading
+import subprocess
+
+
+current_script_dir = os.path.dirname(os.path.realpath(__file__))
+parent_dir = os.path.dirname(current_script_dir)
+WORKER_SCRIPT = os.path.join(parent_dir, "r_scripts", "worker.R")
+SENTINEL = "__GENOPATH_R_DONE__"
+
+_worker = None
+
+
+class RScriptError(subprocess.CalledProcessError):
+    pass
+
+
+class RWorker:
+    """A single ``Rscript`` process that runs R scripts as jobs.
+
+    ape and picante are loaded once when the worker starts; each job then
+    sources its script with ``commandArgs()`` bound to the job arguments.
+    """
+
+    def __init__(self, rscript="Rscript"):
+        self.rscript = rscript
+        self.process = None
+        self.call_timings = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.process is not None and self.process.poll() is None:
+            return
+        # No --vanilla: like the per-call Rscript runs it replaces, the worker
+        # reads .Renviron and .Rprofile, where R library paths are often set.
+        self.process = subprocess.Popen(
+            [self.rscript, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        print(f"Started R worker (pid {self.process.pid})")
+
+    def run(self, script_path, *args):
+        # One job at a time: stages running in threads share the worker.
+        with self.lock:
+            return self._run(script_path, *args)
+
+    def _run(self, script_path, *args):
+        self.start()
+        fields = [script_path] + list(map(str, args))
+        command = ["Rscript"] + fields
+        started = time.time()
+        self.process.stdin.write("\t".join(fields) + "\n")
+        self.process.stdin.flush()
+
+        output = []
+        for line in self.process.stdout:
+            if SENTINEL in line:
+                done = line[line.index(SENTINEL):].rstrip("\n").split("\t")
+                status, r_elapsed = done[1], done[2]
+                message = "\t".join(done[3:])
+                break
+            output.append(line)
+        else:
+            self.process.wait()
+            self.process = None
+            status, r_elapsed, message = "crashed", None, "R worker exited unexpectedly"
+
+        elapsed = time.time() - started
+        self.call_timings.append(
+            {
+                "script": os.path.basename(script_path),
+                "status": status,
+                "elapsed_seconds": round(elapsed, 3),
+                "r_elapsed_seconds": float(r_elapsed) if r_elapsed else None,
+            }
+        )
+        print(f"[R] {os.path.basename(script_path)}: {status} in {elapsed:.1f}s")
+
+        stdout = "".join(output)
+        if status != "ok":
+            raise RScriptError(1, command, output=stdout, stderr=message)
+        return stdout
+
+    def pop_call_timings(self):
+        timings, self.call_timings = self.call_timings, []
+        return timings
+
+    def close(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+        self.process = None
+
+
+def get_worker():
+    global _worker
+    if _worker is None:
+        _worker = RWorker(os.environ.get("GENOPATH_RSCRIPT", "Rscript"))
+        atexit.register(_worker.close)
+    return _worker
+
+
+def run_r_script(script_path, *args):
+    return get_worker().run(script_path, *args)
+
+
+def pop_r_call_timings():
+    if _worker is None:
+        return []
+    return _worker.pop_call_timings()
@@ -0,0 +1,211 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+from analysis.stage_graph import CACHE_DIR_NAME, hash_file
+from analysis.input_validation import (
+    REQUIRED_COLUMNS,
+    check_counts,
+    check_header,
+    depth_summary,
+)
+
+
+READ_COUNTS_DIR = "read_counts"
+CHUNK_ROWS = 100000
+TEXT_COLUMNS = ["Wild", "Mutant", "Trinucletide"]
+
+_counts_memo = {}
+
+
+class ReadCounts:
+    """Columnar view of a CloneFinder read-count table.
+
+    Every column is a NumPy array; ``ref`` and ``alt`` are (samples x rows)
+    so each sample's counts are contiguous. When loaded from the target
+    directory cache the arrays are read-only memory maps.
+    """
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.samples = meta["samples"]
+        self.chrom_names = meta["chrom_names"]
+        self.summary = meta["summary"]
+        self.arrays = arrays
+
+    def __len__(self):
+        return self.summary["rows"]
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    @property
+    def chrom(self):
+        return np.asarray(self.chrom_names, dtype=object)[self.arrays["CHR"]]
+
+    @property
+    def position(self):
+        return self.arrays["Position"]
+
+    @property
+    def ref(self):
+        return self.arrays["ref"]
+
+    @property
+    def alt(self):
+        return self.arrays["alt"]
+
+
+def locate_bad_count(input_file, count_cols, chunksize=CHUNK_ROWS):
+    rows = 0
+    for chunk in pd.read_csv(
+        input_file, sep="\t", usecols=count_cols, dtype=str, chunksize=chunksize
+    ):
+        values = chunk[count_cols].apply(pd.to_numeric, errors="coerce").to_numpy(float)
+        check_counts(values, count_cols, rows, input_file)
+        rows += len(chunk)
+
+
+def read_chunks(input_file, count_cols, chunksize=CHUNK_ROWS):
+    dtypes = {col: float for col in count_cols}
+    dtypes.update({col: str for col in ["CHR"] + TEXT_COLUMNS})
+    try:
+        yield from pd.read_csv(
+            input_file,
+            sep="\t",
+            usecols=list(dtypes),
+            dtype=dtypes,
+            chunksize=chunksize,
+        )
+    except ValueError:
+        # A count that is not a number: re-read as text to report where it is.
+        locate_bad_count(input_file, count_cols, chunksize)
+        raise
+
+
+def parse_read_counts(input_file, chunksize=CHUNK_ROWS):
+    """Validate ``input_file`` and convert it to columns in one chunked pass."""
+    header = pd.read_csv(input_file, sep="\t", nrows=0).columns.tolist()
+    samples = check_header(header, input_file)
+    ref_cols = [f"{sample}:ref" for sample in samples]
+    alt_cols = [f"{sample}:alt" for sample in samples]
+    count_cols = ["Position"] + ref_cols + alt_cols
+
+    chrom_codes = {}
+    parts = {name: [] for name in ["CHR", "Position", "ref", "alt"] + TEXT_COLUMNS}
+    rows = 0
+    for chunk in read_chunks(input_file, count_cols, chunksize):
+        values = chunk[count_cols].to_numpy(float)
+        check_counts(values, count_cols, rows, input_file)
+        rows += len(chunk)
+
+        names, inverse = np.unique(
+            chunk["CHR"].fillna("").to_numpy(dtype=str), return_inverse=True
+        )
+        codes = np.array(
+            [chrom_codes.setdefault(name, len(chrom_codes)) for name in names],
+            dtype=np.int32,
+        )
+        parts["CHR"].append(codes[inverse.reshape(-1)])
+        parts["Position"].append(values[:, 0].astype(np.int64))
+        parts["ref"].append(values[:, 1:1 + len(samples)].T.astype(np.int64))
+        parts["alt"].append(values[:, 1 + len(samples):].T.astype(np.int64))
+        for col in TEXT_COLUMNS:
+            parts[col].append(chunk[col].fillna("").to_numpy(dtype=str).astype("S"))
+
+    if rows == 0:
+        raise ValueError(f"Input file {input_file} has no mutation rows.")
+
+    arrays = {
+        name: np.ascontiguousarray(np.concatenate(chunks, axis=-1))
+        for name, chunks in parts.items()
+    }
+    meta = {
+        "source": os.path.abspath(input_file),
+        "samples": samples,
+        "chrom_names": list(chrom_codes),
+        "columns": list(arrays),
+        "summary": depth_summary(samples, arrays["ref"], arrays["alt"]),
+    }
+    return ReadCounts(meta, arrays)
+
+
+def read_counts_dir(target_dir, file_hash):
+    return os.path.join(target_dir, CACHE_DIR_NAME, READ_COUNTS_DIR, file_hash)
+
+
+def save_read_counts(counts, cache_dir):
+    # Written to a scratch directory and moved into place, so a reader never
+    # sees a half-written cache. Older conversions of the same input are pruned.
+    parent = os.path.dirname(cache_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = f"{cache_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in counts.arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as file:
+        json.dump(counts.meta, file, indent=2)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if path == cache_dir or ".tmp" in name:
+            continue
+        try:
+            with open(os.path.join(path, "meta.json"), "r") as file:
+                stale = json.load(file)["source"] == counts.meta["source"]
+        except (OSError, ValueError, KeyError):
+            stale = True
+        if stale:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def open_read_counts(cache_dir):
+    with open(os.path.join(cache_dir, "meta.json"), "r") as file:
+        meta = json.load(file)
+    arrays = {
+        name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+        for name in meta["columns"]
+    }
+    return ReadCounts(meta, arrays)
+
+
+def load_read_counts(input_file, target_dir=None):
+    """Return the validated columnar read counts of ``input_file``.
+
+    The table is parsed once per content hash. With ``target_dir`` the
+    columns are kept as ``.npy`` files under ``<target_dir>/.genopath/
+    read_counts/<sha256>/`` and later calls memory-map them instead of
+    parsing the text again.
+    """
+    file_hash = hash_file(input_file)
+    if file_hash in _counts_memo:
+        return _counts_memo[file_hash]
+
+    if target_dir is None:
+        counts = parse_read_counts(input_file)
+    else:
+        cache_dir = read_counts_dir(target_dir, file_hash)
+        try:
+            counts = open_read_counts(cache_dir)
+        except (OSError, ValueError, KeyError):
+            counts = parse_read_counts(input_file)
+            save_read_counts(counts, cache_dir)
+            counts = open_read_counts(cache_dir)
+            summary = counts.summary
+            print(
+                f"Input File is Valid: {summary['rows']} mutations, "
+                f"{len(summary['samples'])} samples"
+            )
+
+    _counts_memo[file_hash] = counts
+    return counts
+
+
+def summarize_input(input_file, target_dir=None):
+    """Validate ``input_file`` (once per content) and return its summary."""
+    return load_read_counts(input_file, target_dir).summary
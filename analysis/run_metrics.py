@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+from datetime import datetime
+
+from analysis.r_worker import pop_r_call_timings
+from analysis.meltos_worker import pop_meltos_call_timings
+
+try:
+    import resource
+except ImportError:  # resource is not available on Windows
+    resource = None
+
+
+RUN_METRICS_FILE = "run_metrics.json"
+
+
+def timestamp(seconds=None):
+    return datetime.fromtimestamp(seconds or time.time()).isoformat(timespec="seconds")
+
+
+def _maxrss_mb(who):
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere.
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(maxrss / divisor, 1)
+
+
+def peak_rss():
+    if resource is None:
+        return None, None
+    return _maxrss_mb(resource.RUSAGE_SELF), _maxrss_mb(resource.RUSAGE_CHILDREN)
+
+
+def rose(before, after):
+    if before is None or after is None:
+        return None
+    return after > before
+
+
+def timed_call(func, kwargs):
+    """Call ``func(**kwargs)`` and return its timing and peak memory record.
+
+    getrusage only reports the high-water mark since the process started, of
+    the calling process and of its largest finished subprocess (CloneFinder,
+    PathFinder, Rscript, java ...). Both are recorded as process peaks, with
+    whether this stage raised them; an earlier, heavier stage in the same
+    process otherwise shows up in every later stage's figure.
+    """
+    rss_before, child_rss_before = peak_rss()
+    start = time.time()
+    func(**kwargs)
+    end = time.time()
+    peak_rss_mb, peak_child_rss_mb = peak_rss()
+    metrics = {
+        "start": timestamp(start),
+        "end": timestamp(end),
+        "elapsed_seconds": round(end - start, 3),
+        "process_peak_rss_mb": peak_rss_mb,
+        "process_peak_child_rss_mb": peak_child_rss_mb,
+        "stage_raised_peak_rss": rose(rss_before, peak_rss_mb),
+        "stage_raised_peak_child_rss": rose(child_rss_before, peak_child_rss_mb),
+    }
+    r_calls = pop_r_call_timings()
+    if r_calls:
+        metrics["r_calls"] = r_calls
+    meltos_calls = pop_meltos_call_timings()
+    if meltos_calls:
+        metrics["meltos_calls"] = meltos_calls
+    return metrics
+
+
+class RunMetrics:
+    def __init__(self, target_dir, total_stages, jobs=1):
+        self.path = os.path.join(target_dir, RUN_METRICS_FILE)
+        self.total_stages = total_stages
+        self.jobs = jobs
+        self.started = time.time()
+        self.stages = []
+
+    def record(self, name, status, metrics=None):
+        entry = {"stage": name, "status": status}
+        entry.update(metrics or {})
+        self.stages.append(entry)
+
+        elapsed = entry.get("elapsed_seconds")
+        timing = f" in {elapsed:.1f}s" if elapsed is not None else ""
+        print(
+            f"[PROGRESS] {len(self.stages)}/{self.total_stages} {name}: {status}{timing}"
+        )
+        self.write()
+
+    def write(self):
+        now = time.time()
+        run_log = {
+            "started": timestamp(self.started),
+            "updated": timestamp(now),
+            "elapsed_seconds": round(now - self.started, 3),
+            "jobs": self.jobs,
+            "total_stages": self.total_stages,
+            "stages": self.stages,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(run_log, file, indent=2)
+        os.replace(tmp_path, self.path)
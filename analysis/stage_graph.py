@@ -0,0 +1,267 @@
+import os
+import glob
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from analysis.run_metrics import RunMetrics, timed_call
+
+
+CACHE_DIR_NAME = ".genopath"
+STAGE_CACHE_FILE = "stage_cache.json"
+
+_file_hash_memo = {}
+
+
+class Stage:
+    """One node of the pipeline graph.
+
+    ``inputs`` and ``outputs`` are file or directory paths (entries containing
+    ``*`` are treated as glob patterns).  The stage is keyed by the content of
+    its inputs together with ``kwargs``, so it is skipped when neither changed
+    since the last successful run and all of its outputs are still present.
+    ``local`` stages always run in the calling process, also with ``jobs`` > 1,
+    so they can use state that outlives the run, such as the Meltos JVM.
+    """
+
+    def __init__(self, name, func, kwargs=None, inputs=(), outputs=(), deps=(),
+                 local=False):
+        self.name = name
+        self.func = func
+        self.kwargs = kwargs or {}
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.local = local
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={self.deps!r})"
+
+
+def expand_paths(paths):
+    expanded = []
+    for path in paths:
+        if "*" in path:
+            expanded.extend(sorted(glob.glob(path)))
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def hash_file(path, chunk_size=1 << 20):
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _file_hash_memo:
+        return _file_hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    file_hash = digest.hexdigest()
+    _file_hash_memo[memo_key] = file_hash
+    return file_hash
+
+
+def hash_path(path):
+    if os.path.isfile(path):
+        return hash_file(path)
+    if os.path.isdir(path):
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(hash_file(file_path).encode())
+        return digest.hexdigest()
+    return "missing"
+
+
+def stage_key(stage):
+    payload = {
+        "stage": stage.name,
+        "kwargs": stage.kwargs,
+        "inputs": {path: hash_path(path) for path in expand_paths(stage.inputs)},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def outputs_exist(stage):
+    for path in stage.outputs:
+        if "*" in path:
+            if not glob.glob(path):
+                return False
+        elif not os.path.exists(path):
+            return False
+    return True
+
+
+def stage_cache_path(target_dir):
+    return os.path.join(target_dir, CACHE_DIR_NAME, STAGE_CACHE_FILE)
+
+
+def load_stage_cache(target_dir):
+    cache_path = stage_cache_path(target_dir)
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable stage cache {cache_path}: {e}")
+        return {}
+
+
+def save_stage_cache(target_dir, cache):
+    cache_path = stage_cache_path(target_dir)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(cache, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+
+def order_stages(stages):
+    by_name = {stage.name: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("Stage names must be unique.")
+
+    ordered = []
+    state = {}
+
+    def visit(stage):
+        if state.get(stage.name) == "done":
+            return
+        if state.get(stage.name) == "visiting":
+            raise ValueError(f"Cycle detected in stage graph at '{stage.name}'")
+        state[stage.name] = "visiting"
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+            visit(by_name[dep])
+        state[stage.name] = "done"
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+def is_stage_current(stage, cache):
+    return cache.get(stage.name) == stage_key(stage) and outputs_exist(stage)
+
+
+def record_failure(stage, cache, results, target_dir, run_metrics):
+    # A failed stage is never current, even if outputs of an earlier run remain.
+    cache.pop(stage.name, None)
+    save_stage_cache(target_dir, cache)
+    results[stage.name] = "failed"
+    run_metrics.record(stage.name, "failed")
+
+
+def record_stage(stage, cache, results, target_dir, run_metrics, metrics):
+    # Only called for stages that returned; tools that exit with an error
+    # raise (see ToolRun.check), so their stale outputs are not cached.
+    if outputs_exist(stage):
+        # Re-key after the run: some stages normalise their inputs in place.
+        cache[stage.name] = stage_key(stage)
+        results[stage.name] = "ran"
+    else:
+        cache.pop(stage.name, None)
+        results[stage.name] = "incomplete"
+        print(f"[WARNING] {stage.name} did not produce all declared outputs.")
+    save_stage_cache(target_dir, cache)
+    run_metrics.record(stage.name, results[stage.name], metrics)
+
+
+def run_stage_graph(stages, target_dir, use_cache=True, jobs=1):
+    """Run ``stages`` in dependency order, skipping the ones that are current.
+
+    With ``jobs`` > 1, stages whose dependencies have finished are dispatched
+    to a process pool, so independent branches of the graph run concurrently.
+    Local stages run in this process once the ready pool stages have been
+    dispatched. They are not run on a thread: a tool started from a thread
+    while the pool forks its workers can hang on pipes the workers inherit.
+    """
+    ordered = order_stages(stages)
+    cache = load_stage_cache(target_dir) if use_cache else {}
+    results = {}
+    run_metrics = RunMetrics(target_dir, len(ordered), jobs)
+
+    if jobs <= 1:
+        for stage in ordered:
+            if use_cache and is_stage_current(stage, cache):
+                print(f"[CACHE] {stage.name}: inputs unchanged, skipping.")
+                results[stage.name] = "cached"
+                run_metrics.record(stage.name, "cached")
+                continue
+
+            print(f"\n----- Running {stage.name} -----\n")
+            try:
+                metrics = timed_call(stage.func, stage.kwargs)
+            except Exception:
+                record_failure(stage, cache, results, target_dir, run_metrics)
+                raise
+            record_stage(stage, cache, results, target_dir, run_metrics, metrics)
+        return results
+
+    pending = list(ordered)
+    running = {}
+    failure = None
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            local_ready = []
+            if failure is None:
+                for stage in list(pending):
+                    if any(dep not in results for dep in stage.deps):
+                        continue
+                    pending.remove(stage)
+                    if use_cache and is_stage_current(stage, cache):
+                        print(f"[CACHE] {stage.name}: inputs unchanged, skipping.")
+                        results[stage.name] = "cached"
+                        run_metrics.record(stage.name, "cached")
+                        continue
+
+                    if stage.local:
+                        local_ready.append(stage)
+                        continue
+
+                    print(f"\n----- Running {stage.name} -----\n")
+                    future = executor.submit(timed_call, stage.func, stage.kwargs)
+                    running[future] = stage
+
+            for stage in local_ready:
+                print(f"\n----- Running {stage.name} -----\n")
+                try:
+                    metrics = timed_call(stage.func, stage.kwargs)
+                except Exception as e:
+                    print(f"[ERROR] {stage.name} failed: {e}")
+                    record_failure(stage, cache, results, target_dir, run_metrics)
+                    failure = failure or e
+                    continue
+                record_stage(stage, cache, results, target_dir, run_metrics, metrics)
+            if local_ready:
+                # Stages that depended on them may be ready now.
+                continue
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    metrics = future.result()
+                except Exception as e:
+                    print(f"[ERROR] {stage.name} failed: {e}")
+                    record_failure(stage, cache, results, target_dir, run_metrics)
+                    failure = failure or e
+                    continue
+                record_stage(stage, cache, results, target_dir, run_metrics, metrics)
+
+    if failure is not None:
+        raise failure
+    return results
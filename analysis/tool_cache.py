@@ -0,0 +1,146 @@
+import os
+import stat
+import shutil
+import tempfile
+import subprocess
+
+TOOL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "genopath", "tools")
+
+_checkouts = {}
+
+
+def tool_cache_dir():
+    return os.environ.get("GENOPATH_TOOL_CACHE") or TOOL_CACHE_DIR
+
+
+def is_offline():
+    return os.environ.get("GENOPATH_OFFLINE", "").lower() not in ("", "0", "false", "no")
+
+
+def tool_env(name, key):
+    return os.environ.get(f"GENOPATH_{name.upper()}_{key}")
+
+
+def tool_url(name, repo_url):
+    # GENOPATH_<NAME>_URL points a tool at a mirror or a local bare repository.
+    return tool_env(name, "URL") or repo_url
+
+
+def pin_tool(name, commit):
+    os.environ[f"GENOPATH_{name.upper()}_COMMIT"] = commit
+
+
+def pointer_path(name):
+    return os.path.join(tool_cache_dir(), f"{name}.commit")
+
+
+def read_pointer(name):
+    if not os.path.exists(pointer_path(name)):
+        return None
+    with open(pointer_path(name), "r") as file:
+        return file.read().strip() or None
+
+
+def write_pointer(name, commit):
+    tmp_path = pointer_path(name) + f".{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(commit + "\n")
+    os.replace(tmp_path, pointer_path(name))
+
+
+def resolve_commit(url, ref="HEAD"):
+    result = subprocess.run(
+        ["git", "ls-remote", url, ref], capture_output=True, text=True
+    )
+    lines = result.stdout.split()
+    if result.returncode != 0 or not lines:
+        return None
+    return lines[0]
+
+
+def make_read_only(checkout):
+    # Files only: directories stay writable so cache entries can be removed.
+    for root, dirs, files in os.walk(checkout):
+        if ".git" in dirs:
+            dirs.remove(".git")
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            if not os.path.islink(path):
+                mode = os.stat(path).st_mode
+                os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def checkout_commit(name, url, commit, dest):
+    """Clone ``url`` at ``commit`` into ``dest``, which appears atomically.
+
+    The checked-out files are made read-only, since every run shares them.
+    """
+    scratch = tempfile.mkdtemp(prefix=f".{name}-", dir=os.path.dirname(dest))
+    try:
+        subprocess.run(["git", "clone", "--quiet", url, scratch], check=True)
+        subprocess.run(
+            ["git", "-C", scratch, "checkout", "--quiet", "--detach", commit], check=True
+        )
+        make_read_only(scratch)
+        try:
+            os.replace(scratch, dest)
+        except OSError:
+            # Another process populated the same commit first.
+            if not os.path.isdir(dest):
+                raise
+    finally:
+        if os.path.isdir(scratch):
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def cached_tool(name, repo_url, ref="HEAD"):
+    """Return the shared checkout of ``name``, ``<cache>/<name>@<commit>``.
+
+    The commit is ``GENOPATH_<NAME>_COMMIT`` if set, otherwise what ``ref``
+    currently points to upstream. Each commit is cloned once and then only
+    read by runs. Offline (``GENOPATH_OFFLINE=1``), or when the remote cannot
+    be reached, the commit last fetched into the cache is used.
+    """
+    url = tool_url(name, repo_url)
+    key = (tool_cache_dir(), name, url, ref, tool_env(name, "COMMIT"))
+    if key in _checkouts:
+        return _checkouts[key]
+
+    cache_dir = tool_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    commit = tool_env(name, "COMMIT")
+    if commit is None and not is_offline():
+        commit = resolve_commit(url, ref)
+        if commit is None:
+            print(f"Could not reach {url}; using the cached {name} checkout.")
+    if commit is None:
+        commit = read_pointer(name)
+    if commit is None:
+        raise RuntimeError(
+            f"No cached {name} checkout in {cache_dir}. Run `genopath.py tools` "
+            f"online once, or set GENOPATH_{name.upper()}_URL to a local repository."
+        )
+
+    checkout = os.path.join(cache_dir, f"{name}@{commit}")
+    if not os.path.isdir(checkout):
+        if is_offline():
+            raise RuntimeError(f"{name}@{commit} is not in the tool cache {cache_dir}.")
+        print(f"Fetching {name}@{commit[:12]} into {cache_dir}...")
+        checkout_commit(name, url, commit, checkout)
+    write_pointer(name, commit)
+    _checkouts[key] = checkout
+    return checkout
+
+
+def tool_checkout(name, repo_url, tools_dir=None):
+    """Return the directory to run ``name`` from.
+
+    With an explicit ``tools_dir`` the tool is cloned into
+    ``<tools_dir>/<name>`` as before; otherwise the shared cache is used.
+    """
+    if tools_dir is None:
+        return cached_tool(name, repo_url)
+    clone_dir = os.path.join(os.path.abspath(tools_dir), name)
+    if not os.path.isdir(clone_dir):
+        subprocess.run(["git", "clone", tool_url(name, repo_url), clone_dir], check=True)
+    return clone_dir
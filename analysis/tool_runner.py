@@ -0,0 +1,180 @@
+import os
+import glob
+import stat
+import shutil
+import tempfile
+import subprocess
+
+from analysis.stage_graph import CACHE_DIR_NAME
+
+SCRATCH_DIR_NAME = "scratch"
+
+
+class ToolRunError(RuntimeError):
+    pass
+
+
+class ToolRun:
+    """One tool invocation: its scratch directory, exit code and collected outputs.
+
+    ``outputs`` maps each declared output pattern to the paths it was moved to.
+    """
+
+    def __init__(self, name, scratch_dir, returncode, outputs):
+        self.name = name
+        self.scratch_dir = scratch_dir
+        self.returncode = returncode
+        self.outputs = outputs
+
+    def output(self, pattern):
+        paths = self.outputs.get(pattern, [])
+        return paths[0] if paths else None
+
+    def check(self):
+        """Return the run, or raise ``ToolRunError`` if the tool failed."""
+        if self.returncode != 0:
+            raise ToolRunError(
+                f"{self.name} exited with code {self.returncode}; "
+                f"see {self.scratch_dir}"
+            )
+        return self
+
+
+def link_or_copy(src, dest):
+    # Symlinks are cheap but need extra privileges on Windows; copy there.
+    try:
+        os.symlink(src, dest, target_is_directory=os.path.isdir(src))
+    except (OSError, NotImplementedError):
+        if os.path.isdir(src):
+            shutil.copytree(src, dest)
+        else:
+            shutil.copy2(src, dest)
+
+
+def copy_writable(src, dest):
+    shutil.copy2(src, dest)
+    os.chmod(dest, os.stat(dest).st_mode | stat.S_IWUSR)
+
+
+def make_scratch_dir(name, target_dir, tool_dir=None):
+    """Create a private working directory for one run of ``name``.
+
+    The tool finds its scripts and data files relative to its working
+    directory. Top-level files of the checkout are linked into it and its
+    directories are copied, so whatever the tool writes, including into its
+    own subdirectories, stays private to this run and never reaches the
+    checkout, which may be shared through the tool cache.
+    """
+    # Absolute, because the tool runs with the scratch directory as its cwd
+    # and the links into the checkout must not depend on where we were.
+    scratch_root = os.path.join(os.path.abspath(target_dir), CACHE_DIR_NAME, SCRATCH_DIR_NAME)
+    os.makedirs(scratch_root, exist_ok=True)
+    scratch_dir = tempfile.mkdtemp(prefix=f"{name}-", dir=scratch_root)
+    if tool_dir is not None:
+        tool_dir = os.path.abspath(tool_dir)
+        for entry in os.listdir(tool_dir):
+            if entry == ".git":
+                continue
+            src, dest = os.path.join(tool_dir, entry), os.path.join(scratch_dir, entry)
+            if os.path.isdir(src) and not os.path.islink(src):
+                shutil.copytree(src, dest, symlinks=True, copy_function=copy_writable)
+            else:
+                link_or_copy(src, dest)
+    return scratch_dir
+
+
+def list_entries(scratch_dir):
+    return {entry.name: entry.stat(follow_symlinks=False).st_mtime_ns
+            for entry in os.scandir(scratch_dir)}
+
+
+def collect_outputs(scratch_dir, outputs, target_dir, staged_entries):
+    # Only entries the tool created or rewrote count as outputs, so files
+    # shipped with the checkout or staged as inputs are never collected.
+    collected = {}
+    for pattern, dest_name in outputs.items():
+        collected[pattern] = []
+        for src in sorted(glob.glob(os.path.join(scratch_dir, pattern))):
+            name = os.path.basename(src)
+            if os.path.islink(src) or staged_entries.get(name) == os.lstat(src).st_mtime_ns:
+                continue
+            dest = os.path.join(target_dir, dest_name or os.path.basename(src))
+            if os.path.isdir(dest) and not os.path.islink(dest):
+                shutil.rmtree(dest)
+            elif os.path.lexists(dest):
+                os.remove(dest)
+            shutil.move(src, dest)
+            collected[pattern].append(dest)
+            if dest_name:
+                break
+    return collected
+
+
+def stage_inputs(scratch_dir, inputs):
+    # Inputs are staged under their own names, so two inputs with the same
+    # name, or an input named like a file of the checkout, cannot both be
+    # there; the tool would silently read the wrong one.
+    staged = {}
+    sources = {}
+    for key, path in inputs.items():
+        path = os.path.abspath(path)
+        entry = os.path.basename(path)
+        staged[key] = os.path.join(scratch_dir, entry)
+        if sources.get(entry) == path:
+            continue
+        if entry in sources:
+            raise ValueError(
+                f"Inputs {sources[entry]} and {path} have the same name {entry!r}."
+            )
+        if os.path.lexists(staged[key]):
+            raise ValueError(f"Input {path} has the same name as the tool's own {entry!r}.")
+        link_or_copy(path, staged[key])
+        sources[entry] = path
+    return staged
+
+
+def run_tool(name, command, target_dir, tool_dir=None, inputs=None, outputs=None,
+             runner=None):
+    """Run ``command`` for ``name`` in a private scratch directory.
+
+    ``inputs`` maps placeholders to files that are staged into the scratch
+    directory; ``{placeholder}`` and ``{scratch_dir}`` in ``command`` are
+    replaced by the staged paths. Tools that write next to their input or
+    into their working directory therefore write into the scratch directory,
+    and concurrent runs never share a working directory. ``outputs`` maps
+    glob patterns, relative to the scratch directory, to a file name in
+    ``target_dir`` (None keeps the name); after a successful run, matches are
+    moved there. A failed run's partial outputs are never collected, so they
+    cannot be mistaken for results.
+
+    Inputs must have distinct names that are not already used by the tool
+    checkout; a ``ValueError`` is raised otherwise.
+
+    ``runner(command, cwd)`` replaces ``subprocess.run`` and returns the exit
+    code. The scratch directory is removed after a successful run and kept
+    for inspection after a failed one.
+    """
+    target_dir = os.path.abspath(target_dir)
+    scratch_dir = make_scratch_dir(name, target_dir, tool_dir)
+    try:
+        staged = stage_inputs(scratch_dir, inputs or {})
+    except ValueError:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        raise
+    staged["scratch_dir"] = scratch_dir
+    staged_entries = list_entries(scratch_dir)
+    command = [arg.format(**staged) if "{" in arg else arg for arg in map(str, command)]
+
+    if runner is None:
+        returncode = subprocess.run(command, cwd=scratch_dir).returncode
+    else:
+        returncode = runner(command, scratch_dir)
+
+    if returncode == 0:
+        collected = collect_outputs(scratch_dir, outputs or {}, target_dir, staged_entries)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    else:
+        collected = {pattern: [] for pattern in outputs or {}}
+        print(f"{name} exited with code {returncode}; no outputs were collected and its "
+              f"working files are kept in {scratch_dir}")
+    return ToolRun(name, scratch_dir, returncode, collected)
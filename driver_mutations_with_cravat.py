@@ -1,163 +1,268 @@
 import subprocess
-import requests
-import requests
-import time
 import os
-import zipfile
+import time
 import csv
+import sqlite3
 import pandas as pd
 import warnings
 from analysis.cancer_dict import cancer_types_dict
-import glob
 import argparse
 
+CRAVAT_REFERENCE = "hg38"
+DRIVER_PVALUE_CUTOFF = 0.05
+CRAVAT_CACHE = os.environ.get(
+    "GENOPATH_CRAVAT_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "genopath", "cravat_annotations.sqlite"),
+)
 
-def convert_to_open_cravat_format(input_file_path, output_file_path):
-    proceed_with_conversion = True
-
-    with open(input_file_path, "r") as input_file:
-        input_file.readline()
-        for line in input_file:
-            fields = line.strip().split("\t")
-            if len(fields) > 3 and fields[3] == "+":
-                proceed_with_conversion = False
-                break
-
-    if proceed_with_conversion:
-        with open(input_file_path, "r") as input_file, open(
-            output_file_path, "w"
-        ) as output_file:
-            header = input_file.readline().strip().split("\t")
-
-            chr_index = header.index("CHR") if "CHR" in header else header.index("chr")
-            pos_index = header.index("POS") if "POS" in header else header.index("pos")
-            ref_index = header.index("REF") if "REF" in header else header.index("ref")
-            alt_index = header.index("ALT") if "ALT" in header else header.index("alt")
-
-            line_number = 1
-            for line in input_file:
-                fields = line.strip().split("\t")
-                chr_val = fields[chr_index]
-                pos_val = fields[pos_index]
-                ref_val = fields[ref_index]
-                alt_val = fields[alt_index]
-
-                formatted_line = (
-                    f"{line_number}\t{chr_val}\t{pos_val}\t+\t{ref_val}\t{alt_val}\n"
-                )
-                output_file.write(formatted_line)
-                line_number += 1
-    else:
-        print("Conversion skipped due to '+' found in the fourth column of a line.")
+CACHE_TIMEOUT = 60
+CACHE_WRITE_ATTEMPTS = 5
 
+_module_versions = {}
 
-def run_cravat(input_file, cancer_type_input, output_dir):
-    print("Running Open-Cravat Analysis to Find Driver Mutations...")
-    time.sleep(2)
+
+def resolve_chasm_option(cancer_type_input):
     if cancer_type_input in cancer_types_dict.keys():
-        cancer_type = cancer_type_input
-        chasm_option = f"chasmplus_{cancer_type}"
-    elif cancer_type_input in cancer_types_dict.values():
+        return f"chasmplus_{cancer_type_input}"
+    if cancer_type_input in cancer_types_dict.values():
         cancer_type = {value: key for key, value in cancer_types_dict.items()}[
             cancer_type_input
         ]
-        chasm_option = f"chasmplus_{cancer_type}"
-    elif cancer_type_input is None or cancer_type_input.strip() == "":
-        cancer_type = "chasmplus"
-        chasm_option = "chasmplus"
-    else:
+        return f"chasmplus_{cancer_type}"
+    if cancer_type_input is not None and cancer_type_input.strip() != "":
         print(
             f"Invalid cancer type: {cancer_type_input}. Defaulting to pan-cancer analysis."
         )
-        cancer_type = "chasmplus"
-        chasm_option = "chasmplus"
-
-    print("Installing Open-Cravat Base Modules.")
-    subprocess.run(["oc", "module", "install-base"], check=True)
-    print("Installing Required Annotators")
-    subprocess.run(
-        ["oc", "module", "install", "vest", "pubmed", chasm_option], check=True
-    )
+    return "chasmplus"
+
+
+def ensure_cravat_modules(modules):
+    """Install whichever of ``modules`` are missing and return their versions.
+
+    Installed versions are read once per process from OpenCRAVAT's module
+    index, so repeated runs do not call ``oc module install`` again. Without
+    the ``cravat`` package importable, the modules are installed through
+    ``oc`` once per process and their version is recorded as "unknown".
+    """
+    missing = [module for module in modules if module not in _module_versions]
+    if not missing:
+        return {module: _module_versions[module] for module in modules}
+
+    try:
+        from cravat import admin_util
+    except ImportError:
+        admin_util = None
 
-    annotators_list = ["pubmed"]
-    if chasm_option != "chasmplus":
-        annotators_list.append(chasm_option)
+    if admin_util is None:
+        print("Installing Open-Cravat Base Modules.")
+        subprocess.run(["oc", "module", "install-base"], check=True)
+        print("Installing Required Annotators")
+        subprocess.run(["oc", "module", "install", "-y"] + missing, check=True)
+        _module_versions.update({module: "unknown" for module in missing})
     else:
-        annotators_list.append(chasm_option)
+        to_install = [m for m in missing if admin_util.get_local_module_info(m) is None]
+        if to_install:
+            print(f"Installing Open-Cravat modules: {' '.join(to_install)}")
+            subprocess.run(["oc", "module", "install-base"], check=True)
+            subprocess.run(["oc", "module", "install", "-y"] + to_install, check=True)
+            admin_util.mic.update_local()
+        for module in missing:
+            info = admin_util.get_local_module_info(module)
+            _module_versions[module] = str(info.version) if info else "unknown"
 
-    warnings.filterwarnings("ignore", category=SyntaxWarning)
-    command = (
-        ["oc", "run", input_file, "-l", "hg38", "-a"]
-        + annotators_list
-        + ["-t", "excel", "-d", output_dir]
+    return {module: _module_versions[module] for module in modules}
+
+
+def normalize_chrom(chrom):
+    chrom = str(chrom)
+    return chrom if chrom.startswith("chr") else "chr" + chrom
+
+
+def read_variants(input_file):
+    variants = pd.read_csv(input_file, sep="\t", dtype=str)
+    columns = {}
+    for name in ["chr", "pos", "ref", "alt"]:
+        matches = [c for c in variants.columns if c.lower() == name]
+        if not matches:
+            raise ValueError(f"Column '{name.upper()}' not found in {input_file}")
+        columns[matches[0]] = name
+    variants = variants[list(columns)].rename(columns=columns)
+    variants["chr"] = variants["chr"].map(normalize_chrom)
+    variants["pos"] = variants["pos"].astype(int)
+    return variants.drop_duplicates().reset_index(drop=True)
+
+
+def open_annotation_cache(cache_path=None):
+    cache_path = cache_path or CRAVAT_CACHE
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    # The cache is shared by concurrent runs: wait for other writers instead
+    # of failing, and let readers go on while one of them writes.
+    conn = sqlite3.connect(cache_path, timeout=CACHE_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS annotations (
+            chrom TEXT, pos INTEGER, ref TEXT, alt TEXT,
+            annotator TEXT, version TEXT, hugo TEXT, pval REAL,
+            PRIMARY KEY (chrom, pos, ref, alt, annotator, version)
+        )"""
     )
+    return conn
 
-    try:
-        subprocess.run(command, check=True)
-        print("OpenCravat analysis completed successfully.")
-    except subprocess.CalledProcessError as e:
-        print("An error occurred while running OpenCravat:", e)
-    except Exception as e:
-        print("A general error occurred:", e)
 
-    save_filtered_gene_pvalues_to_txt(chasm_option, input_file, output_dir)
+def cached_annotations(conn, variants, annotator, version):
+    """Return the cached rows for ``variants`` as a chr/pos/ref/alt/hugo/pval frame."""
+    conn.execute("DROP TABLE IF EXISTS temp.query")
+    conn.execute("CREATE TEMP TABLE query (chrom TEXT, pos INTEGER, ref TEXT, alt TEXT)")
+    conn.executemany(
+        "INSERT INTO temp.query VALUES (?, ?, ?, ?)",
+        variants[["chr", "pos", "ref", "alt"]].itertuples(index=False, name=None),
+    )
+    return pd.read_sql_query(
+        """SELECT q.chrom AS chr, q.pos AS pos, q.ref AS ref, q.alt AS alt,
+                  a.hugo AS hugo, a.pval AS pval
+           FROM temp.query q JOIN annotations a
+             ON a.chrom = q.chrom AND a.pos = q.pos AND a.ref = q.ref AND a.alt = q.alt
+           WHERE a.annotator = ? AND a.version = ?""",
+        conn,
+        params=(annotator, version),
+    )
+
 
+def store_annotations(conn, rows):
+    for attempt in range(1, CACHE_WRITE_ATTEMPTS + 1):
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or attempt == CACHE_WRITE_ATTEMPTS:
+                raise
+            print(f"Annotation cache is locked; retrying ({attempt}/{CACHE_WRITE_ATTEMPTS})...")
+            time.sleep(attempt)
+
+
+def write_cravat_input(variants, output_file_path):
+    with open(output_file_path, "w") as output_file:
+        for line_number, (chr_val, pos_val, ref_val, alt_val) in enumerate(
+            variants[["chr", "pos", "ref", "alt"]].itertuples(index=False, name=None),
+            start=1,
+        ):
+            output_file.write(
+                f"{line_number}\t{chr_val}\t{pos_val}\t+\t{ref_val}\t{alt_val}\n"
+            )
+
+
+def read_cravat_results(sqlite_path, annotator):
+    """Return the annotations in ``sqlite_path`` keyed by input line number.
+
+    OpenCRAVAT normalises indel alleles, so its chrom/pos/ref/alt do not
+    always match the submitted ones; the mapping table links each result
+    back to the line of the input file it came from.
+    """
+    with sqlite3.connect(sqlite_path) as conn:
+        results = pd.read_sql_query(
+            f"""SELECT m.base__original_line AS line, v.base__hugo AS hugo,
+                       v."{annotator}__pval" AS pval
+                FROM variant v JOIN mapping m ON m.base__uid = v.base__uid""",
+            conn,
+        )
+    results["line"] = results["line"].astype(int)
+    return results
+
+
+def annotate_new_variants(variants, annotator, output_dir, run_name):
+    input_path = os.path.join(output_dir, f"{run_name}.txt")
+    write_cravat_input(variants, input_path)
+
+    warnings.filterwarnings("ignore", category=SyntaxWarning)
+    command = [
+        "oc", "run", input_path, "-l", CRAVAT_REFERENCE, "-a", annotator,
+        "-n", run_name, "-d", output_dir,
+    ]
+    subprocess.run(command, check=True)
+    print("OpenCravat analysis completed successfully.")
+    return read_cravat_results(os.path.join(output_dir, f"{run_name}.sqlite"), annotator)
+
+
+def run_cravat(input_file, cancer_type_input, output_dir, output_txt_file=None,
+               cache_path=None):
+    """Write the CRAVAT driver table for the variants in ``input_file``.
+
+    Annotations are cached per variant and annotator version, so only
+    variants not seen before are sent through ``oc run``.
+    """
+    print("Running Open-Cravat Analysis to Find Driver Mutations...")
+    chasm_option = resolve_chasm_option(cancer_type_input)
+    version = ensure_cravat_modules([chasm_option])[chasm_option]
 
-def save_filtered_gene_pvalues_to_txt(chasm_option, input_file, output_dir):
-    formatted_chasm_option = chasm_option.replace("_", " ")
     input_file_basename = os.path.splitext(os.path.basename(input_file))[0]
-    excel_file_path = os.path.join(output_dir, f"{args.input_file}.xlsx")
-    output_txt_file = os.path.join(
+    output_txt_file = output_txt_file or os.path.join(
         output_dir, f"{input_file_basename}_cravat_drivers.txt"
     )
 
+    variants = read_variants(input_file)
+    conn = open_annotation_cache(cache_path)
     try:
-        df = pd.read_excel(excel_file_path, sheet_name="Variant", skiprows=1)
-        gene_pvalue_column = "P-value"
+        known = cached_annotations(conn, variants, chasm_option, version)
+        new = variants.merge(
+            known[["chr", "pos", "ref", "alt"]], how="left", indicator=True
+        )
+        new = new[new["_merge"] == "left_only"].drop(columns="_merge")
+        print(
+            f"{len(known)} of {len(variants)} variants already annotated by "
+            f"{chasm_option} {version}; submitting {len(new)}."
+        )
 
-        if gene_pvalue_column in df.columns:
-            df[gene_pvalue_column] = pd.to_numeric(
-                df[gene_pvalue_column], errors="coerce"
+        if len(new):
+            new = new.reset_index(drop=True)
+            new["line"] = new.index + 1
+            annotated = annotate_new_variants(
+                new, chasm_option, output_dir, f"{input_file_basename}_cravat"
             )
-            filtered_df = df[df[gene_pvalue_column] < 0.05].copy()
-
-            if (
-                "Ref Base" in filtered_df.columns
-                and "Alt Base" in filtered_df.columns
-                and "Chrom" in filtered_df.columns
-                and "Position" in filtered_df.columns
-            ):
-                filtered_df["Mutation Nucleotide Change"] = (
-                    filtered_df["Ref Base"].astype(str)
-                    + ">"
-                    + filtered_df["Alt Base"].astype(str)
-                )
-                filtered_df["Mutation Summary"] = (
-                    filtered_df["Chrom"].astype(str)
-                    + ":"
-                    + filtered_df["Position"].astype(str)
-                    + " "
-                    + filtered_df["Mutation Nucleotide Change"]
-                )
+            # Only variants OpenCRAVAT returned are cached; the rest are
+            # submitted again by the next run instead of being stored as misses.
+            annotated = new.merge(annotated, on="line").drop(columns="line")
+            print(f"OpenCRAVAT returned {len(annotated)} of {len(new)} submitted variants.")
+            store_annotations(
+                conn,
+                [
+                    (c, int(p), r, a, chasm_option, version,
+                     None if pd.isna(h) else h, None if pd.isna(v) else float(v))
+                    for c, p, r, a, h, v in annotated[
+                        ["chr", "pos", "ref", "alt", "hugo", "pval"]
+                    ].itertuples(index=False, name=None)
+                ],
+            )
+            known = pd.concat([known, annotated], ignore_index=True)
+    finally:
+        conn.close()
 
-                final_df = filtered_df[
-                    [
-                        "Gene",
-                        gene_pvalue_column,
-                        "Mutation Nucleotide Change",
-                        "Mutation Summary",
-                    ]
-                ].rename(columns={"Gene": "Driver Gene", gene_pvalue_column: "P-value"})
-
-                with open(output_txt_file, "w") as f:
-                    final_df.to_csv(f, sep="\t", index=False, header=True)
-                print(f"Filtered gene p-values saved to {output_txt_file}")
-            else:
-                print("Required columns for processing not found.")
-        else:
-            print(f"Column '{gene_pvalue_column}' not found in the Excel sheet.")
-    except FileNotFoundError:
-        print(f"File not found: {excel_file_path}")
+    annotations = variants.merge(known, how="left", on=["chr", "pos", "ref", "alt"])
+    save_filtered_gene_pvalues_to_txt(annotations, output_txt_file)
+    return output_txt_file
+
+
+def save_filtered_gene_pvalues_to_txt(annotations, output_txt_file):
+    pvalues = pd.to_numeric(annotations["pval"], errors="coerce")
+    drivers = annotations[pvalues < DRIVER_PVALUE_CUTOFF]
+    change = drivers["ref"].astype(str) + ">" + drivers["alt"].astype(str)
+    final_df = pd.DataFrame(
+        {
+            "Driver Gene": drivers["hugo"],
+            "P-value": pvalues[drivers.index],
+            "Mutation Nucleotide Change": change,
+            "Mutation Summary": drivers["chr"].astype(str)
+            + ":"
+            + drivers["pos"].astype(str)
+            + " "
+            + change,
+        }
+    )
+    final_df.to_csv(output_txt_file, sep="\t", index=False, header=True)
+    print(f"Filtered gene p-values saved to {output_txt_file}")
 
 
 if __name__ == "__main__":
@@ -171,7 +276,7 @@ if __name__ == "__main__":
         "-o",
         "--output_file",
         required=True,
-        help="Output file path for the conversion result.",
+        help="Output file path. The OpenCRAVAT run and the driver table are written to its directory.",
     )
     parser.add_argument(
         "-c",
@@ -185,5 +290,4 @@ if __name__ == "__main__":
     output_file_path = os.path.abspath(args.output_file)
     output_dir = os.path.dirname(output_file_path)
 
-    convert_to_open_cravat_format(input_file_path, output_file_path)
     run_cravat(input_file_path, args.cancer_type, output_dir)
@@ -13,59 +13,101 @@ Tested with R version: 4.3.0
 """
 
 import argparse
-import os
-import shutil
+import csv
 import glob
+import json
+import os
+import sys
+import time
 import subprocess
-import pandas as pd
-
-from analysis.helper_clonefinder import run_clonefinder, clone_git_repo
-from analysis.helper_pathfinder import run_pathfinder
-from analysis.helper_phylosignare import run_phylosignare
-from analysis.helper_picante import run_comdist, run_comdistnt, run_unifrac
-from analysis.makePhyloInput import makePhyloInput
-from analysis.general_helper import (
-    check_networkx_version,
-    process_clone_presence,
-    rename_hg19_to_normal,
-    delete_files,
-    t_,
-    check_input_file_columns
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from analysis.general_helper import check_networkx_version
+from analysis.driver_mutations import convert_to_cgi_format, fetch_cgi_batch
+from analysis.helper_meltos import meltos_result_path
+from analysis.meltos_worker import (
+    MELTOS_MODES,
+    close_workers,
+    close_workers_on_exit,
+    start_worker,
+)
+from analysis.stage_graph import (
+    CACHE_DIR_NAME,
+    Stage,
+    load_stage_cache,
+    run_stage_graph,
+    save_stage_cache,
 )
-from analysis.driver_mutations import (
-    run_cgi,
-    convert_to_cgi_format,
-    parse_csv_files,
-    process_driver_file,
-    match_positions,
+from analysis.pipeline_stages import (
+    prepare_tool_checkouts,
+    clonefinder_stage,
+    process_clonefinder_stage,
+    pathfinder_stage,
+    phylosignare_input_stage,
+    phylosignare_stage,
+    cgi_driver_stage,
+    cravat_driver_stage,
+    phylosignare_plot_stage,
+    picante_stage,
+    meltos_stage,
+    meltos_plot_stage,
+    heatmap_stage,
+    clone_tumor_tree_stage,
 )
-from plot_scripts.ps import run
 from r_packages_install.install_r_packages import (
     install_dSig,
     install_MutPat,
     install_QP,
 )
-from analysis.helper_meltos import load_SampC, run_meltos, order_verification
-from plot_scripts.meltos_plot import plot_meltos, find_most_recent_meltos_file
-from plot_scripts.hm_c_t import plot_heatmap
-from plot_scripts.CF_T_tree import clone_tree, tumor_tree
 
 # exclusively used to not download requirements if the pipeline is run >1 times #
 first_run_file = "first_run_done"
-if not os.path.exists(first_run_file):
-    subprocess.run(["pip", "install", "-r", "requirements.txt"], check=True)
 
-    check_networkx_version()
-
-    install_dSig()
-    install_MutPat()
-    install_QP()
-
-    with open(first_run_file, "w") as f:
-        f.write("First run completed.")
-    print("First-time setup completed.")
-else:
-    print("This is not the first run. Skipping setup operations.")
+GENOPATH_DIR = os.path.dirname(os.path.abspath(__file__))
+RUN_CONFIG_FILE = "run_config.json"
+RUN_CONFIG_PATH_ARGS = [
+    "target_dir",
+    "tools_dir",
+    "tool_cache",
+    "input_file",
+    "control_file",
+    "sv_file",
+    "driver_mutation_file",
+    "ref_alt_file",
+    "clonefinder_phylosig_input",
+    "pathfinder_input",
+]
+# Stages that only draw figures, with the plotting code each one depends on.
+# The sources are stage inputs, so editing a plot script re-renders its figures.
+PLOT_STAGE_SOURCES = {
+    "PhyloSignare_Plots": [
+        "plot_scripts/ps.py",
+        "plot_scripts/mut_func.py",
+        "plot_scripts/pie_func.py",
+        "plot_scripts/tree_func.py",
+        "plot_scripts/graph_layout.py",
+    ],
+    "Meltos_Plot": ["plot_scripts/meltos_plot.py", "plot_scripts/graph_layout.py"],
+    "Heatmap": ["plot_scripts/hm_c_t.py", "r_scripts/tree.R"],
+    "Clone_Tumor_Trees": ["plot_scripts/CF_T_tree.py"],
+}
+
+
+def first_time_setup():
+    if not os.path.exists(first_run_file):
+        subprocess.run(["pip", "install", "-r", "requirements.txt"], check=True)
+
+        check_networkx_version()
+
+        install_dSig()
+        install_MutPat()
+        install_QP()
+
+        with open(first_run_file, "w") as f:
+            f.write("First run completed.")
+        print("First-time setup completed.")
+    else:
+        print("This is not the first run. Skipping setup operations.")
 
 
 def parse_initial_arguments():
@@ -108,12 +150,36 @@ def parse_initial_arguments():
     parser.add_argument(
         "--tool",
         type=str,
-        choices=["CGI"],
-        help="Specify which driver mutation tool you would like to user. (CGI) ",
+        choices=["CGI", "CRAVAT"],
+        help="Specify which driver mutation tool you would like to user. (CGI, CRAVAT) ",
     )
     parser.add_argument("--email", type=str)
     parser.add_argument("--token", type=str)
     parser.add_argument("--cancer_type_input", type=str)
+    parser.add_argument(
+        "--picante_engine",
+        choices=["native", "R"],
+        default="native",
+        help="Compute comdist/comdistnt/UniFrac in-process (native) or with the picante R scripts (R).",
+    )
+    parser.add_argument(
+        "--tools_dir",
+        type=str,
+        default=None,
+        help="Clone CloneFinder/PathFinder/PhyloSignare/Meltos into this directory instead of using the shared tool cache.",
+    )
+    add_tool_cache_arguments(parser)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of independent stages (e.g. PathFinder, PhyloSignare, Picante) to run at the same time.",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Re-run every stage even if its inputs are unchanged since the last run.",
+    )
 
     args, remaining_argv = parser.parse_known_args()
     if "PhyloSignare" in args.run_process and args.driver_mutation_file is None:
@@ -127,13 +193,13 @@ def parse_initial_arguments():
                 )
             if args.tool is None:
                 tool_choice = input(
-                    "Please specify the tool to use ('cgi'): ").lower()
-                while tool_choice not in ["cgi"]:
-                    print("Invalid choice. Please enter 'cgi'.")
+                    "Please specify the tool to use ('cgi' or 'cravat'): ").lower()
+                while tool_choice not in ["cgi", "cravat"]:
+                    print("Invalid choice. Please enter 'cgi' or 'cravat'.")
                     tool_choice = input(
-                        "Please specify the tool to use ('cgi'): "
+                        "Please specify the tool to use ('cgi' or 'cravat'): "
                     ).lower()
-                args.tool = tool_choice
+                args.tool = tool_choice.upper()
 
     return args, remaining_argv
 
@@ -146,638 +212,412 @@ def create_no_driver_file(target_dir):
     return driver_file_path
 
 
-def run_pipeline(args):
-    if initial_args.tool == 'CGI' or initial_args.driver_mutation_file:
-        input_file_path = args.input_file
-
-    # ---------- CloneFinder Arguments ---------- [✓]
-    clonefinder_skipped = False
-    if initial_args.clonefinder_phylosig_input:
-        input_file_base_name = os.path.splitext(
-            os.path.basename(initial_args.clonefinder_phylosig_input)
-        )[0]
-    else:
-        input_file_base_name = os.path.splitext(
-            os.path.basename(args.input_file))[0]
-    processed_clone_presence_output = os.path.join(
-        target_dir, "processed_clone_presence.txt"
-    )
-    tree_file = os.path.join(
-        target_dir, f"{input_file_base_name}snv_CloneFinder.nwk")
-
-    files_to_check = [
-        os.path.join(
-            target_dir, rf"Supplementary Information\{input_file_base_name}snv_CloneFinder.nwk"),
-        os.path.join(
-            target_dir, rf"Supplementary Information\{input_file_base_name}snv_summary.txt"),
-        os.path.join(
-            target_dir, rf"Supplementary Information\{input_file_base_name}snv_CloneFinder.meg"),
-        os.path.join(
-            target_dir, rf"Supplementary Information\{input_file_base_name}snv_CloneFinder.txt"),
-        os.path.join(
-            target_dir, rf"Supplementary Information\processed_clone_presence.txt"),
-    ]
-
-    all_files_exist = all(os.path.exists(file) for file in files_to_check)
-
-    if all_files_exist:
-        print(
-            "Required CloneFinder output files already exist. If you would like to run CloneFinder again, please use new data or confirm deletion of already exisiting files."
-        )
-        user_response = input(
-            "Would you like to delete files and run a new session of CloneFinder? (Yes/No): "
-        )
-        if user_response.lower() == "yes":
-            delete_files(files_to_check)
-            clonefinder_skipped = False
-        else:
-            print("Skipping CloneFinder Analysis...")
-            clonefinder_skipped = True
-    else:
-        clonefinder_skipped = False
-
-    if not clonefinder_skipped:
-        if "All" in processes or "CloneFinder" in processes:
-            print("\n----- Running CloneFinder Analysis -----\n")
-            input_file_base_name = os.path.splitext(os.path.basename(args.input_file))[
-                0
-            ]
-            print(rf"The input file name is: {input_file_base_name}", "\n")
-            t_()
-            run_clonefinder(args.mode, args.input_file, args.target_dir)
-            print("Processing Output Files for Use in PathFinder...")
-            clonefinder_output_file = (
-                rf"{args.target_dir}\{input_file_base_name}snv_CloneFinder.meg"
-            )
-            print("Renaming hg19 to Normal...")
-            t_()
-            processed_clonefinder_output_file = (
-                rf"{args.target_dir}\{input_file_base_name}snv_PathFinder_processed.meg"
-            )
-            rename_hg19_to_normal(
-                clonefinder_output_file, processed_clonefinder_output_file
-            )
-
-            print("Clone .meg File Processed...")
-            clonefinder_clone_presence_file = (
-                rf"{args.target_dir}\{input_file_base_name}snv_CloneFinder.txt"
-            )
-
-            processed_clone_presence_output = (
-                rf"{args.target_dir}\processed_clone_presence.txt"
-            )
-            process_clone_presence(
-                clonefinder_clone_presence_file, processed_clone_presence_output
-            )
-            print("Clone Presence File Processeed")
-
-            aln = processed_clonefinder_output_file
-            if "All" in processes:
-                print("CloneFinder Analysis Complete. Moving on...")
-            elif "CloneFinder" in processes:
-                print("CloneFinder Analysis Complete. Finishing up and exiting...")
-            elif "PathFinder" in processes and "CloneFinder" in processes:
-                print(
-                    "CloneFinder Analysis Complete. Moving onto PathFinder Analysis..."
-                )
-            t_()
-    else:
-        if "PathFinder" in processes:
-            print("Moving onto PathFinder Analysis...")
-        elif "PhyloSignare" in processes:
-            print("Moving onto PhyloSignare Analysis")
-        elif "Picante" in processes:
-            print("Moving onto Picante Analysis...")
-        t_()
-
-    # ---------- PathFinder Arguments ---------- [✓]
-    if "All" in processes or "PathFinder" in processes:
-        print("\n----- Running PathFinder Analysis -----\n")
-        aln = rf"{args.target_dir}\{input_file_base_name}snv_PathFinder_processed.meg"
-        run_pathfinder(
-            aln,
-            processed_clone_presence_output,
-            args.primary,
-            args.max_graphs_per_tree,
-            args.target_dir,
-        )
-
-        scratch_dir_pattern = os.path.join(args.target_dir, "scratch*")
-
-        scratch_dirs = glob.glob(scratch_dir_pattern)
+PICANTE_PROCESSES = {
+    "Picante_comdist": "comdist",
+    "Picante_comdistnt": "comdistnt",
+    "Picante_Unifrac": "unifrac",
+    "Picante_unifrac": "unifrac",
+}
 
-        scratch_dirs_sorted = sorted(
-            scratch_dirs, key=os.path.getmtime, reverse=True)
 
-        pathfinder_results_dir = os.path.join(
-            args.target_dir, "PathFinder_Results")
-
-        if not os.path.exists(pathfinder_results_dir):
-            if scratch_dirs_sorted:
-                scratch_dir = scratch_dirs_sorted[0]
-                print(
-                    f"Using the most recently created scratch directory: {scratch_dir}"
-                )
-                os.rename(scratch_dir, pathfinder_results_dir)
-                print(
-                    f"'scratch' folder renamed to 'PathFinder_Results' in {args.target_dir}"
-                )
-            else:
-                print(
-                    "No scratch directory found, and no existing 'PathFinder_Results' folder."
-                )
-        else:
-            print(
-                f"Using the existing 'PathFinder_Results' directory in {args.target_dir}"
-            )
-
-        t_()
+def picante_methods(processes):
+    if "All" in processes or "Picante_all" in processes:
+        return ["comdist", "comdistnt", "unifrac"]
+    methods = []
+    for process, method in PICANTE_PROCESSES.items():
+        if process in processes and method not in methods:
+            methods.append(method)
+    return methods
 
-        if "All" in processes:
-            print("PathFinder Analysis Complete. Moving on...")
-        elif "PathFinder" in processes:
-            print("PathFinder Analysis Complete. Finishing up and exiting...")
-        elif "PhyloSignare" in processes and "PathFinder" in processes:
-            print("PathFinder Analysis Complete. Moving onto PhyloSignare Analysis...")
-        t_()
 
-    # ---------- PhyloSignare Arguments ---------- [✓]
-    if "All" in processes or "PhyloSignare" in processes:
-        print("\n----- Creating PhyloSignare Input File -----\n")
-        print("Creating PhyloSignare Input...")
-        t_()
-        if "All" in processes or 'PhyloSignare' in processes:
-            aln_phylosig = args.input_file
-        else:
-            aln_phylosig = initial_args.clonefinder_phylosig_input
-        makePhyloInput(aln_phylosig, target_dir)
-        input_file_base_name = os.path.splitext(
-            os.path.basename(aln_phylosig))[0]
-        original_output_file_path = os.path.join(
-            os.path.dirname(aln_phylosig), f"{input_file_base_name}_PSF.input"
+def heatmap_method(processes):
+    method = None
+    if "All" in processes or "Picante_all" in processes:
+        method = "comdistnt"
+    for process in ["Picante_comdist", "Picante_comdistnt", "Picante_Unifrac", "Picante_unifrac"]:
+        if process in processes:
+            method = PICANTE_PROCESSES[process]
+    return method
+
+
+def plot_sources(stage_name):
+    return [os.path.join(GENOPATH_DIR, path) for path in PLOT_STAGE_SOURCES[stage_name]]
+
+
+PIPELINE_STAGES = [
+    "CloneFinder",
+    "CloneFinder_Processing",
+    "PathFinder",
+    "PhyloSignare_Input",
+    "PhyloSignare",
+    "CGI",
+    "CRAVAT",
+    "PhyloSignare_Plots",
+] + [f"Picante_{method}" for method in ["comdist", "comdistnt", "unifrac"]] + [
+    "Meltos",
+    "Meltos_Plot",
+    "Heatmap",
+    "Clone_Tumor_Trees",
+]
+
+
+def resolve_driver_file(args, target_dir, input_file_base_name):
+    if args.tool == "CGI":
+        return os.path.join(
+            target_dir,
+            f"{input_file_base_name}_cgi_mutation_file_{args.cancer_type_input.replace(' ', '_')}_drivers.txt",
         )
-        target_file_path = os.path.join(
-            target_dir, f"{input_file_base_name}_PSF.input")
+    if args.tool == "CRAVAT":
+        return os.path.join(target_dir, f"{input_file_base_name}_cravat_drivers.txt")
+    if args.driver_mutation_file is not None:
+        return args.driver_mutation_file
+    return create_no_driver_file(target_dir)
 
-        try:
-            shutil.move(original_output_file_path, target_file_path)
-            print(f"PhyloSignare Input File moved to: {target_file_path}")
-        except Exception as e:
-            print(f"Error moving PhyloSignare input file: {e}")
 
-        original_folder_path = os.path.join(
-            os.path.dirname(aln_phylosig), input_file_base_name
-        )
-        target_folder_path = os.path.join(target_dir, input_file_base_name)
+def build_pipeline_stages(args):
+    processes = args.run_process
+    target_dir = args.target_dir
+    input_file = getattr(args, "input_file", None)
+    stages = []
 
-        try:
-            if os.path.exists(original_folder_path) and os.path.isdir(
-                original_folder_path
-            ):
-                shutil.move(original_folder_path, target_folder_path)
-                print(
-                    f"Folder {original_folder_path} moved to: {target_folder_path}")
-                print(
-                    "PhyloSignare Input File Created and Mutation Count Folder Moved. Moving onto analysis..."
-                )
-            else:
-                print(f"No folder found at {original_folder_path} to move.")
-        except Exception as e:
-            print(f"Error moving folder: {e}")
-
-        print("\n----- Running PhyloSignare Analysis -----\n")
-        run_phylosignare(target_file_path, args.control_file, target_dir)
-        # ---------- Post-Process Plotting ----------
-        target_file_base_name = os.path.splitext(
-            os.path.basename(target_file_path))[0]
-        signature_files_dir = None
-
-        phylosignare_dirs = glob.glob(
-            os.path.join(target_dir, "*-PhyloSignare"))
-
-        for dir_path in phylosignare_dirs:
-            potential_file = os.path.join(dir_path, "PhyloSignare.txt")
-            if os.path.isfile(potential_file):
-                signature_files_dir = potential_file
-                break
-
-        if signature_files_dir:
-            try:
-                df = pd.read_csv(signature_files_dir, sep="\t")
-                print(f"Successfully read {signature_files_dir}")
-            except Exception as e:
-                print(f"Error reading {signature_files_dir}: {e}")
-        else:
-            print("PhyloSignare.txt not found in any -PhyloSignare directory.")
-        csv_files_dir = os.path.join(f"{target_dir}/{input_file_base_name}")
-        if phylosignare_dirs:
-            first_dir_path = phylosignare_dirs[0]
-            summary_file_path = os.path.join(first_dir_path, "Summary.txt")
-        else:
-            print("No PhyloSignare directories found.")
-        bar_plots_output_dir = os.path.join(
-            target_dir, "combined_bar_plots.png")
-        tree_output = os.path.join(
-            target_dir, "Phylogenetic_Tree_complete.png")
-        tree_output_driver = os.path.join(
-            target_dir, "Phylogenetic_Tree_driver.png")
-        if initial_args.tool == "CGI":
-            convert_to_cgi_format(
-                initial_args.ref_alt_file,
-                os.path.join(
-                    target_dir, f"{input_file_base_name}_cgi_mutation_file.txt"
-                ),
-            )
-            mutation_file = os.path.join(
-                target_dir, f"{input_file_base_name}_cgi_mutation_file.txt"
-            )
-            run_cgi(
-                mutation_file,
-                initial_args.token,
-                initial_args.cancer_type_input,
-                initial_args.email,
-                target_dir
+    if args.clonefinder_phylosig_input:
+        input_file_base_name = os.path.splitext(
+            os.path.basename(args.clonefinder_phylosig_input)
+        )[0]
+    else:
+        input_file_base_name = os.path.splitext(
+            os.path.basename(input_file))[0]
+
+    def out(name):
+        return os.path.join(target_dir, name)
+
+    def built(*names):
+        # Dependencies on stages this configuration does not run are left
+        # out; their outputs must come from an earlier run.
+        unknown = [name for name in names if name not in PIPELINE_STAGES]
+        if unknown:
+            raise ValueError(f"Unknown pipeline stages: {', '.join(unknown)}")
+        built_names = {stage.name for stage in stages}
+        return [name for name in names if name in built_names]
+
+    tree_file = out(f"{input_file_base_name}snv_CloneFinder.nwk")
+    clonefinder_output_file = out(f"{input_file_base_name}snv_CloneFinder.meg")
+    clonefinder_clone_presence_file = out(
+        f"{input_file_base_name}snv_CloneFinder.txt")
+    processed_clonefinder_output_file = out(
+        f"{input_file_base_name}snv_PathFinder_processed.meg")
+    processed_clone_presence_output = out("processed_clone_presence.txt")
+
+    # ---------- CloneFinder ----------
+    if "All" in processes or "CloneFinder" in processes:
+        stages.append(
+            Stage(
+                "CloneFinder",
+                clonefinder_stage,
+                kwargs={"mode": args.mode, "input_file": input_file,
+                        "target_dir": target_dir, "tools_dir": args.tools_dir},
+                inputs=[input_file],
+                outputs=[
+                    tree_file,
+                    out(f"{input_file_base_name}snv_summary.txt"),
+                    clonefinder_output_file,
+                    clonefinder_clone_presence_file,
+                ],
             )
-            driver_file = os.path.join(
-                target_dir,
-                f"{input_file_base_name}_cgi_mutation_file_{initial_args.cancer_type_input.replace(' ', '_')}_drivers.txt",
+        )
+        stages.append(
+            Stage(
+                "CloneFinder_Processing",
+                process_clonefinder_stage,
+                kwargs={
+                    "clonefinder_output_file": clonefinder_output_file,
+                    "processed_clonefinder_output_file": processed_clonefinder_output_file,
+                    "clonefinder_clone_presence_file": clonefinder_clone_presence_file,
+                    "processed_clone_presence_output": processed_clone_presence_output,
+                },
+                inputs=[clonefinder_output_file, clonefinder_clone_presence_file],
+                outputs=[processed_clonefinder_output_file,
+                         processed_clone_presence_output],
+                deps=built("CloneFinder"),
             )
-            mutation_counts = parse_csv_files(csv_files_dir)
-
-            driver_mutations, position_to_gene = process_driver_file(
-                driver_file)
-
-            position_to_gene_name = {}
-            for index, row in driver_mutations.iterrows():
-                mutation_summary = row["Mutation Summary"]
-                base_position = mutation_summary.split()[0]
-                if "-" in base_position:
-                    base_position = base_position.split("-")[0]
-                position_to_gene_name[base_position] = row["Driver Gene"]
+        )
 
-            matched_positions = match_positions(
-                mutation_counts, driver_mutations, position_to_gene
-            )
-            print("Matched positions:")
-            for position_key, matches in matched_positions.items():
-                print(f"{position_key}: {matches}")
-
-            run(
-                target_dir,
-                csv_files_dir,
-                signature_files_dir,
-                args.control_file,
-                summary_file_path,
-                input_file_base_name,
-                tree_output,
-                tree_output_driver,
-                bar_plots_output_dir,
-                matched_positions,
-                driver_mutations,
-                position_to_gene,
-                position_to_gene_name,
-            )
-        elif initial_args.driver_mutation_file is not None:
-            driver_file = initial_args.driver_mutation_file
-            mutation_counts = parse_csv_files(csv_files_dir)
-
-            driver_mutations, position_to_gene = process_driver_file(
-                driver_file)
-
-            position_to_gene_name = {}
-            for index, row in driver_mutations.iterrows():
-                mutation_summary = row["Mutation Summary"]
-                base_position = mutation_summary.split()[0]
-                if "-" in base_position:
-                    base_position = base_position.split("-")[0]
-                position_to_gene_name[base_position] = row["Driver Gene"]
-
-            matched_positions = match_positions(
-                mutation_counts, driver_mutations, position_to_gene
-            )
-            print("Matched positions:")
-            for position_key, matches in matched_positions.items():
-                print(f"{position_key}: {matches}")
-
-            run(
-                target_dir,
-                csv_files_dir,
-                signature_files_dir,
-                args.control_file,
-                summary_file_path,
-                input_file_base_name,
-                tree_output,
-                tree_output_driver,
-                bar_plots_output_dir,
-                matched_positions,
-                driver_mutations,
-                position_to_gene,
-                position_to_gene_name,
+    # ---------- PathFinder ----------
+    if "All" in processes or "PathFinder" in processes:
+        stages.append(
+            Stage(
+                "PathFinder",
+                pathfinder_stage,
+                kwargs={
+                    "aln": processed_clonefinder_output_file,
+                    "processed_clone_presence_output": processed_clone_presence_output,
+                    "primary": args.primary,
+                    "max_graphs_per_tree": args.max_graphs_per_tree,
+                    "target_dir": target_dir,
+                    "tools_dir": args.tools_dir,
+                },
+                inputs=[processed_clonefinder_output_file,
+                        processed_clone_presence_output],
+                outputs=[out("PathFinder_Results")],
+                deps=built("CloneFinder_Processing"),
             )
+        )
 
-        elif initial_args.driver_mutation_file is None:
-            driver_file = create_no_driver_file(target_dir)
-            mutation_counts = parse_csv_files(csv_files_dir)
-
-            driver_mutations, position_to_gene = process_driver_file(
-                driver_file)
-
-            position_to_gene_name = {}
-            for index, row in driver_mutations.iterrows():
-                mutation_summary = row["Mutation Summary"]
-                base_position = mutation_summary.split()[0]
-                if "-" in base_position:
-                    base_position = base_position.split("-")[0]
-                position_to_gene_name[base_position] = row["Driver Gene"]
-
-            matched_positions = match_positions(
-                mutation_counts, driver_mutations, position_to_gene
+    # ---------- PhyloSignare ----------
+    if "All" in processes or "PhyloSignare" in processes:
+        aln_phylosig = input_file or args.clonefinder_phylosig_input
+        phylo_base_name = os.path.splitext(os.path.basename(aln_phylosig))[0]
+        target_file_path = out(f"{phylo_base_name}_PSF.input")
+        csv_files_dir = out(phylo_base_name)
+
+        stages.append(
+            Stage(
+                "PhyloSignare_Input",
+                phylosignare_input_stage,
+                kwargs={"aln_phylosig": aln_phylosig, "target_dir": target_dir,
+                        "tools_dir": args.tools_dir},
+                inputs=[aln_phylosig],
+                outputs=[target_file_path, csv_files_dir],
+                deps=built("CloneFinder"),
             )
-            print("Matched positions:")
-            for position_key, matches in matched_positions.items():
-                print(f"{position_key}: {matches}")
-
-            run(
-                target_dir,
-                csv_files_dir,
-                signature_files_dir,
-                args.control_file,
-                summary_file_path,
-                input_file_base_name,
-                tree_output,
-                tree_output_driver,
-                bar_plots_output_dir,
-                matched_positions,
-                driver_mutations,
-                position_to_gene,
-                position_to_gene_name,
+        )
+        stages.append(
+            Stage(
+                "PhyloSignare",
+                phylosignare_stage,
+                kwargs={
+                    "target_file_path": target_file_path,
+                    "control_file": args.control_file,
+                    "target_dir": target_dir,
+                    "tools_dir": args.tools_dir,
+                },
+                inputs=[target_file_path, args.control_file],
+                outputs=[out("*-PhyloSignare")],
+                deps=built("PhyloSignare_Input"),
             )
+        )
 
-        if "All" in processes:
-            print("PhyloSignare Analysis Complete. Graphing is done...")
-        elif "PhyloSignare" in processes:
-            print("PhyloSignare Analysis Complete. Graphing is done...")
-        elif "Picante" in processes and "PhyloSignare" in processes:
-            print("PhyloSignare Analysis Complete. Graphing is done...")
-        t_()
-
-    if 'All' in processes or 'Picante_all' in processes or 'Picante_comdist' in processes or 'Picante_comdistnt' in processes or 'Picante_Unifrac' in processes:
-        if args.abundance_weighted == "TRUE":
-            COMDIST_OUTPUT_PDF = os.path.join(
-                target_dir, f"{input_file_base_name}_comdist_weighted.pdf"
-            )
-            COMDISTNT_OUTPUT_PDF = os.path.join(
-                target_dir, f"{input_file_base_name}_comdistnt_weighted.pdf"
+        if args.tool == "CGI":
+            mutation_file = out(f"{phylo_base_name}_cgi_mutation_file.txt")
+            driver_file = resolve_driver_file(args, target_dir, phylo_base_name)
+            stages.append(
+                Stage(
+                    "CGI",
+                    cgi_driver_stage,
+                    kwargs={
+                        "ref_alt_file": args.ref_alt_file,
+                        "mutation_file": mutation_file,
+                        "token": args.token,
+                        "cancer_type_input": args.cancer_type_input,
+                        "email": args.email,
+                        "target_dir": target_dir,
+                    },
+                    inputs=[args.ref_alt_file],
+                    outputs=[driver_file],
+                )
             )
-            UNIFRAC_OUTPUT_PDF = os.path.join(
-                target_dir, f"{input_file_base_name}_unifrac_weighted.pdf"
+        elif args.tool == "CRAVAT":
+            driver_file = resolve_driver_file(args, target_dir, phylo_base_name)
+            stages.append(
+                Stage(
+                    "CRAVAT",
+                    cravat_driver_stage,
+                    kwargs={
+                        "ref_alt_file": args.ref_alt_file,
+                        "cancer_type_input": args.cancer_type_input,
+                        "driver_file": driver_file,
+                        "target_dir": target_dir,
+                    },
+                    inputs=[args.ref_alt_file],
+                    outputs=[driver_file],
+                )
             )
         else:
-            COMDIST_OUTPUT_PDF = os.path.join(
-                target_dir, f"{input_file_base_name}_comdist.pdf"
-            )
-            COMDISTNT_OUTPUT_PDF = os.path.join(
-                target_dir, f"{input_file_base_name}_comdistnt.pdf"
-            )
-            UNIFRAC_OUTPUT_PDF = os.path.join(
-                target_dir, f"{input_file_base_name}_unifrac.pdf"
+            driver_file = resolve_driver_file(args, target_dir, phylo_base_name)
+
+        stages.append(
+            Stage(
+                "PhyloSignare_Plots",
+                phylosignare_plot_stage,
+                kwargs={
+                    "target_dir": target_dir,
+                    "csv_files_dir": csv_files_dir,
+                    "control_file": args.control_file,
+                    "driver_file": driver_file,
+                    "input_file_base_name": phylo_base_name,
+                },
+                inputs=[
+                    csv_files_dir,
+                    out("*-PhyloSignare"),
+                    args.control_file,
+                    driver_file,
+                ] + plot_sources("PhyloSignare_Plots"),
+                outputs=[out("Phylo_bar_final.png")],
+                deps=built("PhyloSignare", "CGI", "CRAVAT"),
             )
+        )
 
-    if clonefinder_skipped:
-        comm = processed_clone_presence_output
-        tree = tree_file
-    else:
-        comm = processed_clone_presence_output
-        tree = tree_file
-
-    COMDIST_NEWICK_OUT = os.path.join(
-        target_dir, f"{input_file_base_name}_comdist_newick.txt"
-    )
-    COMDISTNT_NEWICK_OUT = os.path.join(
-        target_dir, f"{input_file_base_name}_comdistnt_newick.txt"
-    )
-    UNIFRAC_NEWICK_OUT = os.path.join(
-        target_dir, f"{input_file_base_name}_unifrac_newick.txt"
-    )
-
-    # ---------- Picante Comdist Arguments ---------- [✓]
-    if "Picante_comdist" in processes:
-        print("\n----- Running Picante Analysis -----\n")
-        print(comm)
-        print(tree)
-        print(COMDISTNT_OUTPUT_PDF)
-        run_comdist(comm, tree, args.abundance_weighted,
-                    COMDIST_OUTPUT_PDF, COMDIST_NEWICK_OUT)
-        if "All" or "Picante" in processes:
-            print("Picante Comdist Analysis Complete. Finishing up and exiting...")
-        t_()
-
-    # ---------- Picante Comdistnt Arguments ---------- [✓]
-    if "Picante_comdistnt" in processes:
-        print("\n----- Running Picante Comdistnt Analysis -----\n")
-        run_comdistnt(comm, tree, args.abundance_weighted,
-                      COMDISTNT_OUTPUT_PDF, COMDISTNT_NEWICK_OUT)
-        if "All" or "Picante_comdisnt" in processes:
-            print("Picante Comdistnt Analysis Complete. Finishing up and exiting...")
-        t_()
-
-    # ---------- Picante Unifrac Arguments ---------- [✓]
-    if "Picante_Unifrac" in processes:
-        print("\n----- Running Picante Unifrac Analysis -----\n")
-        run_unifrac(comm, tree, UNIFRAC_OUTPUT_PDF, UNIFRAC_NEWICK_OUT)
-        if "All" or "Picante_unifrac" in processes:
-            print("Picante Unifrac Analysis Complete. Finishing up and exiting...")
-        t_()
-
-    # ---------- Picante Arguments ---------- [✓]
-    if "All" in processes or "Picante_all" in processes:
-        print("\n----- Running Picante Analysis (Comdist, Comdisnt, Unifrac) -----\n")
-        run_comdist(comm, tree, args.abundance_weighted,
-                    COMDIST_OUTPUT_PDF, COMDIST_NEWICK_OUT)
-        t_()
-        run_comdistnt(comm, tree, args.abundance_weighted,
-                      COMDISTNT_OUTPUT_PDF, COMDISTNT_NEWICK_OUT)
-        t_()
-        run_unifrac(comm, tree, UNIFRAC_OUTPUT_PDF, UNIFRAC_NEWICK_OUT)
-        t_()
-        if "All" or "Picante_all" in processes:
-            print(
-                "Picante Analysis (Comdist, Comdisnt, Unifrac) Complete. Finishing up and exiting..."
+    # ---------- Picante ----------
+    weighted_suffix = "_weighted" if getattr(
+        args, "abundance_weighted", "TRUE") == "TRUE" else ""
+    for method in picante_methods(processes):
+        output_pdf = out(f"{input_file_base_name}_{method}{weighted_suffix}.pdf")
+        stages.append(
+            Stage(
+                f"Picante_{method}",
+                picante_stage,
+                kwargs={
+                    "method": method,
+                    "comm": processed_clone_presence_output,
+                    "tree": tree_file,
+                    "abundance_weighted": getattr(args, "abundance_weighted", "TRUE"),
+                    "output_pdf": output_pdf,
+                    "newick_output": out(f"{input_file_base_name}_{method}_newick.txt"),
+                    "engine": args.picante_engine,
+                },
+                inputs=[processed_clone_presence_output, tree_file],
+                outputs=[output_pdf, out(
+                    f"{input_file_base_name}_{method}_newick.txt")],
+                deps=built("CloneFinder_Processing"),
             )
-            t_()
+        )
 
     # ---------- Meltos ----------
     if "Meltos" in processes:
-        print("\n----- Creating Meltos Input File ------\n")
-        if "CloneFinder" in processes:
-            SNV = args.input_file
-        if "PathFinder" in processes and "CloneFinder" not in processes:
-            SNV = initial_args.pathfinder_input
-        if (
-            "PhyloSignare" in processes
-            and "CloneFinder" not in processes
-            and "PathFinder" not in processes
-        ):
-            SNV = initial_args.clonefinder_phylosig_input
-
+        SNV = input_file or args.pathfinder_input or args.clonefinder_phylosig_input
         SV = args.sv_file
-        input_file_base_name = os.path.splitext(os.path.basename(SNV))[0]
-        print(f"Input file for base name: {input_file_base_name}")
-
-        print("Creating Meltos In File...")
-        subprocess.run(
-            ["python", "CloneFinder2MeltosIn.py", SNV], check=True, capture_output=True
+        meltos_base_name = os.path.splitext(os.path.basename(SNV))[0]
+        OutSNV = out(f"{meltos_base_name}snv_CloneFinderSNV.txt")
+        OutTree = out(f"{meltos_base_name}snv_CloneFinderTree.txt")
+        meltos_mode = getattr(args, "meltos_mode", "subprocess")
+
+        stages.append(
+            Stage(
+                "Meltos",
+                meltos_stage,
+                kwargs={"SNV": SNV, "SV": SV, "OutSNV": OutSNV,
+                        "OutTree": OutTree, "tree_file": tree_file,
+                        "clone_freq_file": clonefinder_clone_presence_file,
+                        "target_dir": target_dir,
+                        "tools_dir": args.tools_dir,
+                        "meltos_mode": meltos_mode},
+                inputs=[SNV, SV, tree_file, clonefinder_clone_presence_file],
+                outputs=[OutSNV, OutTree, out("*meltos*.txt"),
+                         meltos_result_path(target_dir)],
+                deps=built("CloneFinder"),
+                # The worker JVM belongs to this process, not to a stage pool
+                # that only lives as long as one run.
+                local=meltos_mode == "worker",
+            )
+        )
+        driver_file = resolve_driver_file(args, target_dir, meltos_base_name)
+        stages.append(
+            Stage(
+                "Meltos_Plot",
+                meltos_plot_stage,
+                kwargs={"target_dir": target_dir, "SV": SV,
+                        "driver_file": driver_file,
+                        "input_file_base_name": meltos_base_name},
+                inputs=[meltos_result_path(target_dir), out("*meltos*.txt"), SV, driver_file,
+                        out(f"{meltos_base_name}snv_CloneFinderCloneID.txt")]
+                + plot_sources("Meltos_Plot"),
+                outputs=[out("meltos_output_tree_driver_annotated.png")],
+                deps=built("Meltos", "CGI", "CRAVAT"),
+            )
         )
-        print("Meltos input file created.")
 
-        OutSNV = os.path.join(
-            target_dir, f"{input_file_base_name}snv_CloneFinderSNV.txt")
-        print(f"SNV file to be used for Meltos is: {OutSNV}")
+    # ---------- Heatmap and Clone, Tumor Tree vs Presence ----------
+    method = heatmap_method(processes)
+    if method and ("All" in processes or "CloneFinder" in processes):
+        tumor_tree_file = out(f"{input_file_base_name}_{method}_newick.txt")
+        presence_normal_file = out(
+            f"{input_file_base_name}snv_CloneFinder_Normal.txt")
+        stages.append(
+            Stage(
+                "Heatmap",
+                heatmap_stage,
+                kwargs={
+                    "clone_tree_file": tree_file,
+                    "tumor_tree_file": tumor_tree_file,
+                    "presence_file": clonefinder_clone_presence_file,
+                    "presence_normal_file": presence_normal_file,
+                    "output": out("clone_tumor_heatmap.png"),
+                },
+                inputs=[tree_file, tumor_tree_file,
+                        clonefinder_clone_presence_file] + plot_sources("Heatmap"),
+                outputs=[out("clone_tumor_heatmap.png"), presence_normal_file],
+                deps=built(f"Picante_{method}"),
+            )
+        )
+        clone_path = out(f"{input_file_base_name}_clonevpresence.png")
+        tumor_path = out(f"{input_file_base_name}_treevpresence.png")
+        stages.append(
+            Stage(
+                "Clone_Tumor_Trees",
+                clone_tumor_tree_stage,
+                kwargs={
+                    "presence_normal_file": presence_normal_file,
+                    "clone_tree_file": tree_file,
+                    "tumor_tree_file": tumor_tree_file,
+                    "clone_path": clone_path,
+                    "tumor_path": tumor_path,
+                },
+                inputs=[presence_normal_file, tree_file, tumor_tree_file]
+                + plot_sources("Clone_Tumor_Trees"),
+                outputs=[clone_path, tumor_path],
+                deps=built("Heatmap"),
+            )
+        )
 
-        OutTree = os.path.join(
-            target_dir, f"{input_file_base_name}snv_CloneFinderTree.txt")
+    return stages
 
-        SampC = load_SampC(SNV)
-        order_verification(SV, OutSNV)
 
-        run_meltos(OutSNV, SV, OutTree, SampC, target_dir)
+def run_config_path(target_dir):
+    return os.path.join(target_dir, CACHE_DIR_NAME, RUN_CONFIG_FILE)
 
-        meltos_output_path = find_most_recent_meltos_file(target_dir)
-        node_clone_mapping_file = os.path.join(
-            target_dir, f"{input_file_base_name}snv_CloneFinderCloneID.txt"
-        )
 
-        print(f"Most recent .meltos file: {meltos_output_path}")
-        print(f"Node Clone Mapping File loaded as: {node_clone_mapping_file}")
+def save_run_config(args):
+    # Paths are stored absolute so `genopath.py plot` works from any directory.
+    # The CGI token is a credential and is never written to disk.
+    config = {}
+    for name, value in vars(args).items():
+        if name == "token":
+            continue
+        if name in RUN_CONFIG_PATH_ARGS and value:
+            value = os.path.abspath(value)
+        config[name] = value
+    config_path = run_config_path(args.target_dir)
+    os.makedirs(os.path.dirname(config_path), exist_ok=True)
+    with open(config_path, "w") as file:
+        json.dump(config, file, indent=2, sort_keys=True)
 
-        if initial_args.tool == "CGI":
-            driver_file_path = os.path.join(
-                target_dir,
-                f"{input_file_base_name}_cgi_mutation_file_{initial_args.cancer_type_input.replace(' ', '_')}_drivers.txt",
-            )
 
-        elif initial_args.driver_mutation_file is None:
-            driver_file_path = create_no_driver_file(target_dir)
+def load_run_config(target_dir):
+    config_path = run_config_path(target_dir)
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(
+            f"No run configuration found at {config_path}. "
+            "Run the pipeline into this directory first."
+        )
+    with open(config_path, "r") as file:
+        config = json.load(file)
+    config["token"] = None
+    return argparse.Namespace(**config)
 
-        else:
-            driver_file_path = initial_args.driver_mutation_file
 
-        plot_meltos(target_dir, SV, driver_file_path, input_file_base_name)
+def run_pipeline(args):
+    os.makedirs(args.target_dir, exist_ok=True)
+    configure_tool_cache(args)
+    save_run_config(args)
+    stages = build_pipeline_stages(args)
+    results = run_stage_graph(
+        stages, args.target_dir, use_cache=not args.no_cache, jobs=args.jobs
+    )
 
-    # ---------- Heatmap ----------
-    if 'CloneFinder' in processes and 'Picante_all' in processes or 'Picante_comdist' in processes or 'Picante_comdistnt' in processes or 'Picante_Unifrac' in processes:
-        input_file_base_name = os.path.splitext(
-            os.path.basename(args.input_file))[0]
-        ct = os.path.join(
-            target_dir, f"{input_file_base_name}snv_CloneFinder.nwk")
-        presence_file = os.path.join(
-            target_dir, f"{input_file_base_name}snv_CloneFinder.txt")
-        presence = pd.read_csv(presence_file, sep='\t', index_col=0)
-        output = os.path.join(target_dir, "clone_tumor_heatmap.png")
-
-        if "Normal" not in presence.columns:
-            presence['Normal'] = 0.0
-
-        presence.to_csv(presence_file, sep='\t')
-
-    if 'All' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        ct = os.path.join(
-            target_dir, f"{input_file_base_name}snv_CloneFinder.nwk")
-        presence_file = os.path.join(
-            target_dir, f"{input_file_base_name}snv_CloneFinder.txt")
-        presence = pd.read_csv(presence_file, sep='\t', index_col=0)
-        output = os.path.join(target_dir, "clone_tumor_heatmap.png")
-
-        if "Normal" not in presence.columns:
-            presence['Normal'] = 0.0
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_comdistnt_newick.txt")
-
-        plot_heatmap(ct, tt, presence_file, output)
-        print("Heatmap plotted successfully...")
-
-    if "CloneFinder" in processes and 'Picante_all' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_comdistnt_newick.txt")
-
-        plot_heatmap(ct, tt, presence_file, output)
-        print("Heatmap plotted successfully...")
-
-    if "CloneFinder" in processes and 'Picante_comdist' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_comdist_newick.txt")
-
-        plot_heatmap(ct, tt, presence_file, output)
-        print("Heatmap plotted successfully...")
-
-    if "CloneFinder" in processes and 'Picante_comdistnt' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_comdistnt_newick.txt")
-
-        plot_heatmap(ct, tt, presence_file, output)
-        print("Heatmap plotted successfully...")
-
-    if "CloneFinder" in processes and 'Picante_unifrac' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_unifrac_newick.txt")
-
-        plot_heatmap(ct, tt, presence_file, output)
-        print("Heatmap plotted successfully...")
-
-    # ---------- Clone, Tumor Tree vs Presence ----------
-    clone_path = os.path.join(
-        target_dir, f"{input_file_base_name}_clonevpresence.png")
-    tumor_path = os.path.join(
-        target_dir, f"{input_file_base_name}_treevpresence.png")
-    if 'All' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_comdistnt_newick.txt")
-
-        clone_tree(presence_file, ct, clone_path)
-        tumor_tree(presence_file, tt, tumor_path)
-        print("Clone, Tumor Phylo Tree vs Presence Matrix Plotted Successfully...")
-
-    if "CloneFinder" in processes and 'Picante_all' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_comdistnt_newick.txt")
-
-        clone_tree(presence_file, ct, clone_path)
-        tumor_tree(presence_file, tt, tumor_path)
-        print("Clone, Tumor Phylo Tree vs Presence Matrix Plotted Successfully...")
-
-    if "CloneFinder" in processes and 'Picante_comdist' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_comdist_newick.txt")
-
-        clone_tree(presence_file, ct, clone_path)
-        tumor_tree(presence_file, tt, tumor_path)
-        print("Clone, Tumor Phylo Tree vs Presence Matrix Plotted Successfully...")
-
-    if "CloneFinder" in processes and 'Picante_comdistnt' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_comdistnt_newick.txt")
-
-        clone_tree(presence_file, ct, clone_path)
-        tumor_tree(presence_file, tt, tumor_path)
-        print("Clone, Tumor Phylo Tree vs Presence Matrix Plotted Successfully...")
-
-    if "CloneFinder" in processes and 'Picante_unifrac' in processes:
-        print("\n----- Plotting Heatmap ------\n")
-        tt = os.path.join(
-            target_dir, f"{input_file_base_name}_unifrac_newick.txt")
-
-        clone_tree(presence_file, ct, clone_path)
-        tumor_tree(presence_file, tt, tumor_path)
-        print("Clone, Tumor Phylo Tree vs Presence Matrix Plotted Successfully...")
+    print("\n----- Stage Summary -----\n")
+    for name, status in results.items():
+        print(f"{name}: {status}")
+    return results
 
 
 # ---------- Full Arguments ----------
@@ -826,19 +666,401 @@ def parse_full_arguments(processes, remaining_argv):
     if "Meltos" in processes:
         parser.add_argument("--sv_file", type=str,
                             help="Path to SV file for Meltos")
+        parser.add_argument(
+            "--meltos_mode",
+            choices=MELTOS_MODES,
+            default="subprocess",
+            help="Start a JVM per Meltos run (subprocess) or keep one JVM alive across runs (worker).",
+        )
 
     args = parser.parse_args(remaining_argv)
     return args
 
 
-if __name__ == "__main__":
-    initial_args, remaining_argv = parse_initial_arguments()
-    processes = initial_args.run_process
-    target_dir = initial_args.target_dir
-    aln_phylosig = initial_args.clonefinder_phylosig_input
+# ---------- Tool Cache ----------
+def add_tool_cache_arguments(parser):
+    parser.add_argument(
+        "--tool_cache",
+        type=str,
+        default=None,
+        help="Shared cache of tool checkouts (<tool>@<commit>). Defaults to $GENOPATH_TOOL_CACHE or ~/.cache/genopath/tools.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use tool checkouts already in the tool cache; never contact the tool repositories.",
+    )
+
+
+def configure_tool_cache(args):
+    # Set through the environment so stage and patient worker processes see it.
+    if getattr(args, "tool_cache", None):
+        os.environ["GENOPATH_TOOL_CACHE"] = os.path.abspath(args.tool_cache)
+    if getattr(args, "offline", False):
+        os.environ["GENOPATH_OFFLINE"] = "1"
+
+
+def parse_tools_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="genopath.py tools",
+        description="Fetch the CloneFinder, PathFinder, PhyloSignare and Meltos checkouts into the tool cache.",
+    )
+    parser.add_argument(
+        "--run_process",
+        nargs="+",
+        default=["All", "Meltos"],
+        help="Only fetch the tools these processes need.",
+    )
+    add_tool_cache_arguments(parser)
+    return parser.parse_args(argv)
+
 
-    args = parse_full_arguments(processes, remaining_argv)
+def run_tools(tools_args):
+    configure_tool_cache(tools_args)
+    return prepare_tool_checkouts(None, tools_args.run_process)
 
+
+# ---------- Re-plotting ----------
+def parse_plot_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="genopath.py plot",
+        description="Re-render the figures of an existing run whose inputs or plotting code changed.",
+    )
+    parser.add_argument(
+        "--target_dir",
+        type=str,
+        required=True,
+        help="Output directory of a previous pipeline run.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of figures to render at the same time.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-render every figure, even the ones that are up to date.",
+    )
+    return parser.parse_args(argv)
+
+
+def missing_inputs(stage, produced):
+    missing = []
+    for path in stage.inputs:
+        if path in produced:
+            continue
+        if "*" in path:
+            if not glob.glob(path):
+                missing.append(path)
+        elif not os.path.exists(path):
+            missing.append(path)
+    return missing
+
+
+def run_plots(plot_args):
+    target_dir = os.path.abspath(plot_args.target_dir)
+    args = load_run_config(target_dir)
+    # The directory may have been moved since the run; plot where it is now.
     args.target_dir = target_dir
 
-    run_pipeline(args)
+    stages = []
+    produced = set()
+    for stage in build_pipeline_stages(args):
+        if stage.name not in PLOT_STAGE_SOURCES:
+            continue
+        missing = missing_inputs(stage, produced)
+        if missing:
+            print(f"Skipping {stage.name}: missing {', '.join(missing)}")
+            continue
+        # The analysis stages are not part of this graph; keep only the
+        # ordering between figures.
+        stage.deps = [dep for dep in stage.deps if dep in {s.name for s in stages}]
+        stages.append(stage)
+        produced.update(stage.outputs)
+
+    if not stages:
+        print(f"No figures can be rendered from {target_dir}.")
+        return {}
+
+    if plot_args.force:
+        # Forget only the figures, so the analysis stages stay cached.
+        cache = load_stage_cache(target_dir)
+        for stage in stages:
+            cache.pop(stage.name, None)
+        save_stage_cache(target_dir, cache)
+
+    results = run_stage_graph(stages, target_dir, jobs=plot_args.jobs)
+
+    print("\n----- Plot Summary -----\n")
+    for name, status in results.items():
+        print(f"{name}: {status}")
+    return results
+
+
+# ---------- Batch Mode ----------
+MANIFEST_PATH_COLUMNS = [
+    "input_file",
+    "control_file",
+    "sv_file",
+    "driver_mutation_file",
+    "ref_alt_file",
+]
+
+COHORT_SUMMARY_COLUMNS = [
+    "patient_id",
+    "status",
+    "elapsed_seconds",
+    "stages_ran",
+    "stages_cached",
+    "target_dir",
+    "error",
+]
+
+
+def parse_batch_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="genopath.py batch",
+        description="Run the analysis pipeline for every patient listed in a manifest.",
+    )
+    parser.add_argument(
+        "manifest",
+        type=str,
+        help="Tab-separated manifest with a header. Required columns: patient_id, input_file. "
+        "Optional columns: control_file, sv_file, driver_mutation_file, ref_alt_file, primary, run_process.",
+    )
+    parser.add_argument(
+        "--target_dir",
+        type=str,
+        required=True,
+        help="Cohort output directory. Each patient is written to <target_dir>/<patient_id>.",
+    )
+    parser.add_argument(
+        "--run_process",
+        nargs="+",
+        default=["All"],
+        help="Processes to run for patients whose manifest row has no run_process column.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of patients to run at the same time.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of independent stages to run at the same time within each patient.",
+    )
+    parser.add_argument("--max_graphs_per_tree", type=int)
+    parser.add_argument("--abundance_weighted", default="TRUE", type=str)
+    parser.add_argument("--picante_engine", choices=["native", "R"], default="native")
+    parser.add_argument(
+        "--meltos_mode",
+        choices=MELTOS_MODES,
+        default="subprocess",
+        help="Keep one JVM alive for all patients' Meltos runs (worker) instead of one per run.",
+    )
+    parser.add_argument("--tool", type=str, choices=["CGI", "CRAVAT"])
+    parser.add_argument("--email", type=str)
+    parser.add_argument("--token", type=str)
+    parser.add_argument("--cancer_type_input", type=str)
+    parser.add_argument(
+        "--cgi_workers",
+        type=int,
+        default=4,
+        help="Number of CGI jobs to submit and poll at the same time.",
+    )
+    parser.add_argument("--no_cache", action="store_true")
+    add_tool_cache_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def read_manifest(manifest_path):
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    patients = []
+    with open(manifest_path, "r", newline="") as file:
+        reader = csv.DictReader(file, delimiter="\t")
+        for column in ["patient_id", "input_file"]:
+            if column not in (reader.fieldnames or []):
+                raise ValueError(f"Manifest {manifest_path} is missing the '{column}' column.")
+        for row in reader:
+            row = {key: (value or "").strip() for key, value in row.items() if key}
+            if not row["patient_id"]:
+                continue
+            for column in MANIFEST_PATH_COLUMNS:
+                if row.get(column):
+                    row[column] = os.path.join(manifest_dir, row[column])
+            patients.append(row)
+
+    patient_ids = [row["patient_id"] for row in patients]
+    duplicates = sorted({pid for pid in patient_ids if patient_ids.count(pid) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate patient_id values in manifest: {', '.join(duplicates)}")
+    return patients
+
+
+def build_patient_args(row, batch_args, tools_dir):
+    run_process = row.get("run_process")
+    return argparse.Namespace(
+        run_process=run_process.split() if run_process else batch_args.run_process,
+        target_dir=os.path.join(batch_args.target_dir, row["patient_id"]),
+        tools_dir=tools_dir,
+        clonefinder_phylosig_input=None,
+        pathfinder_input=None,
+        mode="snv",
+        input_file=row["input_file"],
+        control_file=row.get("control_file") or None,
+        sv_file=row.get("sv_file") or None,
+        driver_mutation_file=row.get("driver_mutation_file") or None,
+        ref_alt_file=row.get("ref_alt_file") or None,
+        primary=row.get("primary") or None,
+        max_graphs_per_tree=batch_args.max_graphs_per_tree,
+        abundance_weighted=batch_args.abundance_weighted,
+        picante_engine=batch_args.picante_engine,
+        meltos_mode=batch_args.meltos_mode,
+        tool=batch_args.tool,
+        email=batch_args.email,
+        token=batch_args.token,
+        cancer_type_input=batch_args.cancer_type_input,
+        no_cache=batch_args.no_cache,
+        jobs=batch_args.jobs,
+        tool_cache=batch_args.tool_cache,
+        offline=batch_args.offline,
+    )
+
+
+def run_patient(patient_id, patient_args):
+    start = time.time()
+    summary = {"patient_id": patient_id, "target_dir": patient_args.target_dir}
+    try:
+        results = run_pipeline(patient_args)
+    except Exception as e:
+        summary.update(status="failed", error=f"{type(e).__name__}: {e}")
+        results = {}
+    else:
+        incomplete = [name for name, status in results.items() if status not in ("ran", "cached")]
+        summary.update(status="incomplete" if incomplete else "ok", error="")
+    summary["elapsed_seconds"] = f"{time.time() - start:.1f}"
+    summary["stages_ran"] = ",".join(n for n, s in results.items() if s == "ran")
+    summary["stages_cached"] = ",".join(n for n, s in results.items() if s == "cached")
+    return summary
+
+
+def prefetch_cgi_results(patient_args, batch_args):
+    # Submit every patient's CGI job up front so CGI processes them
+    # concurrently; each patient's CGI stage then reads the cached results.
+    jobs = []
+    for args in patient_args:
+        os.makedirs(args.target_dir, exist_ok=True)
+        for stage in build_pipeline_stages(args):
+            if stage.name == "CGI" and stage.kwargs["ref_alt_file"]:
+                convert_to_cgi_format(
+                    stage.kwargs["ref_alt_file"], stage.kwargs["mutation_file"])
+                jobs.append(
+                    (stage.kwargs["mutation_file"], stage.kwargs["cancer_type_input"]))
+    if not jobs:
+        return
+    print(f"Fetching CGI results for {len(jobs)} patients...")
+    try:
+        fetch_cgi_batch(
+            jobs, batch_args.token, batch_args.email, workers=batch_args.cgi_workers)
+    except Exception as e:
+        print(f"CGI prefetch failed, patients will submit on their own: {e}")
+
+
+def write_cohort_summary(summaries, output_path):
+    with open(output_path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=COHORT_SUMMARY_COLUMNS, delimiter="\t")
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow({column: summary.get(column, "") for column in COHORT_SUMMARY_COLUMNS})
+    print(f"Cohort summary written to {output_path}")
+
+
+def run_batch(batch_args):
+    patients = read_manifest(batch_args.manifest)
+    os.makedirs(batch_args.target_dir, exist_ok=True)
+    print(f"Loaded {len(patients)} patients from {batch_args.manifest}")
+
+    # Fetch every tool into the shared cache once so patients share the checkouts.
+    configure_tool_cache(batch_args)
+    all_processes = set(batch_args.run_process)
+    for row in patients:
+        all_processes.update((row.get("run_process") or "").split())
+    checkouts = prepare_tool_checkouts(None, all_processes)
+
+    patient_args = {
+        row["patient_id"]: build_patient_args(row, batch_args, None)
+        for row in patients
+    }
+    if batch_args.tool == "CGI":
+        prefetch_cgi_results(patient_args.values(), batch_args)
+    summaries = {}
+
+    meltos_worker = batch_args.meltos_mode == "worker" and "Meltos" in checkouts
+    if batch_args.workers <= 1:
+        # One Meltos JVM serves every patient and is closed with the batch.
+        if meltos_worker:
+            start_worker(os.path.join(checkouts["Meltos"], "Meltos.jar"))
+        try:
+            for patient_id, args in patient_args.items():
+                print(f"\n========== Patient {patient_id} ==========\n")
+                summaries[patient_id] = run_patient(patient_id, args)
+        finally:
+            close_workers()
+    else:
+        # Each patient process keeps its JVM for the patients it runs and
+        # closes it when the pool shuts down.
+        with ProcessPoolExecutor(
+            max_workers=batch_args.workers,
+            initializer=close_workers_on_exit if meltos_worker else None,
+        ) as executor:
+            futures = {
+                executor.submit(run_patient, patient_id, args): patient_id
+                for patient_id, args in patient_args.items()
+            }
+            for future in as_completed(futures):
+                patient_id = futures[future]
+                try:
+                    summaries[patient_id] = future.result()
+                except Exception as e:
+                    summaries[patient_id] = {
+                        "patient_id": patient_id,
+                        "status": "failed",
+                        "target_dir": patient_args[patient_id].target_dir,
+                        "error": f"{type(e).__name__}: {e}",
+                    }
+                print(f"Patient {patient_id}: {summaries[patient_id]['status']}")
+
+    ordered = [summaries[row["patient_id"]] for row in patients]
+    write_cohort_summary(ordered, os.path.join(batch_args.target_dir, "cohort_summary.tsv"))
+
+    failed = [s["patient_id"] for s in ordered if s["status"] != "ok"]
+    print(f"\n{len(ordered) - len(failed)}/{len(ordered)} patients completed successfully.")
+    if failed:
+        print(f"Patients with errors: {', '.join(failed)}")
+    return ordered
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch_args = parse_batch_arguments(sys.argv[2:])
+        first_time_setup()
+        run_batch(batch_args)
+    elif len(sys.argv) > 1 and sys.argv[1] == "tools":
+        run_tools(parse_tools_arguments(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "plot":
+        run_plots(parse_plot_arguments(sys.argv[2:]))
+    else:
+        first_time_setup()
+        initial_args, remaining_argv = parse_initial_arguments()
+        processes = initial_args.run_process
+
+        args = parse_full_arguments(processes, remaining_argv)
+        for name, value in vars(initial_args).items():
+            setattr(args, name, value)
+
+        run_pipeline(args)
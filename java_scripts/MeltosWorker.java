@@ -0,0 +1,107 @@
+// Long-lived JVM used by analysis/meltos_worker.py.
+// Started as: java MeltosWorker.java <path/to/Meltos.jar>
+// The jar's Main-Class is read from its manifest. After start-up a line
+// __GENOPATH_MELTOS_READY__\t<main class> is written, then one job is read per
+// line from stdin: <arg1>\t<arg2>... Each job runs the Meltos main method in a
+// fresh class loader, so no static state is carried over between patients,
+// while the JVM itself and the JIT-compiled JDK classes stay warm. After each
+// job a sentinel line is written:
+// __GENOPATH_MELTOS_DONE__\t<exit code>\t<seconds>\t<message>
+// If Meltos calls System.exit and the JVM does not allow intercepting it, the
+// worker exits with that code and the Python side starts a new one.
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.util.jar.JarFile;
+
+public class MeltosWorker {
+    static final String SENTINEL = "__GENOPATH_MELTOS_DONE__";
+    static final String READY = "__GENOPATH_MELTOS_READY__";
+
+    static class ExitTrapped extends SecurityException {
+        final int status;
+
+        ExitTrapped(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    @SuppressWarnings("removal")
+    static boolean trapExit() {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkExit(int status) {
+                    throw new ExitTrapped(status);
+                }
+
+                @Override
+                public void checkPermission(java.security.Permission perm) {
+                }
+            });
+            return true;
+        } catch (UnsupportedOperationException | SecurityException e) {
+            return false;
+        }
+    }
+
+    public static void main(String[] argv) throws Exception {
+        File jar = new File(argv[0]).getAbsoluteFile();
+        String mainClass;
+        try (JarFile jarFile = new JarFile(jar)) {
+            mainClass = jarFile.getManifest().getMainAttributes().getValue("Main-Class");
+        }
+        if (mainClass == null) {
+            throw new IllegalStateException("No Main-Class in the manifest of " + jar);
+        }
+        URL[] classPath = {jar.toURI().toURL()};
+
+        // Meltos' stderr goes to stdout so it is ordered before the sentinel.
+        PrintStream out = System.out;
+        System.setErr(out);
+        boolean exitTrapped = trapExit();
+        out.println(READY + "\t" + mainClass + "\t" + (exitTrapped ? "exit-trapped" : "exit-not-trapped"));
+        out.flush();
+
+        BufferedReader input = new BufferedReader(new InputStreamReader(System.in));
+        String line;
+        while ((line = input.readLine()) != null && !line.isEmpty()) {
+            String[] jobArgs = line.split("\t", -1);
+            long started = System.nanoTime();
+            int status = 0;
+            String message = "";
+            try (URLClassLoader loader = new URLClassLoader(classPath, ClassLoader.getPlatformClassLoader())) {
+                Method main = Class.forName(mainClass, true, loader).getMethod("main", String[].class);
+                main.invoke(null, (Object) jobArgs);
+            } catch (InvocationTargetException e) {
+                Throwable cause = e.getCause();
+                if (cause instanceof ExitTrapped) {
+                    status = ((ExitTrapped) cause).status;
+                } else {
+                    status = 1;
+                    message = String.valueOf(cause);
+                    cause.printStackTrace(out);
+                }
+            } catch (ExitTrapped e) {
+                status = e.status;
+            } catch (Exception | LinkageError e) {
+                status = 1;
+                message = String.valueOf(e);
+            }
+            double elapsed = (System.nanoTime() - started) / 1e9;
+
+            // Leading newline in case Meltos' last output did not end with one.
+            out.println();
+            out.println(SENTINEL + "\t" + status + "\t" + String.format("%.3f", elapsed) + "\t"
+                    + message.replaceAll("[\t\r\n]", " "));
+            out.flush();
+        }
+    }
+}
@@ -2,8 +2,10 @@ import pandas as pd
 from ete3 import Tree, TreeStyle, TextFace
 import sys
 
+from analysis.clone_frequency import load_clone_frequencies
+
 def clone_tree(presence, tree_file,clone_path):
-    cpdf = pd.read_csv(presence, sep='\t', index_col='Tumor')
+    cpdf = load_clone_frequencies(presence).to_frame()
     tree = Tree(tree_file)
 
     tcn = cpdf.columns[0]
@@ -52,8 +54,7 @@ def clone_tree(presence, tree_file,clone_path):
 
 
 def tumor_tree(presence, tree_file,tree_path):
-    cpdf = pd.read_csv(presence, sep='\t', index_col='Tumor')
-    cpdf = cpdf.T
+    cpdf = load_clone_frequencies(presence).transpose()
     tree = Tree(tree_file)
     fsn = None
     for leaf in tree.iter_leaves():
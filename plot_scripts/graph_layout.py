@@ -0,0 +1,63 @@
+import json
+import subprocess
+from PIL import Image, ImageDraw, ImageFont
+
+
+def parse_pos(pos_data):
+    return [
+        (float(x), float(y))
+        for x, y in (pt.split(",") for pt in pos_data.replace("e,", "").split())
+    ]
+
+
+def render_layout(dot, output_base):
+    """Lay out ``dot`` once and write ``<output_base>.png`` and ``<output_base>.json``.
+
+    Both formats come from the same ``dot`` invocation, so they share one
+    layout. Returns the PNG path and the edge control points keyed by
+    ``(parent, child)``, in the form ``parse_edge_info`` used to produce.
+    """
+    source_path = output_base + ".gv"
+    json_path = output_base + ".json"
+    png_path = output_base + ".png"
+    with open(source_path, "w") as file:
+        file.write(dot.source)
+    print(f"Rendering {png_path} and {json_path}")
+    subprocess.run(
+        ["dot", "-Tjson", "-o", json_path, "-Tpng", "-o", png_path, source_path],
+        check=True,
+    )
+    return png_path, read_edge_layout(json_path)
+
+
+def read_edge_layout(json_path):
+    with open(json_path, "r") as file:
+        layout = json.load(file)
+
+    names = {obj["_gvid"]: obj["name"] for obj in layout.get("objects", [])}
+    edge_info = {}
+    for edge in layout.get("edges", []):
+        if "pos" not in edge:
+            continue
+        parent, child = names[edge["tail"]], names[edge["head"]]
+        edge_info[(parent, child)] = parse_pos(edge["pos"])
+    return edge_info
+
+
+def add_title(img, title, font_size=27, padding=10):
+    """Return a copy of ``img`` with ``title`` centred in a band above it.
+
+    This replaces the Graphviz graph label, so the one layout can be shared by
+    figures with different titles.
+    """
+    font = ImageFont.load_default(font_size)
+    measure = ImageDraw.Draw(img)
+    left, top, right, bottom = measure.textbbox((0, 0), title, font=font)
+    band_height = bottom - top + 2 * padding
+    width = max(img.width, right - left + 2 * padding)
+
+    titled = Image.new(img.mode, (width, img.height + band_height), "white")
+    titled.paste(img, ((width - img.width) // 2, band_height))
+    draw = ImageDraw.Draw(titled)
+    draw.text(((width - (right - left)) / 2 - left, padding - top), title, fill="black", font=font)
+    return titled
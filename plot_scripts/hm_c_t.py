@@ -1,19 +1,17 @@
 import subprocess
 import os
 
+from analysis.r_worker import run_r_script as run_worker_script
+
 current_script_dir = os.path.dirname(os.path.realpath(__file__))
 parent_dir = os.path.dirname(current_script_dir)
 r_scripts_dir = os.path.join(parent_dir, "r_scripts")
 
 
 def run_r_script(script_name, *args):
-    print(f"Current directory: {current_script_dir}")
-    print(f"Parent directory: {parent_dir}")
-    print(f"R Scripts directory: {r_scripts_dir}")
     script_path = os.path.join(r_scripts_dir, script_name)
-    command = ['Rscript', script_path] + list(map(str, args))
     try:
-        subprocess.run(command, check=True, capture_output=True, text=True)
+        run_worker_script(script_path, *args)
     except subprocess.CalledProcessError as e:
         print(f"Error running {os.path.basename(script_path)}: {e.stderr}")
         print(f"Standard Output: {e.stdout}")
@@ -3,32 +3,15 @@ import os
 import pandas as pd
 from graphviz import Digraph
 from PIL import Image, ImageDraw, ImageFont
-import glob
-import re
+import numpy as np
 
+from plot_scripts.graph_layout import render_layout, add_title
+from analysis.driver_annotations import load_driver_table
+from analysis.driver_index import normalize_chrom
+from analysis.helper_meltos import load_meltos_result
 
-def parse_meltos_output_for_clones(meltos_file_path):
-    node_clone_mapping = {}
-    with open(meltos_file_path, "r") as file:
-        for line in file:
-            if line.startswith("Valid"):
-                parts = line.strip().split("\t")
-                if len(parts) < 4:
-                    continue
-                node_id = parts[2]
-                clone_ids = []
-                array_end_found = False
-                for part in parts[4:]:
-                    if array_end_found:
-                        clone_ids.extend(
-                            [int(x) for x in part.split(",") if x.isdigit()]
-                        )
-                    elif part.startswith("[") and part.endswith("]"):
-                        array_end_found = True
-                    elif part.endswith("]"):
-                        array_end_found = True
-                node_clone_mapping[node_id] = clone_ids
-    return node_clone_mapping
+# Same fields as re.split("[:-]", position)[:2] with a numeric second field.
+BREAKPOINT_PATTERN = r"^([^:-]*)[:-](\d+)(?:[:-]|$)"
 
 
 def save_node_clone_mapping_to_tsv(node_clone_mapping, output_tsv_path):
@@ -40,89 +23,7 @@ def save_node_clone_mapping_to_tsv(node_clone_mapping, output_tsv_path):
     print("Saving completed.")
 
 
-def find_most_recent_meltos_file(target_dir):
-    search_pattern = os.path.join(target_dir, "*meltos*.txt")
-    meltos_files = glob.glob(search_pattern)
-
-    if not meltos_files:
-        print("No .meltos files found in the specified directory")
-        return None
-
-    most_recent_file = max(meltos_files, key=os.path.getctime)
-    return most_recent_file
-
-
-def read_driver_mutation_file(driver_file_path):
-    driver_mutations = []
-    with open(driver_file_path, "r") as file:
-        next(file)
-        for line in file:
-            parts = line.strip().split("\t")
-            if len(parts) < 5:
-                print(f"Skipping line due to unexpected format: {line.strip()}")
-                continue
-            mutation_summary_part = parts[4].split(" ")[0]
-            driver_gene = parts[0]
-
-            if "-" in mutation_summary_part:
-                base, positions = mutation_summary_part.split(":")
-                start_pos, end_pos = positions.split("-")
-                mutation_summary = (
-                    f"{base}:{start_pos}"
-                    if start_pos == end_pos
-                    else [f"{base}:{start_pos}", f"{base}:{end_pos}"]
-                )
-                if isinstance(mutation_summary, list):
-                    for summary in mutation_summary:
-                        driver_mutations.append((summary, driver_gene))
-                    continue
-            else:
-                mutation_summary = mutation_summary_part
-
-            driver_mutations.append((mutation_summary, driver_gene))
-    return driver_mutations
-
-
-def match_driver_mutations_to_nodes(
-    driver_mutations, matches_file_path, output_file_path
-):
-    with open(matches_file_path, "r") as matches_file, open(
-        output_file_path, "w"
-    ) as output_file:
-        next(matches_file)
-        output_file.write("Node_ID\tClone_ID\tPosition\tDriver_Gene\n")
-
-        for line in matches_file:
-            parts = line.strip().split("\t")
-            if len(parts) < 4:
-                continue
-            node_id, clone_id, position_1, position_2 = parts
-
-            for position in [position_1, position_2]:
-                chrom, pos = re.split("[:-]", position)[:2]
-
-                for driver_summary, driver_gene in driver_mutations:
-                    driver_chrom, driver_pos = re.split("[:-]", driver_summary)[:2]
-
-                    if chrom == driver_chrom and pos == driver_pos:
-                        output_file.write(
-                            f"{node_id}\t{clone_id}\t{position}\t{driver_gene}\n"
-                        )
-                        break
-
-
-def match_node_id_with_sv_and_save(tsv_file_path, sv_file_path, output_matches_path):
-    node_to_clones = {}
-    with open(tsv_file_path, "r") as file:
-        next(file)
-        for line in file:
-            parts = line.strip().split("\t")
-            if len(parts) < 2:
-                continue
-            node_id = parts[0]
-            clone_ids = parts[1].split(",") if parts[1] else []
-            node_to_clones[node_id] = clone_ids
-
+def read_sv_breakpoints(sv_file_path):
     sv_details = {}
     with open(sv_file_path, "r") as file:
         next(file)
@@ -135,18 +36,52 @@ def match_node_id_with_sv_and_save(tsv_file_path, sv_file_path, output_matches_p
             else:
                 position_1, position_2 = parts[1], ""
             sv_details[sv_id] = (position_1, position_2)
+    return sv_details
+
+
+def join_meltos_annotations(node_clone_mapping, sv_details, driver_index):
+    """Join Meltos nodes to the breakpoints of their SV clones and the driver genes there.
+
+    Returns the (node, clone, position_1, position_2) matches and the
+    (node, clone, position, driver_gene) driver matches. All breakpoints are
+    looked up in the driver index in one vectorised call.
+    """
+    matches = [
+        (node_id, clone_id) + sv_details[clone_id]
+        for node_id, clone_ids in node_clone_mapping.items()
+        for clone_id in map(str, clone_ids)
+        if clone_id in sv_details
+    ]
+
+    breakpoints = pd.DataFrame(
+        [(i, position) for i, match in enumerate(matches) for position in match[2:]],
+        columns=["match", "position"],
+    )
+    parts = breakpoints["position"].str.extract(BREAKPOINT_PATTERN)
+    valid = parts[1].notna().to_numpy()
+    positions = pd.to_numeric(parts.loc[valid, 1]).to_numpy()
+    query, driver = driver_index.match(
+        normalize_chrom(parts.loc[valid, 0]).to_numpy(), positions, positions
+    )
+    # match() lists each breakpoint's drivers in index order; keep the first.
+    hit, first = np.unique(query, return_index=True)
+    genes = np.full(len(breakpoints), None, dtype=object)
+    genes[np.flatnonzero(valid)[hit]] = driver_index.genes[driver[first]]
+
+    driver_matches = [
+        matches[i][:2] + (position, gene)
+        for i, position, gene in zip(breakpoints["match"], breakpoints["position"], genes)
+        if gene is not None
+    ]
+    return matches, driver_matches
 
-    with open(output_matches_path, "w") as output_file:
-        output_file.write("Node_ID\tClone_ID\tPosition_1\tPosition_2\n")
-        for node_id, clone_ids in node_to_clones.items():
-            for clone_id in clone_ids:
-                if clone_id in sv_details:
-                    position_1, position_2 = sv_details[clone_id]
-                    output_file.write(
-                        f"{node_id}\t{clone_id}\t{position_1}\t{position_2}\n"
-                    )
 
-    print(f"Matches successfully written to {output_matches_path}")
+def write_rows(path, header, rows):
+    with open(path, "w") as file:
+        file.write("\t".join(header) + "\n")
+        for row in rows:
+            file.write("\t".join(map(str, row)) + "\n")
+    print(f"Wrote {path}")
 
 
 def read_node_clone_mapping(mapping_file):
@@ -160,10 +95,10 @@ def read_node_clone_mapping(mapping_file):
 
 
 def plot_meltos_tree(
-    meltos_output_path,
+    relationships,
     node_clone_mapping_file,
     target_dir,
-    driver_file_path,
+    driver_gene_by_node,
     output_filename="meltos_output_tree",
     ranksep=1,
     nodesep=1,
@@ -171,20 +106,6 @@ def plot_meltos_tree(
     dot = Digraph(comment="Meltos Tree")
     graph_title = "Meltos Tree Visualization with Clone Annotation"
     dot.attr(ranksep=str(ranksep), nodesep=str(nodesep))
-    dot.attr("graph", label=graph_title, labelloc="t", fontsize="20", fontcolor="black")
-    relationships = []
-    with open(meltos_output_path, "r") as file:
-        for line in file:
-            if "->" in line:
-                parts = line.strip().split("->")
-                parent = (
-                    parts[0].strip().split()[0]
-                )  
-                child = (
-                    parts[1].strip().split()[0]
-                )  
-                relationships.append((parent, child))
-
     node_clone_mapping = read_node_clone_mapping(node_clone_mapping_file)
 
     for parent, child in relationships:
@@ -205,42 +126,27 @@ def plot_meltos_tree(
         dot.node(child, child_label)
         dot.edge(parent, child)
 
-    dot_file_path = os.path.join(target_dir, "SV_tree")
-    print(f"Rendering DOT file: {dot_file_path}")
-    dot.render(dot_file_path, view=False, format="dot")
-
-    # Generate the Graph Output
     output_file_path = os.path.join(target_dir, output_filename)
-    dot.render(output_file_path, format="png", view=False)
-    print(f"Tree diagram saved to: {output_file_path}.png")
-
-    dot_file_path = os.path.join(target_dir, "SV_tree.dot")
-    txt_file_path = os.path.join(target_dir, "SV_tree.txt")
-    edges_txt_path = os.path.join(target_dir, "SV_tree_Edges.txt")
-
-    save_edge_info_to_txt(dot_file_path, edges_txt_path)
-
-    edge_info = parse_edge_info(edges_txt_path)
+    png_path, edge_info = render_layout(dot, output_file_path)
     print(f"Edge information: {edge_info}")
-    output_file_path = output_file_path
-    driver_gene_by_node = read_driver_matches(driver_file_path)
-    mark_midpoints_on_png(
-        output_file_path + ".png", edge_info, driver_gene_by_node, target_dir
-    )
+    base_image = Image.open(png_path).convert("RGB")
+    add_title(base_image, graph_title).save(png_path)
+    print(f"Tree diagram saved to: {png_path}")
+
+    annotated_image = mark_midpoints_on_png(base_image, edge_info, driver_gene_by_node)
+    annotated_path = output_file_path + "_driver_annotated.png"
+    add_title(annotated_image, graph_title).save(annotated_path)
+    print(f"Driver mutations annotated and saved to {annotated_path}")
     print("Midpoints marking completed.")
     print("Phylogenetic Tree created.")
 
 
-def mark_midpoints_on_png(
-    png_path, edge_info, driver_gene_by_node, target_dir, graphviz_dpi=96.0
-):
+def mark_midpoints_on_png(img, edge_info, driver_gene_by_node, graphviz_dpi=96.0):
+    draw = ImageDraw.Draw(img)
     try:
-        img = Image.open(png_path)
-        draw = ImageDraw.Draw(img)
-        font = ImageFont.truetype("arial.ttf", 15) 
-    except FileNotFoundError:
-        print(f"[ERROR] PNG file not found: {png_path}")
-        return
+        font = ImageFont.truetype("arial.ttf", 15)
+    except OSError:
+        font = ImageFont.load_default(15)
 
     for (parent, child), control_points in edge_info.items():
         if (
@@ -267,38 +173,7 @@ def mark_midpoints_on_png(
                     fill="black",
                     font=font,
                 )
-
-    modified_png_path = png_path.replace(".png", "_driver_annotated.png")
-    img.save(modified_png_path)
-    print(f"Driver mutations annotated and saved to {modified_png_path}")
-
-
-def save_edge_info_to_txt(dot_file_path, edges_txt_path):
-    with open(dot_file_path, "r") as dot_file, open(edges_txt_path, "w") as edges_file:
-        for line in dot_file:
-            if "->" in line:
-                edges_file.write(line)
-    print(f"[INFO] Edge information saved to: {edges_txt_path}")
-
-
-def parse_edge_info(edges_txt_path):
-    edge_info = {}
-    edge_pattern = re.compile(r'(\S+)\s*->\s*(\S+)\s*\[pos="([^"]+)"\];')
-
-    with open(edges_txt_path, "r") as edges_file:
-        for line in edges_file:
-            match = edge_pattern.search(line)
-            if match:
-                parent, child, pos_data = match.groups()
-                control_points = [
-                    (float(x), float(y))
-                    for x, y in (
-                        pt.split(",") for pt in pos_data.replace("e,", "").split()
-                    )
-                ]
-                edge_info[(parent, child)] = control_points
-                print(f"Control points for edge {parent} -> {child}: {control_points}")
-    return edge_info
+    return img
 
 
 def graphviz_to_png_coordinates(point, img_height, dpi=96):
@@ -308,41 +183,41 @@ def graphviz_to_png_coordinates(point, img_height, dpi=96):
     return x_pixels, y_pixels
 
 
-def read_driver_matches(driver_matches_path):
-    driver_gene_by_node = {}
-    df = pd.read_csv(driver_matches_path, sep="\t")
-    print(df)
-    for _, row in df.iterrows():
-        node_id = str(row["Node_ID"])
-        driver_gene = row["Driver_Gene"]
-        driver_gene_by_node[node_id] = driver_gene
-    return driver_gene_by_node
+def plot_meltos(target_dir, sv_file_path, driver_file_path, input_file_base_name,
+                debug_tsv=False, meltos_result=None):
+    meltos_result = meltos_result or load_meltos_result(target_dir)
 
-
-def plot_meltos(target_dir, sv_file_path, driver_file_path,input_file_base_name):
-    meltos_file_path = find_most_recent_meltos_file(target_dir)
-    
-    if not meltos_file_path:
+    if meltos_result is None:
         print("Failed to find a Meltos output file. Please check the directory.")
         return
-    
-    print(f"Processing Meltos output file: {meltos_file_path}")
-    
-    node_clone_mapping = parse_meltos_output_for_clones(meltos_file_path)
-    output_tsv_path = os.path.join(target_dir, "node_clone_mapping.tsv")
-    save_node_clone_mapping_to_tsv(node_clone_mapping, output_tsv_path)
-    
-    output_matches_path = os.path.join(target_dir, "matches.tsv")
-    match_node_id_with_sv_and_save(output_tsv_path, sv_file_path, output_matches_path)
-    
-    driver_mutations = read_driver_mutation_file(driver_file_path)
-    driver_matches_path = os.path.join(target_dir, "driver_matches.tsv")
-    match_driver_mutations_to_nodes(driver_mutations, output_matches_path, driver_matches_path)
-    
-    print("Integration and matching process complete.")
+
+    print(f"Processing Meltos output file: {meltos_result.output_path}")
+
+    node_clone_mapping = meltos_result.node_clone_mapping
+    sv_details = read_sv_breakpoints(sv_file_path)
+    driver_mutations, driver_index = load_driver_table(driver_file_path)
+    matches, driver_matches = join_meltos_annotations(
+        node_clone_mapping, sv_details, driver_index
+    )
+
+    if debug_tsv:
+        save_node_clone_mapping_to_tsv(
+            node_clone_mapping, os.path.join(target_dir, "node_clone_mapping.tsv"))
+        write_rows(
+            os.path.join(target_dir, "matches.tsv"),
+            ["Node_ID", "Clone_ID", "Position_1", "Position_2"],
+            matches,
+        )
+        write_rows(
+            os.path.join(target_dir, "driver_matches.tsv"),
+            ["Node_ID", "Clone_ID", "Position", "Driver_Gene"],
+            driver_matches,
+        )
+
+    print(f"Matched {len(driver_matches)} SV breakpoints to driver genes.")
+    driver_gene_by_node = {node_id: gene for node_id, _, _, gene in driver_matches}
     node_clone_mapping_file = os.path.join(target_dir, f"{input_file_base_name}snv_CloneFinderCloneID.txt")
 
-    
-    plot_meltos_tree(meltos_file_path, node_clone_mapping_file, target_dir, driver_matches_path)
-    
+    plot_meltos_tree(meltos_result.edges, node_clone_mapping_file, target_dir, driver_gene_by_node)
+
     print("Phylogenetic Tree Creation Complete.")
@@ -8,7 +8,6 @@ from graphviz import Digraph
 from matplotlib.colors import CSS4_COLORS
 from PIL import Image, ImageDraw, ImageFont, ImageColor
 from math import sqrt
-import time
 
 
 def is_color_dark(rgb):
@@ -48,7 +47,6 @@ def read_signatures_from_control_file(control_file_path):
 
 def signature_pie_plots(target_dir, signature_file_dir, control_file_path):
     print("Creating pie plots for signature distribution...")
-    time.sleep(1)
     signatures = read_signatures_from_control_file(control_file_path)
     print(f"Signature names: {signatures}")
     color_map = generate_color_map(signatures)
@@ -8,7 +8,6 @@ from graphviz import Digraph
 from matplotlib.colors import CSS4_COLORS
 from PIL import Image, ImageDraw, ImageFont, ImageColor
 from math import sqrt
-import time
 
 from plot_scripts.mut_func import mutation_plots
 from plot_scripts.pie_func import (
@@ -16,7 +15,7 @@ from plot_scripts.pie_func import (
     read_signatures_from_control_file,
     generate_color_map,
 )
-from plot_scripts.tree_func import plot_tree, plot_tree_with_driver
+from plot_scripts.tree_func import plot_trees
 
 
 def combine(
@@ -121,27 +120,15 @@ def run(
     tree_output_driver,
     bar_plots_output_dir,
     matched_positions,
-    driver_data,
-    position_to_gene,
-    position_to_gene_name,
 ):
     print("Plot creation starting...")
-    time.sleep(2)
-    mutation_plots(
-        target_dir,
-        csv_files_dir,
-        matched_positions,
-        position_to_gene,
-        position_to_gene_name,
-    )
+    mutation_plots(target_dir, csv_files_dir, matched_positions)
     signature_pie_plots(target_dir, signature_files_dir, control_file)
-    plot_tree(target_dir, summary_file_path, input_file_base_name)
-    plot_tree_with_driver(
+    plot_trees(
         target_dir,
         summary_file_path,
         input_file_base_name,
         matched_positions,
-        driver_data,
     )
     combine(
         target_dir,
@@ -152,4 +139,3 @@ def run(
         control_file,
     )
     print("Plot creation complete.")
-    time.sleep(2)
@@ -9,10 +9,11 @@ from graphviz import Digraph
 from matplotlib.colors import CSS4_COLORS
 from PIL import Image, ImageDraw, ImageFont, ImageColor
 from math import sqrt
-import time
 import glob
 import math
 
+from plot_scripts.graph_layout import render_layout, add_title
+
 
 def debug_print_tree_lines(summary_file_path):
     tree_structure_started = False
@@ -29,192 +30,116 @@ def debug_print_tree_lines(summary_file_path):
                     break
 
 
-def plot_tree(
-    target_dir, summary_file_path, input_file_base_name, ranksep=2, nodesep=2
-):
-    print("Creating Phylogenetic Tree...")
-    time.sleep(1)
-    find_and_append_root_node(summary_file_path)
+_summary_memo = {}
 
-    df = pd.read_csv(summary_file_path, sep="\t", comment="#")
-    dot = Digraph(comment="Phylogenetic Tree")
-    nodes = {}
 
-    if "Normal" not in df["New branch ID"].values:
-        dot.node("Normal", "Normal")
+class PhyloSignareSummary:
+    """Node table and edge list of a PhyloSignare Summary.txt.
+
+    If no edge leaves Normal, a Normal->root edge is added for every root in
+    memory; the summary file itself is never modified.
+    """
+
+    def __init__(self, nodes, edges, listed_nodes):
+        self.nodes = nodes
+        self.edges = edges
+        self.listed_nodes = listed_nodes
 
-    for index, row in df.iterrows():
-        node_name = row["New branch ID"]
-        mutation_count = row["Number of mutations"]
-        if pd.notnull(mutation_count):
-            node_label = f"{node_name}\n({int(mutation_count)})"
-            dot.node(node_name, node_label)
-            nodes[node_name] = int(mutation_count)
-            print(f"Node added: {node_name} with mutation count {mutation_count}")
-        else:
-            print(f"Node {node_name} skipped due to NaN mutation count")
 
+def parse_summary(summary_file_path):
+    df = pd.read_csv(summary_file_path, sep="\t", comment="#")
+    listed_nodes = set(df["New branch ID"].astype(str))
+    counted = df[pd.notnull(df["Number of mutations"])]
+    nodes = dict(
+        zip(counted["New branch ID"], counted["Number of mutations"].astype(int))
+    )
+
+    all_edges = []
+    tree_edges = []
     with open(summary_file_path, "r") as file:
         tree_structure_started = False
         for line in file:
             if line.startswith("#Tree"):
                 tree_structure_started = True
                 continue
-            if tree_structure_started and "->" in line:
-                parent, daughter = line.strip().split("->")
-                if parent.strip() in nodes and daughter.strip() in nodes:
-                    dot.edge(parent.strip(), daughter.strip())
-                    print(
-                        f"Established relationship: {parent.strip()} -> {daughter.strip()}"
-                    )
-                elif parent.strip() == "Normal":
-                    dot.edge(parent.strip(), daughter.strip())
-                    print(
-                        f"Established relationship: {parent.strip()} -> {daughter.strip()}"
-                    )
-
-    dot.attr(ranksep=str(ranksep), nodesep=str(nodesep))
-    graph_title = "(A) Phylogenetic Tree"
-    dot.attr("graph", label=graph_title, labelloc="t", fontsize="20", fontcolor="black")
-    dot_file_path = os.path.join(target_dir, "Phylogenetic_Tree")
-    print(f"Rendering DOT file: {dot_file_path}")
-    dot.render(dot_file_path, view=False, format="dot")
-
-    output_file_name = "Phylogenetic_Tree"
-    output_file_path = os.path.join(target_dir, output_file_name)
-    print(f"Rendering PNG file: {output_file_path}")
-    dot.render(output_file_path, view=False, format="png")
+            if "->" in line:
+                parent, child = (part.strip() for part in line.strip().split("->"))
+                all_edges.append((parent, child))
+                if tree_structure_started:
+                    tree_edges.append((parent, child))
 
-    dot_file_path = os.path.join(target_dir, "Phylogenetic_Tree.dot")
-    txt_file_path = os.path.join(target_dir, "Phylogenetic_Tree.txt")
-    edges_txt_path = os.path.join(target_dir, "Phylogenetic_Tree_Edges.txt")
+    if not any(parent == "Normal" for parent, child in all_edges):
+        parents = {parent for parent, child in all_edges}
+        children = {child for parent, child in all_edges}
+        for root_node in sorted(parents - children - {"Normal"}):
+            tree_edges.append(("Normal", root_node))
+            print(f"[INFO] Using 'Normal->{root_node}' as the root of the tree.")
 
-    save_edge_info_to_txt(dot_file_path, edges_txt_path)
+    return PhyloSignareSummary(nodes, tree_edges, listed_nodes)
 
-    edge_info = parse_edge_info(edges_txt_path)
-    print(f"Edge information: {edge_info}")
-    output_file_path = output_file_path
-    mark_midpoints_on_png(output_file_path + ".png", edge_info, target_dir)
-    print("Midpoints marking completed.")
-    print("Phylogenetic Tree created.")
 
+def load_summary(summary_file_path):
+    stat = os.stat(summary_file_path)
+    memo_key = (os.path.abspath(summary_file_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _summary_memo:
+        _summary_memo[memo_key] = parse_summary(summary_file_path)
+    return _summary_memo[memo_key]
 
-def plot_tree_with_driver(
-    target_dir,
-    summary_file_path,
-    input_file_base_name,
-    matched_positions,
-    driver_data,
-    ranksep=2,
-    nodesep=2,
-):
-    print("Creating Phylogenetic Tree...")
-    time.sleep(1)
-    find_and_append_root_node(summary_file_path)
 
-    df = pd.read_csv(summary_file_path, sep="\t", comment="#")
+def build_tree_graph(summary_file_path, ranksep=2, nodesep=2):
+    summary = load_summary(summary_file_path)
     dot = Digraph(comment="Phylogenetic Tree")
-    nodes = {}
 
-    if "Normal" not in df["New branch ID"].values:
+    if "Normal" not in summary.listed_nodes:
         dot.node("Normal", "Normal")
 
-    for index, row in df.iterrows():
-        node_name = row["New branch ID"]
-        mutation_count = row["Number of mutations"]
-        if pd.notnull(mutation_count):
-            node_label = f"{node_name}\n({int(mutation_count)})"
-            dot.node(node_name, node_label)
-            nodes[node_name] = int(mutation_count)
-            print(f"Node added: {node_name} with mutation count {mutation_count}")
-        else:
-            print(f"Node {node_name} skipped due to NaN mutation count")
+    for node_name, mutation_count in summary.nodes.items():
+        dot.node(node_name, f"{node_name}\n({mutation_count})")
 
-    with open(summary_file_path, "r") as file:
-        tree_structure_started = False
-        for line in file:
-            if line.startswith("#Tree"):
-                tree_structure_started = True
-                continue
-            if tree_structure_started and "->" in line:
-                parent, daughter = line.strip().split("->")
-                if parent.strip() in nodes and daughter.strip() in nodes:
-                    dot.edge(parent.strip(), daughter.strip())
-                    print(
-                        f"Established relationship: {parent.strip()} -> {daughter.strip()}"
-                    )
-                elif parent.strip() == "Normal":
-                    dot.edge(parent.strip(), daughter.strip())
-                    print(
-                        f"Established relationship: {parent.strip()} -> {daughter.strip()}"
-                    )
+    for parent, daughter in summary.edges:
+        if (parent in summary.nodes and daughter in summary.nodes) or parent == "Normal":
+            dot.edge(parent, daughter)
+            print(f"Established relationship: {parent} -> {daughter}")
 
     dot.attr(ranksep=str(ranksep), nodesep=str(nodesep))
-    graph_title = "(B) Phylogenetic Tree with Driver Mutations"
-    dot.attr("graph", label=graph_title, labelloc="t", fontsize="20", fontcolor="black")
-    dot_file_path = os.path.join(target_dir, "Phylogenetic_Tree")
-    print(f"Rendering DOT file: {dot_file_path}")
-    dot.render(dot_file_path, view=False, format="dot")
+    return dot
 
-    output_file_name = "Phylogenetic_Tree"
-    output_file_path = os.path.join(target_dir, output_file_name)
-    print(f"Rendering PNG file: {output_file_path}")
-    dot.render(output_file_path, view=False, format="png")
 
-    dot_file_path = os.path.join(target_dir, "Phylogenetic_Tree.dot")
-    txt_file_path = os.path.join(target_dir, "Phylogenetic_Tree.txt")
-    edges_txt_path = os.path.join(target_dir, "Phylogenetic_Tree_Edges.txt")
+def plot_trees(
+    target_dir,
+    summary_file_path,
+    input_file_base_name,
+    matched_positions,
+    ranksep=2,
+    nodesep=2,
+):
+    """Lay the PhyloSignare tree out once and write both annotated figures:
+    Phylogenetic_Tree_complete.png (signature pies) and
+    Phylogenetic_Tree_driver.png (driver genes)."""
+    print("Creating Phylogenetic Tree...")
+    dot = build_tree_graph(summary_file_path, ranksep, nodesep)
+    png_path, edge_info = render_layout(
+        dot, os.path.join(target_dir, "Phylogenetic_Tree")
+    )
+    print(f"Edge information: {edge_info}")
+    base_image = Image.open(png_path).convert("RGB")
 
-    save_edge_info_to_txt(dot_file_path, edges_txt_path)
+    complete_image = mark_midpoints_on_png(base_image.copy(), edge_info, target_dir)
+    complete_path = os.path.join(target_dir, "Phylogenetic_Tree_complete.png")
+    add_title(complete_image, "(A) Phylogenetic Tree").save(complete_path)
+    print(f"Specific midpoints with pie charts drawn and saved to {complete_path}")
 
-    edge_info = parse_edge_info(edges_txt_path)
-    print(f"Edge information: {edge_info}")
-    output_file_path = output_file_path
-    mark_midpoints_on_png_driver(
-        output_file_path + ".png", edge_info, target_dir, matched_positions, driver_data
+    driver_image = mark_midpoints_on_png_driver(
+        base_image.copy(), edge_info, matched_positions
     )
-    print("Midpoints marking completed.")
+    driver_path = os.path.join(target_dir, "Phylogenetic_Tree_driver.png")
+    add_title(driver_image, "(B) Phylogenetic Tree with Driver Mutations").save(
+        driver_path
+    )
+    print(f"Driver mutations annotated and saved to {driver_path}")
     print("Phylogenetic Tree created.")
 
 
-def find_and_append_root_node(summary_file_path):
-    parent_nodes = set()
-    child_nodes = set()
-    normal_relationship_exists = False
-
-    with open(summary_file_path, "r") as file:
-        for line in file:
-            if "->" in line:
-                parent, child = line.strip().split("->")
-                parent = parent.strip()
-                child = child.strip()
-                if parent == "Normal":
-                    normal_relationship_exists = True
-                parent_nodes.add(parent)
-                child_nodes.add(child)
-
-    if not normal_relationship_exists:
-        root_nodes = parent_nodes - child_nodes
-
-        root_nodes.discard("Normal")
-
-        for root_node in root_nodes:
-            append_normal_relationship(summary_file_path, root_node)
-            print(
-                f"[INFO] Added 'Normal->{root_node}' to ensure 'Normal' is the ultimate root."
-            )
-    else:
-        print(
-            "[INFO] A 'Normal' relationship already exists in the file. No new relationship added."
-        )
-
-
-def append_normal_relationship(summary_file_path, root_node):
-    with open(summary_file_path, "a") as file:
-        file.write(f"Normal->{root_node}\n")
-    print(f"[INFO] Added new root relationship to summary file: 'Normal->{root_node}'")
-
-
 def dot_to_text(dot_path, txt_path):
     try:
         with open(dot_path, "r") as dot_file, open(txt_path, "w") as txt_file:
@@ -225,41 +150,7 @@ def dot_to_text(dot_path, txt_path):
         print(f"[ERROR] Conversion failed: {e}")
 
 
-def save_edge_info_to_txt(dot_file_path, edges_txt_path):
-    with open(dot_file_path, "r") as dot_file, open(edges_txt_path, "w") as edges_file:
-        for line in dot_file:
-            if "->" in line:
-                edges_file.write(line)
-    print(f"[INFO] Edge information saved to: {edges_txt_path}")
-
-
-def parse_edge_info(edges_txt_path):
-    edge_info = {}
-    edge_pattern = re.compile(r'(\S+)\s*->\s*(\S+)\s*\[pos="([^"]+)"\];')
-
-    with open(edges_txt_path, "r") as edges_file:
-        for line in edges_file:
-            match = edge_pattern.search(line)
-            if match:
-                parent, child, pos_data = match.groups()
-                control_points = [
-                    (float(x), float(y))
-                    for x, y in (
-                        pt.split(",") for pt in pos_data.replace("e,", "").split()
-                    )
-                ]
-                edge_info[(parent, child)] = control_points
-                print(f"Control points for edge {parent} -> {child}: {control_points}")
-    return edge_info
-
-
-def mark_midpoints_on_png(png_path, edge_info, target_dir, graphviz_dpi=96.0):
-    try:
-        img = Image.open(png_path)
-    except FileNotFoundError:
-        print(f"[ERROR] PNG file not found: {png_path}")
-        return None
-
+def mark_midpoints_on_png(img, edge_info, target_dir, graphviz_dpi=96.0):
     for (parent, child), control_points in edge_info.items():
         child_prefix = child.split("_")[0]
         pie_chart_path = os.path.join(target_dir, f"{child_prefix}_signature_pie.png")
@@ -280,21 +171,10 @@ def mark_midpoints_on_png(png_path, edge_info, target_dir, graphviz_dpi=96.0):
                     int(midpoint_png[1] - pie_chart_image.height / 2),
                 )
                 img.paste(pie_chart_image, top_left, pie_chart_image)
+    return img
 
-    modified_png_path = png_path.replace(".png", "_complete.png")
-    img.save(modified_png_path)
-    print(f"Specific midpoints with pie charts drawn and saved to {modified_png_path}")
-
-
-def mark_midpoints_on_png_driver(
-    png_path, edge_info, target_dir, matched_positions, driver_data, graphviz_dpi=96.0
-):
-    try:
-        img = Image.open(png_path)
-    except FileNotFoundError:
-        print(f"[ERROR] PNG file not found: {png_path}")
-        return None
 
+def mark_midpoints_on_png_driver(img, edge_info, matched_positions, graphviz_dpi=96.0):
     draw = ImageDraw.Draw(img)
     try:
         font_size = 18
@@ -307,32 +187,10 @@ def mark_midpoints_on_png_driver(
     )
     spacing = 5 
 
-    driver_data["Preprocessed Mutation Summary"] = (
-        driver_data["Mutation Summary"].str.split().str[0]
-    )
-
-    driver_data[["chr", "position"]] = driver_data[
-        "Preprocessed Mutation Summary"
-    ].str.split(":", expand=True)
+    genes_by_branch = matched_positions.groupby("branch", observed=True)["gene"].agg(set).to_dict()
 
     for (parent, child), control_points in edge_info.items():
-        gene_names_set = set()
-        for mutation_summary, mutations in matched_positions.items():
-            chromosome, position = mutation_summary.split(":")
-
-            matching_driver_data = driver_data[
-                (driver_data["chr"] == chromosome)
-                & (driver_data["position"] == position)
-            ]
-
-            for mutation in mutations:
-                if len(mutation) < 2:
-                    continue
-
-                file_name = mutation[0]
-                if file_name == child:
-                    gene_names = matching_driver_data["Driver Gene"].values
-                    gene_names_set.update(gene_names)
+        gene_names_set = genes_by_branch.get(child, set())
 
         if gene_names_set and len(control_points) >= 5:
             midpoint_graphviz = (
@@ -358,12 +216,7 @@ def mark_midpoints_on_png_driver(
             gene_names_str = ", ".join(sorted(gene_names_set))
             text_position = (dot_center[0] + dot_radius + 5, dot_center[1] - dot_radius)
             draw.text(text_position, gene_names_str, fill="black", font=font)
-
-    modified_png_path = os.path.join(
-        target_dir, os.path.basename(png_path).replace(".png", "_driver.png")
-    )
-    img.save(modified_png_path)
-    print(f"Driver mutations annotated and saved to {modified_png_path}")
+    return img
 
 
 def graphviz_to_png_coordinates(point, img_height, dpi=96):
@@ -423,73 +276,3 @@ def find_best_midpoint(control_points, actual_midpoint):
                 best_pair = (control_points[i], control_points[j])
 
     return best_pair, best_midpoint, min_distance
-
-
-def parse_csv_files(directory):
-    mutation_data = {}
-    for file_path in glob.glob(os.path.join(directory, "*.csv")):
-        try:
-            df = pd.read_csv(
-                file_path, header=None, sep=",", na_values="NA", keep_default_na=False
-            )
-            if df.shape[1] < 3:
-                print(
-                    f"File {os.path.basename(file_path)} has less than 3 columns. Skipping."
-                )
-                continue
-            for index, row in df.dropna().iterrows():
-                positions = []
-                raw_positions = str(row[2]).split(";")
-                for raw_position in raw_positions:
-                    if "-" in raw_position:
-                        base, range_part = raw_position.split(":")
-                        start_pos, end_pos = range_part.split("-")
-                        positions.append(f"{base}:{start_pos}")
-                        positions.append(f"{base}:{end_pos}")
-                    else:
-                        positions.append(raw_position)
-
-                for position in positions:
-                    if position:
-                        file_identifier = os.path.basename(file_path).split("_")[0]
-                        mutation_data.setdefault(position, []).append(
-                            (file_identifier, row[0], row[1])
-                        )
-        except Exception as e:
-            print(f"Error processing file {os.path.basename(file_path)}: {e}")
-    return mutation_data
-
-
-def process_driver_file(file_path):
-    driver_mutations = pd.read_csv(file_path, sep="\t")
-    position_to_gene = {}
-    for index, row in driver_mutations.iterrows():
-        raw_positions = row["Mutation Summary"].split(" ")[0]
-        gene_name = row["Driver Gene"]
-        if "-" in raw_positions:
-            start, end = raw_positions.split("-")
-            base, start_pos = start.rsplit(":", 1)
-            end_pos = end
-            position_to_gene[f"{base}:{start_pos}"] = gene_name
-            position_to_gene[f"{base}:{end_pos}"] = gene_name
-        else:
-            position_to_gene[raw_positions] = gene_name
-
-    return driver_mutations, position_to_gene
-
-
-def match_positions(mutation_data, driver_mutations, position_to_gene):
-    matched_positions = {}
-    for position, gene_name in position_to_gene.items():
-        if position in mutation_data:
-            matched_positions[position] = mutation_data[position]
-            for file_identifier, mutation_type, count in mutation_data[position]:
-                print(
-                    f"Gene {gene_name} Position {position} has mutation count {count} in file {file_identifier} with mutation {mutation_type} and is a driver mutation."
-                )
-        else:
-            print(
-                f"No match found for position: {position} belonging to gene {gene_name}"
-            )
-    return matched_positions
-
@@ -1,15 +1,16 @@
 import subprocess
 import os
 
+from analysis.r_worker import run_r_script as run_worker_script
+
 current_script_dir = os.path.dirname(os.path.realpath(__file__))
 r_scripts_dir = os.path.join(current_script_dir)
 
 def run_r_script(script_name):
     script_path = os.path.join(r_scripts_dir, script_name)
     print(script_path)
-    command = ["Rscript", script_path]
     try:
-        subprocess.run(command, check=True)
+        print(run_worker_script(script_path))
     except subprocess.CalledProcessError as e:
         print(f"Error running {os.path.basename(script_path)}: {e.stderr}")
         print(f"Standard Output: {e.stdout}")
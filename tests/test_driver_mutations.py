@@ -0,0 +1,113 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from analysis.driver_mutations import CGIClient, fetch_cgi_batch, fetch_cgi_results
+
+
+def results_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("alterations.tsv", "chr\tpos\tref\talt\n")
+    return buffer.getvalue()
+
+
+class CGIStub(BaseHTTPRequestHandler):
+    """Local stand-in for the CGI API: every job is done at once.
+
+    ``server.failures`` maps an action ("submit", "logs", "download") to the
+    number of 503 responses to send before answering normally.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def fail(self, action):
+        self.server.requests.append(action)
+        if self.server.failures.get(action, 0) > 0:
+            self.server.failures[action] -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return True
+        return False
+
+    def reply(self, body, content_type="application/json"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        if not self.fail("submit"):
+            self.reply(json.dumps("job-1").encode())
+
+    def do_GET(self):
+        action = parse_qs(urlparse(self.path).query)["action"][0]
+        if self.fail(action):
+            return
+        if action == "logs":
+            self.reply(json.dumps({"status": "Done"}).encode())
+        else:
+            self.reply(results_zip(), "application/zip")
+
+
+class CGIClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), CGIStub)
+        self.server.requests = []
+        self.server.failures = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/api/v1"
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        self.mutation_file = os.path.join(self.tmp_dir, "patient_cgi.txt")
+        with open(self.mutation_file, "w") as file:
+            file.write("chr\tpos\tref\talt\nchr1\t100\tA\tT\n")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_second_run_uses_cached_results(self):
+        jobs = [(self.mutation_file, "LAML")]
+        first = fetch_cgi_batch(jobs, "token", "me@example.org", workers=1,
+                                base_url=self.base_url, cache_dir=self.cache_dir)
+        second = fetch_cgi_batch(jobs, "token", "me@example.org", workers=1,
+                                 base_url=self.base_url, cache_dir=self.cache_dir)
+
+        self.assertEqual(first, second)
+        with zipfile.ZipFile(first[self.mutation_file]) as archive:
+            self.assertEqual(archive.namelist(), ["alterations.tsv"])
+        self.assertEqual(self.server.requests, ["submit", "logs", "download"])
+
+    def test_transient_server_errors_are_retried(self):
+        self.server.failures = {"logs": 2, "download": 1}
+        client = CGIClient("me@example.org", "token", base_url=self.base_url,
+                           backoff=0, poll_interval=0)
+        try:
+            zip_path = fetch_cgi_results(client, self.mutation_file, "LAML",
+                                         cache_dir=self.cache_dir)
+        finally:
+            client.close()
+
+        self.assertTrue(os.path.exists(zip_path))
+        self.assertEqual(
+            self.server.requests,
+            ["submit", "logs", "logs", "logs", "download", "download"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+from Bio import Phylo
+
+from analysis.picante_engine import (
+    load_tree_matrices,
+    match_comm_tree,
+    neighbor_joining,
+    unifrac,
+)
+
+# Saitou & Nei's additive example: NJ, including ape::nj() as called by the
+# picante R scripts, recovers the tree with tips a 2, b 3, c 4, d 2, e 1 and
+# internal branches 3 and 2, whose tip-to-tip path lengths are this matrix.
+LABELS = ["a", "b", "c", "d", "e"]
+DISTANCES = np.array(
+    [
+        [0, 5, 9, 9, 8],
+        [5, 0, 10, 10, 9],
+        [9, 10, 0, 8, 7],
+        [9, 10, 8, 0, 3],
+        [8, 9, 7, 3, 0],
+    ],
+    dtype=float,
+)
+
+
+def path_lengths(newick):
+    tree = Phylo.read(StringIO(newick), "newick")
+    return np.array([[tree.distance(a, b) if a != b else 0.0 for b in LABELS] for a in LABELS])
+
+
+class NeighborJoiningTest(unittest.TestCase):
+    def test_recovers_additive_tree(self):
+        newick = neighbor_joining(DISTANCES, LABELS)
+        np.testing.assert_allclose(path_lengths(newick), DISTANCES)
+
+    def test_ignores_diagonal(self):
+        # comdist's diagonal holds each community's own MPD; as.dist() drops it.
+        with_diagonal = DISTANCES.copy()
+        np.fill_diagonal(with_diagonal, [4.0, 1.0, 7.0, 2.0, 5.0])
+        self.assertEqual(
+            neighbor_joining(with_diagonal, LABELS), neighbor_joining(DISTANCES, LABELS)
+        )
+        np.testing.assert_allclose(
+            path_lengths(neighbor_joining(with_diagonal, LABELS)), DISTANCES
+        )
+
+
+class UnifracTest(unittest.TestCase):
+    def unifrac_values(self, newick, comm):
+        with tempfile.NamedTemporaryFile("w", suffix=".nwk", delete=False) as file:
+            file.write(newick)
+        try:
+            tip_labels, branch_lengths, descendants, _ = load_tree_matrices(file.name)
+        finally:
+            os.remove(file.name)
+        comm, tip_columns = match_comm_tree(comm, tip_labels)
+        return unifrac(comm, branch_lengths, descendants[:, tip_columns])
+
+    def test_counts_branches_to_the_root(self):
+        # Normal is in the tree but not in the community, as in the pipeline.
+        # picante::unifrac(comm, tree) on this input gives T1-T2 0.5 and
+        # T1-T3, T2-T3 0.25: PDs (include.root = TRUE) are 3, 3 and 4.
+        comm = pd.DataFrame(
+            {"A": [1, 0, 1], "B": [0, 1, 1]}, index=["T1", "T2", "T3"]
+        )
+        values = self.unifrac_values("((A:1,B:1):2,Normal:1);", comm)
+        np.testing.assert_allclose(
+            values,
+            [[0.0, 0.5, 0.25], [0.5, 0.0, 0.25], [0.25, 0.25, 0.0]],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
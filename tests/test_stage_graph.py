@@ -0,0 +1,76 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from analysis.stage_graph import Stage, load_stage_cache, run_stage_graph
+from analysis.tool_runner import ToolRunError, run_tool
+
+
+def tool_stage(input_file, target_dir, exit_code):
+    # Writes <input>.out next to its input, then exits with ``exit_code``.
+    script = (
+        "import sys; open(sys.argv[1] + '.out', 'w').write(open(sys.argv[1]).read()); "
+        "sys.exit(int(sys.argv[2]))"
+    )
+    run_tool(
+        "Tool",
+        [sys.executable, "-c", script, "{input}", str(exit_code)],
+        target_dir,
+        inputs={"input": input_file},
+        outputs={"*.out": "result.txt"},
+    ).check()
+
+
+class StageGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.target_dir = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.target_dir, "input.txt")
+        self.write_input("first")
+
+    def tearDown(self):
+        shutil.rmtree(self.target_dir, ignore_errors=True)
+
+    def write_input(self, text):
+        with open(self.input_file, "w") as file:
+            file.write(text)
+
+    def stages(self, exit_code):
+        return [
+            Stage(
+                "Tool",
+                tool_stage,
+                {"input_file": self.input_file, "target_dir": self.target_dir,
+                 "exit_code": exit_code},
+                inputs=[self.input_file],
+                outputs=[os.path.join(self.target_dir, "result.txt")],
+            )
+        ]
+
+    def test_failed_tool_stage_is_not_cached(self):
+        self.assertEqual(run_stage_graph(self.stages(0), self.target_dir), {"Tool": "ran"})
+        self.assertEqual(run_stage_graph(self.stages(0), self.target_dir), {"Tool": "cached"})
+
+        # The tool now fails while result.txt from the first run is still there.
+        self.write_input("second")
+        with self.assertRaises(ToolRunError):
+            run_stage_graph(self.stages(1), self.target_dir)
+        self.assertNotIn("Tool", load_stage_cache(self.target_dir))
+        with open(os.path.join(self.target_dir, "result.txt")) as file:
+            self.assertEqual(file.read(), "first")
+
+        self.assertEqual(run_stage_graph(self.stages(0), self.target_dir), {"Tool": "ran"})
+        with open(os.path.join(self.target_dir, "result.txt")) as file:
+            self.assertEqual(file.read(), "second")
+
+    def test_unknown_dependency_is_rejected(self):
+        stages = self.stages(0)
+        stages[0].deps = ["CloneFindr"]
+        with self.assertRaisesRegex(ValueError, "unknown stage 'CloneFindr'"):
+            run_stage_graph(stages, self.target_dir)
+        self.assertFalse(os.path.exists(os.path.join(self.target_dir, "result.txt")))
+
+
+if __name__ == "__main__":
+    unittest.main()
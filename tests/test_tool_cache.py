@@ -0,0 +1,79 @@
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from analysis import tool_cache
+from analysis.tool_cache import cached_tool
+
+UPSTREAM_URL = "https://example.invalid/Tool.git"
+
+
+def git(*args, cwd=None):
+    return subprocess.run(
+        ["git", "-c", "user.name=GenoPath", "-c", "user.email=genopath@example.org",
+         *args],
+        cwd=cwd, check=True, capture_output=True, text=True,
+    ).stdout.strip()
+
+
+class ToolCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        work = os.path.join(self.tmp_dir, "work")
+        os.makedirs(os.path.join(work, "data"))
+        with open(os.path.join(work, "tool.py"), "w") as file:
+            file.write("print('tool')\n")
+        with open(os.path.join(work, "data", "table.txt"), "w") as file:
+            file.write("1\n")
+        git("init", "--quiet", work)
+        git("add", ".", cwd=work)
+        git("commit", "--quiet", "-m", "Tool", cwd=work)
+        self.commit = git("rev-parse", "HEAD", cwd=work)
+        self.bare = os.path.join(self.tmp_dir, "Tool.git")
+        git("clone", "--quiet", "--bare", work, self.bare)
+
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        self.env = mock.patch.dict(
+            os.environ, {"GENOPATH_TOOL_CACHE": self.cache_dir, "GENOPATH_TOOL_URL": self.bare}
+        )
+        self.env.start()
+        for name in ("GENOPATH_OFFLINE", "GENOPATH_TOOL_COMMIT"):
+            os.environ.pop(name, None)
+        tool_cache._checkouts.clear()
+
+    def tearDown(self):
+        self.env.stop()
+        tool_cache._checkouts.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_seeds_cache_from_local_bare_repository(self):
+        checkout = cached_tool("Tool", UPSTREAM_URL)
+
+        self.assertEqual(checkout, os.path.join(self.cache_dir, f"Tool@{self.commit}"))
+        with open(os.path.join(self.cache_dir, "Tool.commit")) as file:
+            self.assertEqual(file.read().strip(), self.commit)
+        for path in ("tool.py", os.path.join("data", "table.txt")):
+            mode = os.stat(os.path.join(checkout, path)).st_mode
+            self.assertEqual(mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH), 0)
+
+    def test_offline_uses_seeded_cache(self):
+        checkout = cached_tool("Tool", UPSTREAM_URL)
+        tool_cache._checkouts.clear()
+        # Offline, neither the upstream URL nor the mirror is contacted.
+        os.environ["GENOPATH_OFFLINE"] = "1"
+        os.environ["GENOPATH_TOOL_URL"] = os.path.join(self.tmp_dir, "missing.git")
+
+        self.assertEqual(cached_tool("Tool", UPSTREAM_URL), checkout)
+
+    def test_offline_with_empty_cache_raises(self):
+        os.environ["GENOPATH_OFFLINE"] = "1"
+        with self.assertRaisesRegex(RuntimeError, "No cached Tool checkout"):
+            cached_tool("Tool", UPSTREAM_URL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from analysis.tool_runner import run_tool
+
+# Writes <input>.out next to its input, log.txt into its working directory
+# and a file into its own data directory, whose suffix.txt it reads.
+TOOL_SCRIPT = """import sys
+with open("data/suffix.txt") as f:
+    suffix = f.read().strip()
+with open(sys.argv[1]) as f:
+    text = f.read().strip()
+with open(sys.argv[1] + ".out", "w") as f:
+    f.write(text + suffix)
+with open("log.txt", "w") as f:
+    f.write("done")
+with open("data/state.txt", "w") as f:
+    f.write("done")
+"""
+
+
+class RunToolTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.root = tempfile.mkdtemp()
+        os.chdir(self.root)
+        os.makedirs(os.path.join("tool", "data"))
+        with open(os.path.join("tool", "tool.py"), "w") as f:
+            f.write(TOOL_SCRIPT)
+        with open(os.path.join("tool", "data", "suffix.txt"), "w") as f:
+            f.write("-processed")
+        os.makedirs("inputs")
+        with open(os.path.join("inputs", "sample.txt"), "w") as f:
+            f.write("sample")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_relative_target_and_tool_dirs(self):
+        run = run_tool(
+            "Tool",
+            [sys.executable, "tool.py", "{input}"],
+            "results",
+            tool_dir="tool",
+            inputs={"input": os.path.join("inputs", "sample.txt")},
+            outputs={"sample.txt.out": "sample_tool.txt", "log.txt": None},
+        )
+        self.assertEqual(run.returncode, 0)
+        output = os.path.join(self.root, "results", "sample_tool.txt")
+        self.assertEqual(run.output("sample.txt.out"), output)
+        with open(output) as f:
+            self.assertEqual(f.read(), "sample-processed")
+        self.assertTrue(os.path.exists(os.path.join("results", "log.txt")))
+        self.assertFalse(os.path.exists(run.scratch_dir))
+
+    def test_checkout_is_not_written(self):
+        run = run_tool(
+            "Tool",
+            [sys.executable, "tool.py", "{input}"],
+            self.root,
+            tool_dir=os.path.join(self.root, "tool"),
+            inputs={"input": os.path.join(self.root, "inputs", "sample.txt")},
+        )
+        self.assertEqual(run.returncode, 0)
+        self.assertEqual(sorted(os.listdir("tool")), ["data", "tool.py"])
+        self.assertEqual(os.listdir(os.path.join("tool", "data")), ["suffix.txt"])
+
+    def test_failed_run_outputs_are_not_collected(self):
+        run = run_tool(
+            "Tool",
+            [sys.executable, "-c", "import sys; tool = open('tool.py').read(); "
+             "sys.argv = ['tool.py', sys.argv[1]]; exec(tool); sys.exit(3)", "{input}"],
+            "results",
+            tool_dir="tool",
+            inputs={"input": os.path.join("inputs", "sample.txt")},
+            outputs={"sample.txt.out": "sample_tool.txt", "log.txt": None},
+        )
+        self.assertEqual(run.returncode, 3)
+        self.assertIsNone(run.output("sample.txt.out"))
+        self.assertFalse(os.path.exists(os.path.join("results", "sample_tool.txt")))
+        self.assertFalse(os.path.exists(os.path.join("results", "log.txt")))
+        self.assertTrue(os.path.exists(os.path.join(run.scratch_dir, "sample.txt.out")))
+
+    def test_input_name_collisions_are_rejected(self):
+        shutil.copy(os.path.join("inputs", "sample.txt"), "tool.py")
+        os.makedirs("other")
+        shutil.copy(os.path.join("inputs", "sample.txt"), os.path.join("other", "sample.txt"))
+        for inputs in (
+            {"input": "tool.py"},
+            {"input": os.path.join("inputs", "sample.txt"),
+             "other": os.path.join("other", "sample.txt")},
+        ):
+            with self.assertRaises(ValueError):
+                run_tool("Tool", [sys.executable, "tool.py", "{input}"], "results",
+                         tool_dir="tool", inputs=inputs)
+        self.assertEqual(os.listdir(os.path.join("results", ".genopath", "scratch")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()